@@ -0,0 +1,64 @@
+#-------------------------------------------------------------------------------
+# Name:        benchmark_ecoregion_pivot.py
+# Purpose:     Time the in-memory Ecoregion pivot from 100 to 10,000 basins and
+#              compare it with the old one-UpdateCursor-scan-per-row pattern.
+#              Runs without ArcGIS.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from OverlayAggregation import pivot_to_wide
+from TableWriter import columns_to_records
+
+
+def synthetic_ecoregion_rows(n_basins, n_classes=60, classes_per_basin=4, seed=0):
+    """Long (GID, L4 name, percentage) rows, a few ecoregions per basin."""
+    rng = np.random.default_rng(seed)
+    gids = np.repeat([f"{index:08d}" for index in range(n_basins)], classes_per_basin)
+    classes = np.array([f"L4_{code}" for code in rng.integers(0, n_classes, len(gids))])
+    percentages = rng.random(len(gids)) * 100
+    return gids, classes, percentages
+
+
+def pivot_in_memory(gids, classes, percentages):
+    """The new path: pivot once, pack the records for one bulk write."""
+    gids, classes, matrix = pivot_to_wide(gids, classes, percentages)
+    return columns_to_records(gids, {name: matrix[:, index] for index, name in enumerate(classes)})
+
+
+def pivot_by_scanning(gids, classes, percentages):
+    """The old path: for every row, scan the table from the top to find its GID."""
+    table = []
+    fields = []
+    for gid, name, percentage in zip(gids, classes, percentages):
+        if not table or table[-1]["GID"] != gid:
+            table.append({"GID": gid})
+        if name not in fields:
+            fields.append(name)
+        for row in table:
+            if row["GID"] == gid:
+                row[name] = percentage
+                break
+    return table
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    print(f"{'basins':>8} {'in-memory s':>12} {'per-basin us':>13} {'scanning s':>11}")
+    for n_basins in [100, 1000, 10000]:
+        rows = synthetic_ecoregion_rows(n_basins)
+        in_memory = time_call(pivot_in_memory, *rows)
+        # The scanning pattern is quadratic; past a few thousand basins it is not worth waiting for
+        scanning = time_call(pivot_by_scanning, *rows) if n_basins <= 1000 else float("nan")
+        print(f"{n_basins:>8} {in_memory:>12.4f} {in_memory / n_basins * 1e6:>13.2f} {scanning:>11.4f}")
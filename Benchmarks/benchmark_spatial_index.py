@@ -0,0 +1,137 @@
+#-------------------------------------------------------------------------------
+# Name:        benchmark_spatial_index.py
+# Purpose:     Time the STR-tree bulk query against a brute-force envelope check
+#              on synthetic basin and source-feature envelopes, and check that
+#              both return the same candidate pairs. A large-layer case measures
+#              what pruning costs against what it removes from the overlay (and,
+#              where ArcGIS is installed, times the Intersect with and without it).
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from SpatialIndex import brute_force_pairs, build_str_tree, pruned_overlay_inputs, query_pairs, selection_clause
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+
+def random_boxes(rng, n, extent, max_size):
+    """n random envelopes inside a square extent."""
+    corners = rng.random((n, 2)) * extent
+    sizes = rng.random((n, 2)) * max_size
+    return np.column_stack([corners, corners + sizes])
+
+
+def survey_order(boxes, band):
+    """
+    Boxes reordered the way a statewide layer is usually stored, survey area
+    after survey area (bands of rows, west to east within a band), so that
+    OIDs are spatially coherent as in the real soil and wetland layers.
+    """
+    order = np.lexsort([boxes[:, 0], boxes[:, 1] // band])
+    return boxes[order]
+
+
+def write_boxes(boxes, feature_class, with_gid=False):
+    """Writes envelopes as polygons to a new feature class (ArcGIS only)."""
+    workspace, name = os.path.split(feature_class)
+    arcpy.management.CreateFeatureclass(workspace, name, "POLYGON")
+    fields = ["SHAPE@"]
+    if with_gid:
+        arcpy.management.AddField(feature_class, "GID", "LONG")
+        fields.append("GID")
+    with arcpy.da.InsertCursor(feature_class, fields) as cursor:
+        for index, (xmin, ymin, xmax, ymax) in enumerate(boxes):
+            ring = arcpy.Array([arcpy.Point(xmin, ymin), arcpy.Point(xmin, ymax), arcpy.Point(xmax, ymax),
+                                arcpy.Point(xmax, ymin), arcpy.Point(xmin, ymin)])
+            cursor.insertRow([arcpy.Polygon(ring)] + ([index] if with_gid else []))
+
+
+def overlay_times(features, basins, folder):
+    """Seconds for an Intersect of every feature, and for pruning then intersecting (ArcGIS only)."""
+    arcpy.env.overwriteOutput = True
+    gdb = arcpy.management.CreateFileGDB(folder, "pruning.gdb")[0]
+    source_fc, basins_fc = os.path.join(gdb, "source"), os.path.join(gdb, "basins")
+    write_boxes(features, source_fc)
+    write_boxes(basins, basins_fc, with_gid=True)
+
+    start = time.perf_counter()
+    arcpy.analysis.Intersect([source_fc, basins_fc], os.path.join(gdb, "full"), "ALL", "", "INPUT")
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    source_layer, basin_layer, n_pairs = pruned_overlay_inputs(source_fc, basins_fc, os.path.join(folder, "index"))
+    if n_pairs:
+        arcpy.analysis.Intersect([source_layer, basin_layer], os.path.join(gdb, "pruned"), "ALL", "", "INPUT")
+    return full, time.perf_counter() - start
+
+
+def large_layer_case(rng, n_features, n_basins, basin_share, extent=1000000):
+    """
+    Prunes a statewide-size layer against basins that cover basin_share of its
+    extent (a study area inside a state). Prints the features kept, the time
+    spent building the index, querying and writing the single selection, the
+    terms in that selection against the 1000-OID chunks it replaces, and, with
+    ArcGIS, the Intersect time without and with pruning.
+    """
+    features = survey_order(random_boxes(rng, n_features, extent, extent / math.sqrt(n_features) * 2),
+                            extent / 50)
+    basins = random_boxes(rng, n_basins, extent * math.sqrt(basin_share), extent / 100)
+    source_oids = np.arange(1, n_features + 1)
+
+    start = time.perf_counter()
+    tree = build_str_tree(features)
+    basin_index, feature_index = query_pairs(tree, basins)
+    kept = source_oids[np.unique(feature_index)]
+    clause, invert = selection_clause("OBJECTID", kept, source_oids)
+    prune_time = time.perf_counter() - start
+
+    n_terms = clause.count(" OR ") + 1
+    print(f"\nLarge layer: {n_features} features, {n_basins} basins over {basin_share:.0%} of the extent")
+    print(f"  kept {len(kept)} features ({len(kept) / n_features:.1%}), {len(basin_index)} candidate pairs")
+    print(f"  prune {prune_time:.3f} s; one selection of {n_terms} terms ({len(clause)} characters"
+          f"{', inverted' if invert else ''}) in place of {math.ceil(len(kept) / 1000)} chunked selections")
+
+    if arcpy is not None:
+        folder = tempfile.mkdtemp(prefix="pruning_")
+        full, pruned = overlay_times(features, basins, folder)
+        print(f"  Intersect {full:.1f} s unpruned, {pruned:.1f} s pruned including the selection")
+    else:
+        print("  ArcGIS not available; Intersect timings skipped")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'features':>9} {'basins':>7} {'pairs':>8} {'build s':>8} {'query s':>8} {'brute s':>8} {'same':>5}")
+    for n_features, n_basins in [(10000, 100), (100000, 1000), (500000, 10000)]:
+        features = random_boxes(rng, n_features, 100000, 500)
+        basins = random_boxes(rng, n_basins, 100000, 5000)
+
+        start = time.perf_counter()
+        tree = build_str_tree(features)
+        built = time.perf_counter()
+        pairs = query_pairs(tree, basins)
+        queried = time.perf_counter()
+
+        # Brute force is quadratic; only run it where it finishes in reasonable time
+        if n_features * n_basins <= 1e8:
+            brute = brute_force_pairs(basins, features)
+            brute_time = time.perf_counter() - queried
+            same = set(zip(*pairs)) == set(zip(*brute))
+        else:
+            brute_time, same = float("nan"), "-"
+
+        print(f"{n_features:>9} {n_basins:>7} {len(pairs[0]):>8} {built - start:>8.3f} "
+              f"{queried - built:>8.3f} {brute_time:>8.3f} {str(same):>5}")
+
+    large_layer_case(rng, 2000000, 5000, 0.05)
@@ -0,0 +1,406 @@
+#-------------------------------------------------------------------------------
+# Name:        benchmark_suite.py
+# Purpose:     Times every stage of the NLCD, PRISM, Atlas14, Ecoregion, Soil and
+#              Wetland computations on synthetic data at 100 / 1,000 / 10,000
+#              basins, with wall time, peak RSS and bytes written per case. The
+#              prism_table case times the PRISM table assembly and write for 40
+#              rasters, the columnar path against the legacy dict-of-dicts loop.
+#              Results are compared with a JSON baseline and regressions past a
+#              threshold are flagged. Runs without ArcGIS.
+#
+#              python benchmark_suite.py                      run and compare with the baseline
+#              python benchmark_suite.py --save-baseline      run and store the baseline
+#              python benchmark_suite.py --scales 100,1000 --tools nlcd,soil
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from NLCDHistogram import stream_histogram
+from OverlayAggregation import area_percentages, group_fragment_areas, pivot_to_wide
+from PointSampling import point_taps, sample_taps
+from RasterBlocks import peak_rss_mb
+from SoilAccumulators import SOIL_TYPE_FIELDS, accumulate_soil_chunk, soil_accumulators, soil_results, soil_type_code
+from SpatialIndex import build_str_tree
+from StackedZonal import stacked_zonal_sums
+from TableWriter import align_columns, columns_to_records, write_table
+from ZonalStatistics import nlcd_category_percentages, zonal_means
+
+import synthetic_data
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+SCALES = [100, 1000, 10000]
+TOOLS = ["nlcd", "prism", "atlas14", "ecoregion", "soil", "wetland", "prism_table"]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "benchmark_suite.json")
+# A stage or case counts as regressed when it is this much slower / larger than the baseline
+DEFAULT_THRESHOLD = 0.25
+# Differences below these floors are timer and allocator noise
+MIN_SECONDS = 0.05
+MIN_MB = 16
+# Memory ceiling handed to the block-streamed raster stages
+MAX_MEMORY_MB = 128
+PRISM_RASTERS = 3
+# Rasters of the PRISM table-write case, as in a full PRISM run
+PRISM_TABLE_RASTERS = 40
+SOIL_CHUNK_SIZE = 100000
+
+
+class StageTimer:
+    """Collects the wall time of the named stages of one case."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+        return result
+
+
+def folder_bytes(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def save_records(output_folder, name, gids, columns):
+    """Stands in for write_table: the records NumPyArrayToTable would get, saved as .npy."""
+    path = os.path.join(output_folder, f"{name}.npy")
+    np.save(path, columns_to_records(gids, columns))
+    return path
+
+
+def nlcd_histogram(raster_path, zones, grid, n_zones):
+    """NLCDHistogram.stream_histogram over the .npy raster, whose NoData is 0."""
+    zone_window = lambda row0, col0, nrows, ncols: zones[:, row0:row0 + nrows, col0:col0 + ncols]
+    return stream_histogram(synthetic_data.memmap_reader(raster_path), zone_window, zones.shape[0],
+                            dict(grid, nodata=0), n_zones, MAX_MEMORY_MB)
+
+
+def prism_sums(raster_paths, zones, grid, n_zones):
+    """StackedZonal.stacked_zonal_sums over the .npy rasters, whose NoData is NaN."""
+    readers = [synthetic_data.memmap_reader(path) for path in raster_paths]
+    return stacked_zonal_sums(raster_paths, [None] * len(raster_paths), zones, grid, n_zones, MAX_MEMORY_MB,
+                              readers=readers)
+
+
+def overlay_fragments(gids, basin_boxes, source_boxes, source_values):
+    basins, sources, areas = synthetic_data.overlay_boxes(basin_boxes, source_boxes)
+    return gids[basins], source_values[sources], areas, sources
+
+
+def bench_nlcd(timer, data, output_folder):
+    gids, boxes, grid = data["gids"], data["boxes"], data["grid"]
+    zones = timer.run("zone_labels", synthetic_data.rasterize_boxes, boxes, grid,
+                      os.path.join(output_folder, "zones.npy"))
+    counts = timer.run("histogram", nlcd_histogram, data["categorical"], zones, grid, len(gids))
+    columns = timer.run("percentages", nlcd_category_percentages, counts)
+    timer.run("write", save_records, output_folder, "NLCD", gids, columns)
+
+
+def bench_prism(timer, data, output_folder):
+    gids, boxes, grid = data["gids"], data["boxes"], data["grid"]
+    zones = timer.run("zone_labels", synthetic_data.rasterize_boxes, boxes, grid,
+                      os.path.join(output_folder, "zones.npy"))
+    sums, counts = timer.run("zonal_sums", prism_sums, data["continuous"], zones, grid, len(gids))
+    means = timer.run("means", zonal_means, sums, counts)
+    columns = {f"PRISM_{index}": means[index] for index in range(len(means))}
+    timer.run("write", save_records, output_folder, "PRISM", gids, columns)
+
+
+def bench_atlas14(timer, data, output_folder):
+    gids, boxes, grid = data["gids"], data["boxes"], data["grid"]
+    xs = (boxes[:, 0] + boxes[:, 2]) / 2
+    ys = (boxes[:, 1] + boxes[:, 3]) / 2
+    taps = timer.run("taps", point_taps, xs, ys, grid, "bilinear")
+    columns = {}
+    for index, path in enumerate(data["continuous"][:2]):
+        columns[f"PrecFr_{index}"] = timer.run("sample", sample_taps, synthetic_data.memmap_reader(path), grid,
+                                               *taps) / 1000
+    timer.run("write", save_records, output_folder, "NOAA_Atlas14", gids, columns)
+
+
+def bench_ecoregion(timer, data, output_folder):
+    source_boxes, names = data["ecoregions"]
+    timer.run("index", build_str_tree, source_boxes)
+    gids, l4names, areas, _ = timer.run("overlay", overlay_fragments, data["gids"], data["boxes"], source_boxes, names)
+    gids, l4names, areas = timer.run("aggregate", group_fragment_areas, gids, l4names, areas)
+    percentages = timer.run("percentages", area_percentages, gids, areas)
+    gids, l4names, matrix = timer.run("pivot", pivot_to_wide, gids, l4names, percentages)
+    columns = {name: matrix[:, index] for index, name in enumerate(l4names)}
+    timer.run("write", save_records, output_folder, "Ecoregion", gids, columns)
+
+
+def accumulate_fragments(gids, gid_values, soil_types, ksat, areas):
+    index = {gid: position for position, gid in enumerate(gids)}
+    type_lookup = {soil_type: soil_type_code(soil_type) for soil_type in np.unique(soil_types)}
+    accumulators = soil_accumulators(len(gids))
+    for start in range(0, len(areas), SOIL_CHUNK_SIZE):
+        stop = start + SOIL_CHUNK_SIZE
+        accumulate_soil_chunk(accumulators, [index[gid] for gid in gid_values[start:stop]],
+                              [type_lookup[soil_type] for soil_type in soil_types[start:stop]],
+                              ksat[start:stop], areas[start:stop])
+    return accumulators
+
+
+def bench_soil(timer, data, output_folder):
+    source_boxes, soil_types, ksat = data["soils"]
+    timer.run("index", build_str_tree, source_boxes)
+    gid_values, types, areas, sources = timer.run("overlay", overlay_fragments, data["gids"], data["boxes"],
+                                                  source_boxes, soil_types)
+    accumulators = timer.run("accumulate", accumulate_fragments, data["gids"].tolist(), gid_values, types,
+                             ksat[sources], areas)
+    gids, columns = timer.run("results", soil_results, data["gids"].tolist(), accumulators)
+    timer.run("write", save_records, output_folder, "SoilMapUnits", gids, columns)
+
+
+def wetland_percentages(gids, basin_boxes, pair_gids, types, areas):
+    totals = (basin_boxes[:, 2] - basin_boxes[:, 0]) * (basin_boxes[:, 3] - basin_boxes[:, 1])
+    position = {gid: index for index, gid in enumerate(gids)}
+    wetland = np.zeros(len(gids))
+    lakepond = np.zeros(len(gids))
+    rows = np.array([position[gid] for gid in pair_gids], dtype=np.int64)
+    np.add.at(wetland, rows[types == "Wetland"], areas[types == "Wetland"])
+    np.add.at(lakepond, rows[types == "LakePond"], areas[types == "LakePond"])
+    return {"Wetland_Pctg": wetland / totals * 100, "LakePond_Pctg": lakepond / totals * 100}
+
+
+def bench_wetland(timer, data, output_folder):
+    source_boxes, types = data["wetlands"]
+    timer.run("index", build_str_tree, source_boxes)
+    gid_values, type_values, areas, _ = timer.run("overlay", overlay_fragments, data["gids"], data["boxes"],
+                                                  source_boxes, types)
+    pair_gids, pair_types, pair_areas = timer.run("aggregate", group_fragment_areas, gid_values, type_values, areas)
+    columns = timer.run("percentages", wetland_percentages, data["gids"].tolist(), data["boxes"], pair_gids,
+                        pair_types, pair_areas)
+    timer.run("write", save_records, output_folder, "NationalWetland", data["gids"], columns)
+
+
+def legacy_prism_rows(tables):
+    """
+    The PRISM.py table assembly before the columnar rewrite, less the arcpy
+    cursors: a dict of dicts per GID, one row per basin filled value by value
+    with field_names.index, and the console output of every step (sent to a
+    buffer here). Returns the rows the UpdateCursor would have written.
+    """
+    console = io.StringIO()
+    values_dict = {}
+    for table_name, (gids, means) in tables.items():
+        for gid, mean_value in zip(gids, means):
+            if gid not in values_dict:
+                values_dict[gid] = {}
+            values_dict[gid][table_name] = mean_value
+    print(values_dict, file=console)
+
+    field_names = ["GID"] + list(tables)
+    rows = []
+    for gid in values_dict:
+        row = [gid] + [None] * len(tables)
+        print("Start looping writing PRISM", "basin_id is", gid, file=console)
+        for table_name, mean_value in values_dict[gid].items():
+            row[field_names.index(table_name)] = mean_value
+            print(table_name, mean_value, file=console)
+        rows.append(row)
+    return rows
+
+
+def columnar_prism_table(output_folder, tables):
+    gids, columns = align_columns({name: table[0] for name, table in tables.items()},
+                                  {name: table[1] for name, table in tables.items()})
+    return save_records(output_folder, "PRISM", gids, columns), gids, columns
+
+
+def bench_prism_table(timer, data, output_folder):
+    tables = data["prism_tables"]
+    timer.run("legacy_assemble", legacy_prism_rows, tables)
+    path, gids, columns = timer.run("columnar_write", columnar_prism_table, output_folder, tables)
+    if arcpy is not None:
+        gdb_path = os.path.join(output_folder, "PRISM.gdb")
+        timer.run("gdb_write", write_table, gdb_path, "PRISM", gids, columns)
+
+
+BENCHMARKS = {"nlcd": bench_nlcd, "prism": bench_prism, "atlas14": bench_atlas14, "ecoregion": bench_ecoregion,
+              "soil": bench_soil, "wetland": bench_wetland, "prism_table": bench_prism_table}
+
+
+def generate_inputs(tool, n_basins, data_folder):
+    """Builds the synthetic inputs one tool needs. Raster inputs are .npy files in data_folder."""
+    grid = synthetic_data.synthetic_grid(n_basins)
+    gids, boxes = synthetic_data.synthetic_basins(n_basins, grid)
+    data = {"grid": grid, "gids": gids, "boxes": boxes}
+    if tool == "nlcd":
+        data["categorical"] = synthetic_data.categorical_raster(grid, os.path.join(data_folder, "nlcd.npy"))
+    if tool in ("prism", "atlas14"):
+        data["continuous"] = [synthetic_data.continuous_raster(grid, os.path.join(data_folder, f"prism_{index}.npy"),
+                                                               seed=index)
+                              for index in range(PRISM_RASTERS)]
+    if tool == "ecoregion":
+        data["ecoregions"] = synthetic_data.synthetic_polygons(grid, n_basins // 2, synthetic_data.ecoregion_names())
+    if tool == "soil":
+        soil_boxes, soil_types = synthetic_data.synthetic_polygons(grid, n_basins * 20,
+                                                                   synthetic_data.HYDROLOGIC_GROUPS)
+        data["soils"] = (soil_boxes, soil_types, synthetic_data.synthetic_ksat(len(soil_boxes)))
+    if tool == "prism_table":
+        data["prism_tables"] = synthetic_data.zonal_mean_tables(gids, PRISM_TABLE_RASTERS)
+    if tool == "wetland":
+        data["wetlands"] = synthetic_data.synthetic_polygons(grid, n_basins * 10, synthetic_data.WETLAND_TYPES,
+                                                             fill=0.2)
+    return data
+
+
+def prepare_case(tool, n_basins):
+    """
+    Generates the inputs of one case in a work folder. Called in a process of
+    its own, so the memory input generation takes never shows in the peak RSS
+    of the case. Returns (work folder, inputs).
+    """
+    work_folder = tempfile.mkdtemp(prefix=f"bench_{tool}_{n_basins}_")
+    data_folder = os.path.join(work_folder, "inputs")
+    os.makedirs(data_folder)
+    os.makedirs(os.path.join(work_folder, "outputs"))
+    try:
+        return work_folder, generate_inputs(tool, n_basins, data_folder)
+    except Exception:
+        shutil.rmtree(work_folder, ignore_errors=True)
+        raise
+
+
+def run_case(tool, n_basins, work_folder, data):
+    """
+    Runs one tool at one scale on the inputs of prepare_case and removes the
+    work folder. Called in a fresh process, so peak RSS belongs to this case
+    alone and, since ru_maxrss only grows, the peak before the case is just
+    the interpreter and the inputs it was handed. Bytes written only count the
+    tool's outputs and caches.
+    """
+    output_folder = os.path.join(work_folder, "outputs")
+    try:
+        rss_before = peak_rss_mb()
+        timer = StageTimer()
+        start = time.perf_counter()
+        BENCHMARKS[tool](timer, data, output_folder)
+        wall = time.perf_counter() - start
+        peak = peak_rss_mb()
+        result = {"tool": tool, "basins": n_basins, "wall_seconds": wall, "stages": timer.stages,
+                  "peak_rss_mb": peak, "bytes_written": folder_bytes(output_folder)}
+        if tool in ("nlcd", "prism") and peak is not None and rss_before is not None:
+            # The block-streamed raster passes must stay within their memory budget on top of their inputs
+            zone_mb = os.path.getsize(os.path.join(output_folder, "zones.npy")) / 1024 ** 2
+            result["memory_budget_mb"] = MAX_MEMORY_MB
+            result["within_memory_budget"] = bool(peak - rss_before <= MAX_MEMORY_MB + zone_mb + MIN_MB)
+        return result
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+
+def run_suite(tools, scales):
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for n_basins in scales:
+        for tool in tools:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                work_folder, data = executor.submit(prepare_case, tool, n_basins).result()
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, tool, n_basins, work_folder, data).result()
+            results.append(result)
+            stages = "  ".join(f"{name} {seconds:.3f}" for name, seconds in result["stages"].items())
+            print(f"{tool:>10} {n_basins:>6}  {result['wall_seconds']:8.3f} s  {result['peak_rss_mb'] or 0:8.1f} MB  "
+                  f"{result['bytes_written'] / 1024 ** 2:8.2f} MB written  [{stages}]")
+            if result.get("within_memory_budget") is False:
+                print(f"{tool:>10} {n_basins:>6}  exceeded the {MAX_MEMORY_MB} MB streaming budget")
+    return results
+
+
+def case_key(result):
+    return f"{result['tool']}/{result['basins']}"
+
+
+def compare_with_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Flags every case or stage whose wall time, peak RSS or bytes written grew
+    past threshold (relative) and past the noise floors. Returns a list of messages.
+    """
+    previous = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+
+    def check(label, now, before, floor):
+        if now is None or before is None:
+            return
+        if now > before * (1 + threshold) and now - before > floor:
+            regressions.append(f"{label}: {before:.3f} -> {now:.3f} (+{(now / max(before, 1e-9) - 1):.0%})")
+
+    for result in results:
+        key = case_key(result)
+        if key not in previous:
+            continue
+        old = previous[key]
+        check(f"{key} wall seconds", result["wall_seconds"], old["wall_seconds"], MIN_SECONDS)
+        check(f"{key} peak RSS MB", result["peak_rss_mb"], old["peak_rss_mb"], MIN_MB)
+        check(f"{key} MB written", result["bytes_written"] / 1024 ** 2, old["bytes_written"] / 1024 ** 2, 1)
+        for stage, seconds in result["stages"].items():
+            check(f"{key} {stage} seconds", seconds, old["stages"].get(stage), MIN_SECONDS)
+        if result.get("within_memory_budget") is False:
+            regressions.append(f"{key}: peak memory over the {MAX_MEMORY_MB} MB streaming budget")
+    return regressions
+
+
+def machine_info():
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic benchmarks of the basin characteristic computations.")
+    parser.add_argument("--tools", default=",".join(TOOLS))
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in SCALES))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--output", help="also write these results to a JSON file")
+    options = parser.parse_args()
+
+    tools = options.tools.split(",")
+    unknown = set(tools) - set(TOOLS)
+    if unknown:
+        parser.error(f"unknown tools {sorted(unknown)}, expected some of {TOOLS}")
+    scales = [int(scale) for scale in options.scales.split(",")]
+
+    report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "machine": machine_info(),
+              "results": run_suite(tools, scales)}
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(report, output_file, indent=1)
+
+    if options.save_baseline:
+        if not os.path.exists(os.path.dirname(options.baseline)):
+            os.makedirs(os.path.dirname(options.baseline))
+        with open(options.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=1)
+        print("Baseline saved to", options.baseline)
+    elif os.path.exists(options.baseline):
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_with_baseline(report["results"], baseline, options.threshold)
+        print(f"Compared with the baseline of {baseline['created']}: {len(regressions)} regressions")
+        for message in regressions:
+            print("  REGRESSION", message)
+        if regressions:
+            sys.exit(1)
+    else:
+        print("No baseline at", options.baseline, "- run with --save-baseline to create one")
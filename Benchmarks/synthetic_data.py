@@ -0,0 +1,238 @@
+#-------------------------------------------------------------------------------
+# Name:        synthetic_data.py
+# Purpose:     Synthetic inputs for the benchmark suite: rectangular basins (some
+#              nested inside others), categorical and continuous rasters on a
+#              common grid, and wetland/soil/ecoregion polygon layers. Polygons
+#              are axis-aligned boxes so their overlay can be computed exactly
+#              in NumPy. Runs without ArcGIS.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from SpatialIndex import build_str_tree, query_pairs
+
+# Grid cells along each side per sqrt(basin); 10,000 basins give a 4000 x 4000 grid
+CELLS_PER_BASIN_SIDE = 40
+CELL_SIZE = 30.0
+# NLCD class values drawn for the categorical raster
+NLCD_VALUES = [11, 12, 21, 22, 23, 24, 31, 41, 42, 43, 52, 71, 81, 82, 90, 95]
+WETLAND_TYPES = ["Wetland", "LakePond", "Riverine"]
+HYDROLOGIC_GROUPS = ["A", "B", "C", "D", "A_D", "B_D", "C_D", ""]
+
+
+def synthetic_grid(n_basins, cell_size=CELL_SIZE, block_size=512):
+    """Grid definition in the shape RasterBlocks.raster_grid returns, sized for n_basins."""
+    side = int(np.sqrt(n_basins) * CELLS_PER_BASIN_SIDE)
+    return {
+        "xmin": 0.0, "ymin": 0.0, "xmax": side * cell_size, "ymax": side * cell_size,
+        "cell_width": cell_size, "cell_height": cell_size, "rows": side, "cols": side,
+        "nodata": None, "block_rows": block_size, "block_cols": block_size, "spatial_reference": "synthetic",
+    }
+
+
+def synthetic_basins(n_basins, grid, nested_fraction=0.3, seed=0):
+    """
+    Rectangular basins over the grid extent. About nested_fraction of them sit
+    inside another basin, like gages upstream of a larger basin's outlet.
+    Returns (gids, boxes) with boxes an (n, 4) array of xmin, ymin, xmax, ymax.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = grid["xmax"] - grid["xmin"], grid["ymax"] - grid["ymin"]
+    n_nested = int(n_basins * nested_fraction)
+    n_outer = n_basins - n_nested
+
+    # Outer basins are a few times larger than a grid share, so neighbours overlap a little
+    share = np.sqrt(width * height / n_outer)
+    sizes = rng.uniform(0.6, 1.4, (n_outer, 2)) * share
+    corners = rng.uniform(0, 1, (n_outer, 2)) * ([width, height] - sizes)
+    outer = np.column_stack([corners, corners + sizes])
+
+    parents = rng.integers(0, n_outer, n_nested)
+    fractions = rng.uniform(0.2, 0.7, (n_nested, 2))
+    parent_sizes = outer[parents, 2:] - outer[parents, :2]
+    child_sizes = parent_sizes * fractions
+    offsets = rng.uniform(0, 1, (n_nested, 2)) * (parent_sizes - child_sizes)
+    nested = np.column_stack([outer[parents, :2] + offsets, outer[parents, :2] + offsets + child_sizes])
+
+    boxes = np.vstack([outer, nested])
+    gids = np.array([f"{index:08d}" for index in range(n_basins)])
+    return gids, boxes
+
+
+def box_zone_layers(boxes):
+    """
+    Assigns every box to the first layer in which it overlaps no other box,
+    largest first, like ZoneLabels.assign_zone_layers. Returns the layer index per box.
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    tree = build_str_tree(boxes)
+    queries, features = query_pairs(tree, boxes)
+    neighbours = [[] for _ in range(len(boxes))]
+    for query, feature in zip(queries, features):
+        if query != feature:
+            neighbours[query].append(feature)
+
+    layers = np.full(len(boxes), -1, dtype=np.int64)
+    for index in np.argsort(-areas, kind="stable"):
+        taken = set(layers[neighbour] for neighbour in neighbours[index] if layers[neighbour] >= 0)
+        layer = 0
+        while layer in taken:
+            layer += 1
+        layers[index] = layer
+    return layers
+
+
+def box_cell_ranges(boxes, grid):
+    """Row/col ranges of the cells whose centres fall inside each box."""
+    col0 = np.ceil((boxes[:, 0] - grid["xmin"]) / grid["cell_width"] - 0.5).astype(np.int64)
+    col1 = np.ceil((boxes[:, 2] - grid["xmin"]) / grid["cell_width"] - 0.5).astype(np.int64)
+    row0 = np.ceil((grid["ymax"] - boxes[:, 3]) / grid["cell_height"] - 0.5).astype(np.int64)
+    row1 = np.ceil((grid["ymax"] - boxes[:, 1]) / grid["cell_height"] - 0.5).astype(np.int64)
+    return (np.clip(row0, 0, grid["rows"]), np.clip(row1, 0, grid["rows"]),
+            np.clip(col0, 0, grid["cols"]), np.clip(col1, 0, grid["cols"]))
+
+
+def rasterize_boxes(boxes, grid, out_path=None):
+    """
+    Zone labels of the boxes on the grid, (layers, rows, cols) int32 with label
+    k for box k-1 and 0 outside, as ZoneLabels.rasterize_zone_labels builds
+    them. With out_path the labels go to a memory-mapped .npy file.
+    """
+    layers = box_zone_layers(boxes)
+    shape = (int(layers.max()) + 1, grid["rows"], grid["cols"])
+    if out_path is None:
+        zones = np.zeros(shape, dtype=np.int32)
+    else:
+        zones = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.int32, shape=shape)
+    row0, row1, col0, col1 = box_cell_ranges(boxes, grid)
+    for index in range(len(boxes)):
+        zones[layers[index], row0[index]:row1[index], col0[index]:col1[index]] = index + 1
+    if out_path is not None:
+        zones.flush()
+    return zones
+
+
+def patchy_field(grid, patch_cells, rng):
+    """A smooth random field: coarse noise upsampled by repetition, so values come in patches."""
+    coarse = rng.random((grid["rows"] // patch_cells + 1, grid["cols"] // patch_cells + 1))
+    return np.repeat(np.repeat(coarse, patch_cells, axis=0), patch_cells, axis=1)[:grid["rows"], :grid["cols"]]
+
+
+def categorical_raster(grid, out_path, patch_cells=16, nodata_fraction=0.01, seed=1):
+    """NLCD-like uint8 class raster in a .npy file, with a little NoData (0). Returns the path."""
+    rng = np.random.default_rng(seed)
+    raster = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=(grid["rows"], grid["cols"]))
+    for row0 in range(0, grid["rows"], grid["block_rows"]):
+        band = grid_band(grid, row0)
+        codes = (patchy_field(band, patch_cells, rng) * len(NLCD_VALUES)).astype(np.int64)
+        values = np.array(NLCD_VALUES, dtype=np.uint8)[np.minimum(codes, len(NLCD_VALUES) - 1)]
+        values[rng.random(values.shape) < nodata_fraction] = 0
+        raster[row0:row0 + band["rows"]] = values
+    raster.flush()
+    return out_path
+
+
+def continuous_raster(grid, out_path, scale=1000.0, seed=2):
+    """PRISM-like float32 raster in a .npy file: a gradient plus patchy noise, NaN as NoData. Returns the path."""
+    rng = np.random.default_rng(seed)
+    raster = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(grid["rows"], grid["cols"]))
+    for row0 in range(0, grid["rows"], grid["block_rows"]):
+        band = grid_band(grid, row0)
+        gradient = np.linspace(0, 1, grid["cols"])[np.newaxis, :]
+        values = (gradient + 0.3 * patchy_field(band, 32, rng)) * scale
+        values[rng.random(values.shape) < 0.001] = np.nan
+        raster[row0:row0 + band["rows"]] = values
+    raster.flush()
+    return out_path
+
+
+def grid_band(grid, row0):
+    band = dict(grid)
+    band["rows"] = min(grid["block_rows"], grid["rows"] - row0)
+    return band
+
+
+def zonal_mean_tables(gids, n_rasters, missing=0.02, seed=7):
+    """
+    Per-raster zonal mean tables as ZonalStatisticsAsTable leaves them: each
+    missing about `missing` of the basins (no data cells) and in its own row
+    order. Returns a dict of table name -> (GID list, MEAN array).
+    """
+    rng = np.random.default_rng(seed)
+    tables = {}
+    for index in range(n_rasters):
+        keep = rng.permutation(len(gids))[:int(round(len(gids) * (1 - missing)))]
+        tables[f"PRISM_{index:02d}"] = ([str(gid) for gid in np.asarray(gids)[keep]], rng.random(len(keep)) * 100)
+    return tables
+
+
+def memmap_reader(path):
+    """
+    A read_window(row0, col0, nrows, ncols) over a .npy raster, as
+    RasterBlocks.stream_blocks expects. The file is mapped for each window
+    and unmapped after, so like an arcpy window read only the window stays in
+    memory and the pages already read do not add to the RSS.
+    """
+    def read_window(row0, col0, nrows, ncols):
+        raster = np.load(path, mmap_mode="r")
+        window = np.array(raster[row0:row0 + nrows, col0:col0 + ncols])
+        del raster
+        return window
+    return read_window
+
+
+def synthetic_polygons(grid, n_polygons, classes, seed=3, fill=1.0):
+    """
+    A polygon layer of non-overlapping boxes tiling the grid extent (soil map
+    units, ecoregions), or covering about fill of it (wetlands).
+    Returns (boxes, class values).
+    """
+    rng = np.random.default_rng(seed)
+    per_side = int(np.ceil(np.sqrt(n_polygons)))
+    xs = np.linspace(grid["xmin"], grid["xmax"], per_side + 1)
+    ys = np.linspace(grid["ymin"], grid["ymax"], per_side + 1)
+    x0, y0 = np.meshgrid(xs[:-1], ys[:-1])
+    x1, y1 = np.meshgrid(xs[1:], ys[1:])
+    boxes = np.column_stack([x0.ravel(), y0.ravel(), x1.ravel(), y1.ravel()])
+
+    if fill < 1.0:
+        # Shrink every box around its centre so the layer covers about fill of the extent
+        keep = np.sqrt(fill)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        half = (boxes[:, 2:] - boxes[:, :2]) / 2 * keep
+        boxes = np.column_stack([centers - half, centers + half])
+
+    values = np.array(classes)[rng.integers(0, len(classes), len(boxes))]
+    return boxes, values
+
+
+def synthetic_ksat(n_polygons, seed=4):
+    """Saturated hydraulic conductivity per soil polygon, with a few missing values."""
+    rng = np.random.default_rng(seed)
+    ksat = rng.lognormal(1.0, 1.0, n_polygons)
+    ksat[rng.random(n_polygons) < 0.02] = np.nan
+    return ksat
+
+
+def overlay_boxes(basin_boxes, source_boxes):
+    """
+    Exact intersection of every basin box with every source box it overlaps,
+    the synthetic stand-in for arcpy Intersect. Returns (basin index, source
+    index, fragment area) for the pairs with a positive area.
+    """
+    tree = build_str_tree(source_boxes)
+    basins, sources = query_pairs(tree, basin_boxes)
+    lower = np.maximum(basin_boxes[basins, :2], source_boxes[sources, :2])
+    upper = np.minimum(basin_boxes[basins, 2:], source_boxes[sources, 2:])
+    areas = np.prod(np.clip(upper - lower, 0, None), axis=1)
+    keep = areas > 0
+    return basins[keep], sources[keep], areas[keep]
+
+
+def ecoregion_names(n_names=60):
+    return [f"L4 Ecoregion {index}" for index in range(n_names)]
@@ -0,0 +1,154 @@
+#-------------------------------------------------------------------------------
+# Name:        ColumnarExport.py
+# Purpose:     Optional Parquet / Arrow export of the basin characteristic
+#              tables, written in bulk from the in-memory columns: one file per
+#              table plus a GID-joined wide table of every characteristic, for
+#              the regression modeling to load without ArcGIS. Needs pyarrow;
+#              without it the export is skipped with a message.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import argparse
+import os
+
+import numpy as np
+
+from RunTrace import count, span
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# "parquet" for .parquet files, "arrow" for Arrow IPC (Feather v2) .arrow files
+FILE_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+PARQUET_COMPRESSION = "zstd"
+WIDE_TABLE_NAME = "BasinCharacteristics"
+
+
+def columnar_available():
+    return pa is not None
+
+
+def table_path(folder, table_name, file_format="parquet"):
+    return os.path.join(folder, table_name + FILE_FORMATS[file_format])
+
+
+def columns_to_arrow(gids, columns):
+    """An Arrow table of a columnar result: GID as text, every other column as float64."""
+    arrays = [pa.array([str(gid) for gid in gids], type=pa.string())]
+    arrays += [pa.array(np.asarray(values, dtype=np.float64)) for values in columns.values()]
+    return pa.Table.from_arrays(arrays, names=["GID"] + list(columns))
+
+
+def arrow_to_columns(table):
+    """(gids, columns) back from an Arrow table written by columns_to_arrow."""
+    gids = table.column("GID").to_pylist()
+    columns = {name: table.column(name).to_numpy() for name in table.column_names if name != "GID"}
+    return gids, columns
+
+
+def write_columnar(folder, table_name, gids, columns, file_format="parquet"):
+    """
+    Writes one result as folder/table_name.parquet (or .arrow) in one call.
+    The file is written under a temporary name and moved into place, so a
+    reader never sees half a table. Returns the path.
+    """
+    if pa is None:
+        raise ImportError("pyarrow is needed for the Parquet/Arrow export")
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    path = table_path(folder, table_name, file_format)
+    temp_path = path + ".partial"
+    with span("write_columnar", table=table_name, rows=len(gids)):
+        table = columns_to_arrow(gids, columns)
+        if file_format == "parquet":
+            pq.write_table(table, temp_path, compression=PARQUET_COMPRESSION)
+        else:
+            feather.write_feather(table, temp_path, compression="uncompressed")
+        os.replace(temp_path, path)
+    count("bytes_written", os.path.getsize(path))
+    return path
+
+
+def read_columnar(path):
+    """(gids, columns) of a table written by write_columnar."""
+    if path.endswith(FILE_FORMATS["arrow"]):
+        return arrow_to_columns(feather.read_table(path))
+    return arrow_to_columns(pq.read_table(path))
+
+
+def wide_columns(tables):
+    """
+    Joins several results on GID into one wide result over the union of GIDs,
+    NaN where a table has no row for a basin. tables maps a table name to
+    (gids, columns). A column name used by more than one table is prefixed
+    with its table name. Returns (gids, columns).
+    """
+    all_gids = sorted(set(str(gid) for gids, _ in tables.values() for gid in gids))
+    index = {gid: position for position, gid in enumerate(all_gids)}
+    name_counts = {}
+    for _, columns in tables.values():
+        for name in columns:
+            name_counts[name] = name_counts.get(name, 0) + 1
+
+    wide = {}
+    for table_name, (gids, columns) in tables.items():
+        positions = np.array([index[str(gid)] for gid in gids], dtype=np.int64)
+        for name, values in columns.items():
+            column = np.full(len(all_gids), np.nan)
+            column[positions] = np.asarray(values, dtype=np.float64)
+            wide[name if name_counts[name] == 1 else f"{table_name}_{name}"] = column
+    return all_gids, wide
+
+
+def export_tables(folder, tables, file_format="parquet", wide_table_name=WIDE_TABLE_NAME):
+    """
+    Writes every result in tables (table name -> (gids, columns)) and the
+    GID-joined wide table. Returns the written paths, or [] when pyarrow is
+    not installed.
+    """
+    if pa is None:
+        print("pyarrow is not installed; Parquet/Arrow export skipped")
+        return []
+    paths = [write_columnar(folder, name, gids, columns, file_format) for name, (gids, columns) in tables.items()]
+    if wide_table_name:
+        paths.append(write_columnar(folder, wide_table_name, *wide_columns(tables), file_format=file_format))
+    return paths
+
+
+def export_table(folder, table_name, gids, columns, file_format="parquet", wide_table_name=WIDE_TABLE_NAME):
+    """
+    Writes one tool's result to folder and rebuilds the wide table from every
+    table file in the folder, so tools run one at a time into the same folder
+    still end up with one joined table. Returns the written paths.
+    """
+    if pa is None:
+        print("pyarrow is not installed; Parquet/Arrow export skipped")
+        return []
+    paths = [write_columnar(folder, table_name, gids, columns, file_format)]
+    if wide_table_name:
+        paths.append(rebuild_wide_table(folder, file_format, wide_table_name))
+    return paths
+
+
+def rebuild_wide_table(folder, file_format="parquet", wide_table_name=WIDE_TABLE_NAME):
+    """Joins every per-table file in folder into the wide table. Returns its path."""
+    extension = FILE_FORMATS[file_format]
+    tables = {}
+    for file_name in sorted(os.listdir(folder)):
+        name, file_extension = os.path.splitext(file_name)
+        if file_extension == extension and name != wide_table_name:
+            tables[name] = read_columnar(os.path.join(folder, file_name))
+    return write_columnar(folder, wide_table_name, *wide_columns(tables), file_format=file_format)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Join the per-table Parquet/Arrow files of a folder on GID.")
+    parser.add_argument("folder")
+    parser.add_argument("--format", choices=sorted(FILE_FORMATS), default="parquet")
+    options = parser.parse_args()
+    print("Wide table written:", rebuild_wide_table(options.folder, options.format))
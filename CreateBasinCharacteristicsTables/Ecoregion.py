@@ -8,12 +8,16 @@
 
 import arcpy
 import os
-import time
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+import numpy as np
 
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from OverlayAggregation import area_percentages, group_fragment_areas, pivot_to_wide
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import count, mark, span, start_trace_from_environment
+from SpatialIndex import pruned_overlay_inputs
+from TableWriter import write_table
 
 # Check Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
@@ -41,10 +45,11 @@ def batch_clip(input_ecoregion, input_clip_polygon, output_directory):
         for row in cursor:
             gage_id = row[0]
             query = f"GID = '{gage_id}'"
-            arcpy.SelectLayerByAttribute_management(clip_polygon_layer, "NEW_SELECTION", query)
-            
-            output_shapefile = os.path.join(output_directory, f"{gage_id}_Ecoregion.shp")
-            arcpy.analysis.Clip(input_ecoregion, clip_polygon_layer, output_shapefile)
+            with span("clip", "basin", gid=gage_id):
+                arcpy.SelectLayerByAttribute_management(clip_polygon_layer, "NEW_SELECTION", query)
+
+                output_shapefile = os.path.join(output_directory, f"{gage_id}_Ecoregion.shp")
+                arcpy.analysis.Clip(input_ecoregion, clip_polygon_layer, output_shapefile)
             print(f"Clipped and saved: {output_shapefile}")
     
     arcpy.SelectLayerByAttribute_management(clip_polygon_layer, "CLEAR_SELECTION")
@@ -71,6 +76,43 @@ def calculate_area_percentage(input_directory):
                 cursor.updateRow(row)
         print(f"Processed {shapefile}")    
 
+def overlay_area_percentages(input_ecoregion, input_clip_polygon, index_cache_folder=None):
+    """
+    Intersects all basins with the ecoregion layer in one overlay and sums the
+    fragment areas by (GID, US_L4NAME) in memory. No per-basin shapefiles are
+    written. With index_cache_folder the overlay only gets the ecoregions and
+    basins whose envelopes meet (STR-tree, cached there).
+    Returns GID, L4 name and area percentage arrays, one entry per pair.
+    """
+    if index_cache_folder:
+        input_ecoregion, input_clip_polygon, n_pairs = pruned_overlay_inputs(input_ecoregion, input_clip_polygon,
+                                                                              index_cache_folder)
+        if n_pairs == 0:
+            return np.zeros(0, dtype=str), np.zeros(0, dtype=str), np.zeros(0)
+
+    intersect_output = r"memory\ecoregion_intersect"
+    with span("intersect"):
+        arcpy.analysis.Intersect([input_clip_polygon, input_ecoregion], intersect_output, "ALL", "", "INPUT")
+    with span("read_fragments"):
+        fragments = arcpy.da.FeatureClassToNumPyArray(intersect_output, ["GID", "US_L4NAME", "SHAPE@AREA"])
+    arcpy.Delete_management(intersect_output)
+    count("features_read", len(fragments))
+    print(f"{len(fragments)} basin/ecoregion fragments")
+
+    gids, l4names, areas = group_fragment_areas(fragments["GID"], fragments["US_L4NAME"], fragments["SHAPE@AREA"])
+    return gids, l4names, area_percentages(gids, areas)
+
+def ecoregion_columns(gids, l4names, percentages):
+    """Pivots long (GID, L4 name, percentage) entries in memory into one column per L4 name."""
+    gids, l4names, matrix = pivot_to_wide(gids, [sanitize_field_name(name) for name in l4names], percentages)
+    return gids, {l4name: matrix[:, index] for index, l4name in enumerate(l4names)}
+
+def write_ecoregion_table(gids, columns, output_folder):
+    """Writes the wide ecoregion percentages as the Ecoregion table in one go."""
+    write_table(os.path.join(output_folder, "EcoregionData.gdb"), "Ecoregion", gids, columns)
+    print(f"Table 'Ecoregion' successfully created and populated in 'EcoregionData.gdb' "
+          f"({len(gids)} basins x {len(columns)} ecoregions).")
+
 def sanitize_field_name(name):
     """Sanitizes the field name to conform to ArcGIS naming conventions."""
     # Replace spaces with underscores and remove any other non-alphanumeric characters
@@ -83,37 +125,27 @@ def sanitize_field_name(name):
 def create_gdb_and_table(input_shapefiles_folder, output_folder):
     """
     Creates a Geodatabase and a table within it to organize area percentage data from shapefiles.
+    Every shapefile is read once into memory, then pivoted and written in one pass.
     """
-    gdb_path = arcpy.CreateFileGDB_management(output_folder, "EcoregionData.gdb")[0]
-    table_path = arcpy.CreateTable_management(gdb_path, "Ecoregion")[0]
-    arcpy.AddField_management(table_path, "GID", "TEXT")
-    
     arcpy.env.workspace = input_shapefiles_folder
     shapefiles = arcpy.ListFeatureClasses("*.shp")
-    fields_added = {}
     
+    gids, l4names, percentages = [], [], []
     for shapefile in shapefiles:
         gid = os.path.basename(shapefile)[:8]
-        with arcpy.da.InsertCursor(table_path, ["GID"]) as cursor:
-            cursor.insertRow([gid])
-        
-        with arcpy.da.SearchCursor(shapefile, ["US_L4NAME", "Percentage"]) as cursor:
-            for row in cursor:
-                us_l4name, percentage = row
-                sanitized_name = sanitize_field_name(us_l4name)
-                if sanitized_name not in fields_added:
-                    arcpy.AddField_management(table_path, sanitized_name, "DOUBLE")
-                    fields_added[sanitized_name] = True
-                
-                with arcpy.da.UpdateCursor(table_path, ["GID", sanitized_name]) as updateCursor:
-                    for updateRow in updateCursor:
-                        if updateRow[0] == gid:
-                            updateRow[1] = percentage
-                            updateCursor.updateRow(updateRow)
-                            break
-    print(f"Table 'Ecoregion' successfully created and populated in 'EcoregionData.gdb'.")
+        rows = arcpy.da.TableToNumPyArray(shapefile, ["US_L4NAME", "Percentage"], skip_nulls=True)
+        gids.extend([gid] * len(rows))
+        l4names.extend(rows["US_L4NAME"].tolist())
+        percentages.append(rows["Percentage"])
+    
+    percentages = np.concatenate(percentages) if percentages else np.zeros(0)
+    gids, columns = ecoregion_columns(gids, l4names, percentages)
+    write_ecoregion_table(gids, columns, output_folder)
 
 if __name__ == "__main__":
+    start_trace_from_environment("Ecoregion")
+    mark("Tool starts")
+
     # Set your input and output paths here
     
     '''
@@ -142,27 +174,48 @@ if __name__ == "__main__":
     if not os.path.exists(gdb_folder):
         os.makedirs(gdb_folder)
     
-    shp_folder = os.path.join(gdb_folder, "Ecoregion_by_Basins")
-    if not os.path.exists(shp_folder):
-        os.makedirs(shp_folder)
-    
-    # Perform batch clipping, area percentage calculation, and table creation
-    batch_clip(input_ecoregion, input_clip_polygon, shp_folder)
-    print('Ecoregion has been batch clipped at')
-    current_time = time.strftime("%m-%d %X",time.localtime())
-    print(current_time)
-    
-    calculate_area_percentage(shp_folder)
-    print('Area and percentage calculations are complete at')
-    current_time = time.strftime("%m-%d %X",time.localtime())
-    print(current_time)
-    
-    create_gdb_and_table(shp_folder, gdb_folder)
-    print('Main function completed at')
-    current_time = time.strftime("%m-%d %X",time.localtime())
-    print(current_time)
-    
-    print("Tool done at:")
-    current_time = time.strftime("%m-%d %X",time.localtime())
-    print(current_time)
+    # One overlay of all basins instead of one clip shapefile per basin
+    use_single_overlay = True
+    # Only overlay the basins that are new or changed since the last run
+    use_incremental = True
+    # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+    columnar_folder = os.path.join(output_folder, "columnar")
+    # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+    results_store = os.path.join(output_folder, STORE_NAME)
+    
+    if use_single_overlay:
+        index_cache_folder = os.path.join(gdb_folder, "index_cache")
+        compute = lambda basins: ecoregion_columns(*overlay_area_percentages(input_ecoregion, basins,
+                                                                             index_cache_folder))
+        if use_incremental:
+            gids, columns = incremental_columns("Ecoregion", input_clip_polygon, [input_ecoregion], compute,
+                                                os.path.join(gdb_folder, "result_cache"),
+                                                results_store=results_store, table_name="Ecoregion")
+        else:
+            gids, columns = compute(input_clip_polygon)
+        mark("Overlay and area percentages are complete")
+        
+        write_ecoregion_table(gids, columns, gdb_folder)
+        if columnar_folder:
+            export_table(columnar_folder, "Ecoregion", gids, columns)
+        if results_store:
+            upsert_columns(results_store, "Ecoregion", gids, columns)
+        mark("Main function completed")
+    
+    else:
+        shp_folder = os.path.join(gdb_folder, "Ecoregion_by_Basins")
+        if not os.path.exists(shp_folder):
+            os.makedirs(shp_folder)
+        
+        # Perform batch clipping, area percentage calculation, and table creation
+        batch_clip(input_ecoregion, input_clip_polygon, shp_folder)
+        mark("Ecoregion has been batch clipped")
+        
+        calculate_area_percentage(shp_folder)
+        mark("Area and percentage calculations are complete")
+        
+        create_gdb_and_table(shp_folder, gdb_folder)
+        mark("Main function completed")
+    
+    mark("Tool done")
 
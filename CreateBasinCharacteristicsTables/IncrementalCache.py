@@ -0,0 +1,214 @@
+#-------------------------------------------------------------------------------
+# Name:        IncrementalCache.py
+# Purpose:     Per-GID result cache so a tool only recomputes the basins whose
+#              geometry changed, or all of them when the source data changed.
+#              Each basin is hashed from its GID, geometry and the attributes
+#              a tool reads, each source from its path, size and mtime; results are kept in a SQLite file and
+#              the output table is rebuilt from cached plus fresh rows.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from ResultsStore import delete_gids
+from RunTrace import mark, span
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+CACHE_NAME = "results.sqlite"
+# Zone values per where clause when selecting the basins to recompute
+SELECT_CHUNK = 500
+
+CREATE_CACHE = """
+CREATE TABLE IF NOT EXISTS results (
+    characteristic TEXT NOT NULL,
+    gid TEXT NOT NULL,
+    basin_hash TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    vals TEXT NOT NULL,
+    PRIMARY KEY (characteristic, gid)
+);
+"""
+
+
+def hash_basin_rows(rows):
+    """
+    Hashes (oid, zone value, WKB, *attributes) rows per zone value, from all of
+    its polygons in OID order. Returns a dict of zone value (as text) -> hex digest.
+    """
+    parts = {}
+    for oid, gid, wkb, *attributes in sorted(rows, key=lambda row: row[0]):
+        part = bytes(wkb or b"")
+        if attributes:
+            part += repr(attributes).encode("utf-8")
+        parts.setdefault(str(gid), []).append(part)
+
+    hashes = {}
+    for gid, gid_parts in parts.items():
+        sha = hashlib.sha1(gid.encode("utf-8"))
+        for part in gid_parts:
+            sha.update(part)
+        hashes[gid] = sha.hexdigest()
+    return hashes
+
+
+def basin_hashes(basin_shapefile, zone_field="GID", attribute_fields=None):
+    """
+    Hashes every basin from its zone value, geometry (WKB) and the values of
+    attribute_fields, the basin attributes a tool reads (such as the drainage
+    area Wetlands divides by). Returns a dict of zone value (as text) -> hex digest.
+    """
+    fields = ["OID@", zone_field, "SHAPE@WKB"] + list(attribute_fields or [])
+    with arcpy.da.SearchCursor(basin_shapefile, fields) as cursor:
+        return hash_basin_rows(cursor)
+
+
+def file_identity(path):
+    """(path, size, mtime) of a file; shapefiles include their sidecars."""
+    base, extension = os.path.splitext(path)
+    paths = [path]
+    if extension.lower() == ".shp":
+        paths = [base + part for part in [".shp", ".shx", ".dbf", ".prj"] if os.path.exists(base + part)]
+    return [(os.path.abspath(part), os.path.getsize(part), os.path.getmtime(part)) for part in paths]
+
+
+def source_identity(sources, settings=None):
+    """
+    Hashes the identity of the source datasets (files, or folders taken file by
+    file) together with any settings that change the result, such as the
+    sampling method. A change to any of them invalidates every cached basin.
+    """
+    identity = []
+    for source in sources:
+        if os.path.isdir(source):
+            for file_name in sorted(os.listdir(source)):
+                if os.path.isfile(os.path.join(source, file_name)):
+                    identity.extend(file_identity(os.path.join(source, file_name)))
+        else:
+            identity.extend(file_identity(source))
+    payload = json.dumps({"sources": identity, "settings": settings}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def open_result_cache(cache_folder):
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    # Several tools may share one cache; wait for each other's writes instead of failing
+    connection = sqlite3.connect(os.path.join(cache_folder, CACHE_NAME), timeout=60)
+    connection.executescript(CREATE_CACHE)
+    return connection
+
+
+def stale_gids(connection, characteristic, hashes, source_id):
+    """Zone values with no cached result, or a result from another geometry or source."""
+    cached = {gid: (basin_hash, cached_source) for gid, basin_hash, cached_source in connection.execute(
+        "SELECT gid, basin_hash, source_id FROM results WHERE characteristic = ?", (characteristic,))}
+    return sorted(gid for gid, basin_hash in hashes.items() if cached.get(gid) != (basin_hash, source_id))
+
+
+def sql_values(values, is_text):
+    """Values for an IN list: text is quoted with any embedded quote doubled, numbers are written as they are."""
+    if is_text:
+        return ",".join("'" + str(value).replace("'", "''") + "'" for value in values)
+    return ",".join(str(value) for value in values)
+
+
+def select_basins(basin_shapefile, gids, out_path, zone_field="GID"):
+    """Copies the basins with the given zone values to out_path, for a tool to run on."""
+    layer = arcpy.management.MakeFeatureLayer(basin_shapefile, "incremental_basins")[0]
+    field = arcpy.AddFieldDelimiters(basin_shapefile, zone_field)
+    is_text = [f.type for f in arcpy.ListFields(basin_shapefile) if f.name == zone_field] == ["String"]
+    arcpy.management.SelectLayerByAttribute(layer, "CLEAR_SELECTION")
+    for start in range(0, len(gids), SELECT_CHUNK):
+        values = sql_values(gids[start:start + SELECT_CHUNK], is_text)
+        arcpy.management.SelectLayerByAttribute(layer, "ADD_TO_SELECTION", f"{field} IN ({values})")
+    arcpy.management.CopyFeatures(layer, out_path)
+    arcpy.management.Delete(layer)
+    return out_path
+
+
+def store_results(connection, characteristic, gids, hashes, source_id, computed_gids, columns):
+    """
+    Stores the fresh row of every recomputed zone value. Zone values the tool
+    returned no row for are stored empty, so they are not recomputed next time.
+    """
+    index = {str(gid): position for position, gid in enumerate(computed_gids)}
+    rows = []
+    for gid in gids:
+        position = index.get(gid)
+        values = {} if position is None else {name: float(column[position]) for name, column in columns.items()}
+        rows.append((characteristic, gid, hashes[gid], source_id, json.dumps(values)))
+    connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def cached_columns(connection, characteristic, gids):
+    """
+    Rebuilds the columnar result of the given zone values from the cache.
+    Zone values stored empty are left out, as the tool would have; a column a
+    basin has no value for is NaN.
+    """
+    gid_set = set(gids)
+    rows = [(gid, json.loads(vals)) for gid, vals in connection.execute(
+        "SELECT gid, vals FROM results WHERE characteristic = ? ORDER BY gid", (characteristic,))
+        if gid in gid_set]
+    rows = [(gid, values) for gid, values in rows if values]
+
+    names = []
+    for _, values in rows:
+        names.extend(name for name in values if name not in names)
+    columns = {name: np.array([values.get(name, np.nan) for _, values in rows], dtype=np.float64) for name in names}
+    return [gid for gid, _ in rows], columns
+
+
+def incremental_columns(characteristic, basin_shapefile, sources, compute_fn, cache_folder, zone_field="GID",
+                        settings=None, hashes=None, results_store=None, table_name=None, attribute_fields=None):
+    """
+    Returns (gids, columns) of a characteristic for every basin, running
+    compute_fn(basin_path) -> (gids, columns) only on the basins whose hash
+    changed since the last run. When the sources or settings changed, or every
+    basin is new, compute_fn runs on the whole basin file. attribute_fields
+    are the basin attributes compute_fn reads, hashed with the geometry. Pass
+    hashes (from basin_hashes) to share one read of the basins between
+    characteristics.
+    Basins removed from the basin file drop out of the cache and, with
+    results_store, out of table_name in that store.
+    """
+    if hashes is None:
+        hashes = basin_hashes(basin_shapefile, zone_field, attribute_fields)
+    source_id = source_identity(sources, settings)
+    connection = open_result_cache(cache_folder)
+    try:
+        stale = stale_gids(connection, characteristic, hashes, source_id)
+        mark(f"{characteristic}: {len(stale)} of {len(hashes)} basins to compute")
+
+        if stale:
+            if len(stale) == len(hashes):
+                basins = basin_shapefile
+            else:
+                basins = select_basins(basin_shapefile, stale, os.path.join(cache_folder, f"{characteristic}_basins.shp"),
+                                       zone_field)
+            with span(f"{characteristic} compute", "stage", basins=len(stale), cached=len(hashes) - len(stale)):
+                computed_gids, columns = compute_fn(basins)
+            store_results(connection, characteristic, stale, hashes, source_id, computed_gids, columns)
+
+        # Basins removed from the basin file drop out of the cache
+        known = [gid for (gid,) in connection.execute(
+            "SELECT gid FROM results WHERE characteristic = ?", (characteristic,))]
+        removed = [gid for gid in known if gid not in hashes]
+        connection.executemany("DELETE FROM results WHERE characteristic = ? AND gid = ?",
+                               [(characteristic, gid) for gid in removed])
+        if removed and results_store:
+            delete_gids(results_store, removed, [table_name])
+            mark(f"{characteristic}: {len(removed)} removed basins deleted from {table_name}")
+        connection.commit()
+        return cached_columns(connection, characteristic, list(hashes))
+    finally:
+        connection.close()
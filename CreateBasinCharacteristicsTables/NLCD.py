@@ -1,6 +1,11 @@
 import arcpy
 import os
-import time
+
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from NLCDHistogram import write_NLCD_table, zonal_histogram_NLCD
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import mark, span, start_trace_from_environment
 
 def batch_clip_raster(input_raster, input_polygon, output_folder, gdb_name):
     try:
@@ -38,15 +43,16 @@ def batch_clip_raster(input_raster, input_polygon, output_folder, gdb_name):
                 polygon_geometry = row[1]
                 feature_name = row[2]
 
-                # Set extent to the current polygon
-                arcpy.env.extent = polygon_geometry.extent
+                with span("extract_by_mask", "basin", gid=feature_name):
+                    # Set extent to the current polygon
+                    arcpy.env.extent = polygon_geometry.extent
 
-                # Perform extract by mask
-                mask = arcpy.sa.ExtractByMask(input_raster, polygon_geometry)
+                    # Perform extract by mask
+                    mask = arcpy.sa.ExtractByMask(input_raster, polygon_geometry)
 
-                # Save the output raster
-                output_raster = os.path.join(tif_folder, f"{feature_name}_{gdb_name}.tif")
-                mask.save(output_raster)
+                    # Save the output raster
+                    output_raster = os.path.join(tif_folder, f"{feature_name}_{gdb_name}.tif")
+                    mask.save(output_raster)
 
                 # Reset extent
                 arcpy.env.extent = None
@@ -159,15 +165,49 @@ def updateNLCDTable(category_folder, gdb_folder, gdb_name):
 
 def main():
     try:
-        print("Tool starts")
-        current_time = time.strftime("%m-%d %X", time.localtime())
-        print(current_time)
+        start_trace_from_environment("NLCD")
+        mark("Tool starts")
 
         # Input parameters
         input_raster = arcpy.GetParameterAsText(0)
         input_polygon = arcpy.GetParameterAsText(1)
         output_folder = arcpy.GetParameterAsText(2)
         gdb_name = "NLCD"
+        # Count pixels per basin from the shared zone-label cache instead of clipping each basin
+        use_zonal_histogram = True
+        # Only count the basins that are new or changed since the last run
+        use_incremental = True
+        # Read the raster from a memory-mapped copy, converted once, instead of decoding the TIFF every run
+        use_raster_cache = True
+        raster_cache_folder = os.path.join(output_folder, "raster_cache") if use_raster_cache else None
+        # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+        columnar_folder = os.path.join(output_folder, "columnar")
+        # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+        results_store = os.path.join(output_folder, STORE_NAME)
+
+        if use_zonal_histogram:
+            gdb_folder = os.path.join(output_folder, gdb_name)
+            if not os.path.exists(gdb_folder):
+                os.makedirs(gdb_folder)
+            zone_cache_folder = os.path.join(output_folder, "zone_cache")
+            if use_incremental:
+                gids, columns = incremental_columns(
+                    "NLCD", input_polygon, [input_raster],
+                    lambda basins: zonal_histogram_NLCD(input_raster, basins, zone_cache_folder,
+                                                        raster_cache_folder=raster_cache_folder),
+                    os.path.join(gdb_folder, "result_cache"), results_store=results_store, table_name=gdb_name)
+            else:
+                gids, columns = zonal_histogram_NLCD(input_raster, input_polygon, zone_cache_folder,
+                                                     raster_cache_folder=raster_cache_folder)
+            write_NLCD_table(gids, columns, gdb_folder, gdb_name)
+            if columnar_folder:
+                export_table(columnar_folder, gdb_name, gids, columns)
+            if results_store:
+                upsert_columns(results_store, gdb_name, gids, columns)
+            arcpy.AddMessage("NLCD summary table created successfully.")
+
+            mark("Tool done")
+            return
 
         # Call functions
         batch_clip_raster(input_raster, input_polygon, output_folder, gdb_name)
@@ -191,9 +231,7 @@ def main():
         else:
             arcpy.AddWarning("TIFF folder not found.")
 
-        print("Tool done at:")
-        current_time = time.strftime("%m-%d %X", time.localtime())
-        print(current_time)
+        mark("Tool done")
 
     except Exception as e:
         print(str(e))
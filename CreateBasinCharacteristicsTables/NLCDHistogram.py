@@ -0,0 +1,86 @@
+#-------------------------------------------------------------------------------
+# Name:        NLCDHistogram.py
+# Purpose:     NLCD category percentages per basin from a zonal class histogram,
+#              shared by NLCD.py and NLCD_V2.py
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import os
+import time
+
+import numpy as np
+
+from RasterBlocks import peak_rss_mb, stream_blocks
+from RasterCache import window_reader
+from RunTrace import count, span
+from ZonalStatistics import NLCD_CATEGORIES, nlcd_category_percentages, zonal_class_histogram
+from ZoneLabels import cached_zone_labels
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+
+def histogram_bytes_per_cell(n_layers):
+    """
+    Bytes held per cell while a block is counted: the NLCD value, every zone
+    layer, and the masks and int64 bincount indexes of zonal_class_histogram.
+    """
+    return 1 + 4 * n_layers + 40
+
+
+def stream_histogram(read_window, zone_window, n_layers, zone_grid, n_zones, max_memory_mb=1024):
+    """
+    Streams the raster block by block through zonal_class_histogram.
+    read_window(row0, col0, nrows, ncols) returns a block of NLCD values and
+    zone_window(row0, col0, nrows, ncols) the matching (n_layers, rows, cols)
+    zone labels.
+    Returns the (n_zones, 256) pixel counts.
+    """
+    counts = np.zeros((n_zones, 256), dtype=np.int64)
+    bytes_per_cell = histogram_bytes_per_cell(n_layers)
+    for (row0, col0, nrows, ncols), block in stream_blocks(read_window, zone_grid, max_memory_mb, bytes_per_cell):
+        zonal_class_histogram(block, zone_window(row0, col0, nrows, ncols), n_zones, zone_grid["nodata"], counts)
+        count("pixels_scanned", block.size)
+    return counts
+
+
+def zonal_histogram_NLCD(input_raster, input_shp, zone_cache_folder, zone_field="GID", max_memory_mb=1024,
+                         raster_cache_folder=None):
+    """
+    Counts NLCD pixel values per GID straight from the raster and maps them to the
+    NLCD categories, without clipping, vectorizing or dissolving anything.
+    The raster is streamed in native blocks so memory stays under max_memory_mb,
+    and the basin zone labels come from the shared zone-label cache. With
+    raster_cache_folder the blocks are views of the memory-mapped raster cache.
+    Returns the GIDs and a dict of category -> percentage array.
+    """
+    gids, zones, zone_grid = cached_zone_labels(input_shp, input_raster, zone_cache_folder, zone_field, max_memory_mb)
+    print(f"{len(gids)} basins in {zones.shape[0]} zone layers", time.ctime())  # Track progress
+
+    read_window = window_reader(input_raster, zone_grid, raster_cache_folder, max_memory_mb)
+    zone_window = lambda row0, col0, nrows, ncols: zones[:, row0:row0 + nrows, col0:col0 + ncols]
+    with span("histogram", basins=len(gids)):
+        counts = stream_histogram(read_window, zone_window, zones.shape[0], zone_grid, len(gids), max_memory_mb)
+
+    print(f"NLCD histogram done, peak memory {peak_rss_mb()} MB", time.ctime())  # Track progress
+    return gids, nlcd_category_percentages(counts)
+
+
+def write_NLCD_table(gids, columns, output_folder, gdb_name="NLCD"):
+    """Writes the NLCD category percentages into <gdb_name>.gdb/<gdb_name>."""
+    gdb_path = os.path.join(output_folder, f"{gdb_name}.gdb")
+    if not arcpy.Exists(gdb_path):
+        arcpy.CreateFileGDB_management(output_folder, f"{gdb_name}.gdb")
+
+    table_path = os.path.join(gdb_path, gdb_name)
+    arcpy.CreateTable_management(gdb_path, gdb_name)
+    arcpy.AddField_management(table_path, "GID", "TEXT")
+    fields_to_add = [category for category, _ in NLCD_CATEGORIES]
+    for field in fields_to_add:
+        arcpy.AddField_management(table_path, field, "FLOAT")
+
+    with arcpy.da.InsertCursor(table_path, ["GID"] + fields_to_add) as cursor:
+        for index, gid in enumerate(gids):
+            cursor.insertRow([gid] + [float(columns[category][index]) for category in fields_to_add])
@@ -2,10 +2,11 @@ import os
 import arcpy
 import time
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
-
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from NLCDHistogram import write_NLCD_table, zonal_histogram_NLCD
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import mark, span, start_trace_from_environment
 
 # Check Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
@@ -41,11 +42,12 @@ def batch_clip_raster(input_raster, input_shp, tif_folder):
             # Define expression for selection
             expression = f"\"GID\" = '{gid}'"
             
-            # Create feature layer for the selected GID
-            arcpy.MakeFeatureLayer_management(basin_shapefile, "temp_layer", expression)
-            
-            # Clip NLCD raster based on GID
-            arcpy.sa.ExtractByMask(nlcd_raster, "temp_layer").save(output_raster)
+            with span("extract_by_mask", "basin", gid=gid):
+                # Create feature layer for the selected GID
+                arcpy.MakeFeatureLayer_management(basin_shapefile, "temp_layer", expression)
+
+                # Clip NLCD raster based on GID
+                arcpy.sa.ExtractByMask(nlcd_raster, "temp_layer").save(output_raster)
             
             print(f"{gid} NLCD is clipped", time.ctime())  # Track progress
             
@@ -70,7 +72,8 @@ def tiff_to_shapefile(input_folder, output_folder):
         
 
         # Convert TIFF to shapefile
-        arcpy.RasterToPolygon_conversion(tiff_file, output_shapefile, "NO_SIMPLIFY", "Value")
+        with span("raster_to_polygon", "basin", raster=tiff_file):
+            arcpy.RasterToPolygon_conversion(tiff_file, output_shapefile, "NO_SIMPLIFY", "Value")
         arcpy.AddMessage(f"Converted {tiff_file} to {output_shapefile}")
         print(f"{tiff_file} is converted", time.ctime())  # Track progress
 
@@ -176,51 +179,88 @@ def create_and_populate_NLCD_table(NLCD_Category_folder, output_folder):
 
 
 
-input_raster = r"D:\NE\Basin_Characteristics\SourceData\NLCD_2021_NE_State_DEM_Extent.tif"
-input_shp = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Input_Basins\1012\basins_final_merge.shp"
-output_folder = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\NLCD_V2"
-
-# Create tif output folder if it does not exist
-NLCD_folder = os.path.join(output_folder, "NLCD")
-if not os.path.exists(NLCD_folder):
-    os.makedirs(NLCD_folder)
-# Create tif output folder if it does not exist
-tif_folder = os.path.join(NLCD_folder, "NLCD_TIF")
-if not os.path.exists(tif_folder):
-    os.makedirs(tif_folder)
-batch_clip_raster(input_raster, input_shp, tif_folder)
-print("Batch Clip raster Done at", time.ctime())  # Track progress
-print('****************************************')
-
-# Create shp output folder if it does not exist
-shp_folder = os.path.join(NLCD_folder, "NLCD_shp")
-if not os.path.exists(shp_folder):
-    os.makedirs(shp_folder)
-tiff_to_shapefile(tif_folder, shp_folder)
-print("Batch Clip raster Done at", time.ctime())  # Track progress
-print('****************************************')
-
-# Create shp output folder if it does not exist
-shp_folder = os.path.join(NLCD_folder, "NLCD_shp")
-if not os.path.exists(shp_folder):
-    os.makedirs(shp_folder)
-tiff_to_shapefile(tif_folder, shp_folder)
-print("Tiff to shapefiles Done at", time.ctime())  # Track progress
-print('****************************************')
-
-# Create category output folder if it does not exist
-cat_folder = os.path.join(NLCD_folder, "NLCD_category")
-if not os.path.exists(cat_folder):
-    os.makedirs(cat_folder)
-dissolve_and_categorize_shapefiles(shp_folder, cat_folder, )
-print("add category field and merged shapefiles Done at", time.ctime())  # Track progress
-print('****************************************')
-
-
-# Create output NLCD table with categories
-
-create_and_populate_NLCD_table(cat_folder, NLCD_folder)
-print("NLCD table populated at", time.ctime())  # Track progress
-print('****************************************')
-
-print("All Done", time.ctime())  # Track progress
+if __name__ == "__main__":
+    start_trace_from_environment("NLCD_V2")
+    mark("Tool starts")
+
+    input_raster = r"D:\NE\Basin_Characteristics\SourceData\NLCD_2021_NE_State_DEM_Extent.tif"
+    input_shp = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Input_Basins\1012\basins_final_merge.shp"
+    output_folder = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\NLCD_V2"
+
+    # Count pixels per basin directly instead of the clip -> polygon -> dissolve round trip
+    use_zonal_histogram = True
+    # Memory ceiling for the block-streamed histogram, in MB
+    max_memory_mb = 1024
+    # Only count the basins that are new or changed since the last run
+    use_incremental = True
+    # Read the raster from a memory-mapped copy, converted once, instead of decoding the TIFF every run
+    use_raster_cache = True
+    raster_cache_folder = os.path.join(output_folder, "raster_cache") if use_raster_cache else None
+    # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+    columnar_folder = os.path.join(output_folder, "columnar")
+    # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+    results_store = os.path.join(output_folder, STORE_NAME)
+
+    # Create tif output folder if it does not exist
+    NLCD_folder = os.path.join(output_folder, "NLCD")
+    if not os.path.exists(NLCD_folder):
+        os.makedirs(NLCD_folder)
+    if use_zonal_histogram:
+        zone_cache_folder = os.path.join(output_folder, "zone_cache")
+        if use_incremental:
+            gids, columns = incremental_columns(
+                "NLCD", input_shp, [input_raster],
+                lambda basins: zonal_histogram_NLCD(input_raster, basins, zone_cache_folder, max_memory_mb=max_memory_mb,
+                                                    raster_cache_folder=raster_cache_folder),
+                os.path.join(NLCD_folder, "result_cache"), results_store=results_store, table_name="NLCD")
+        else:
+            gids, columns = zonal_histogram_NLCD(input_raster, input_shp, zone_cache_folder, max_memory_mb=max_memory_mb,
+                                                 raster_cache_folder=raster_cache_folder)
+        write_NLCD_table(gids, columns, NLCD_folder)
+        if columnar_folder:
+            export_table(columnar_folder, "NLCD", gids, columns)
+        if results_store:
+            upsert_columns(results_store, "NLCD", gids, columns)
+        mark("NLCD table populated")
+        print('****************************************')
+    else:
+        # Create tif output folder if it does not exist
+        tif_folder = os.path.join(NLCD_folder, "NLCD_TIF")
+        if not os.path.exists(tif_folder):
+            os.makedirs(tif_folder)
+        batch_clip_raster(input_raster, input_shp, tif_folder)
+        mark("Batch Clip raster Done")
+        print('****************************************')
+
+        # Create shp output folder if it does not exist
+        shp_folder = os.path.join(NLCD_folder, "NLCD_shp")
+        if not os.path.exists(shp_folder):
+            os.makedirs(shp_folder)
+        tiff_to_shapefile(tif_folder, shp_folder)
+        mark("Batch Clip raster Done")
+        print('****************************************')
+
+        # Create shp output folder if it does not exist
+        shp_folder = os.path.join(NLCD_folder, "NLCD_shp")
+        if not os.path.exists(shp_folder):
+            os.makedirs(shp_folder)
+        tiff_to_shapefile(tif_folder, shp_folder)
+        mark("Tiff to shapefiles Done")
+        print('****************************************')
+
+        # Create category output folder if it does not exist
+        cat_folder = os.path.join(NLCD_folder, "NLCD_category")
+        if not os.path.exists(cat_folder):
+            os.makedirs(cat_folder)
+        dissolve_and_categorize_shapefiles(shp_folder, cat_folder, )
+        mark("add category field and merged shapefiles Done")
+        print('****************************************')
+
+
+        # Create output NLCD table with categories
+
+        create_and_populate_NLCD_table(cat_folder, NLCD_folder)
+        mark("NLCD table populated")
+        print('****************************************')
+
+    mark("All Done")
@@ -12,6 +12,17 @@ import sys
 import os
 from os import path
 
+import numpy as np
+
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from PointSampling import sample_rasters
+from RasterCache import cached_grid
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import count, span, start_trace_from_environment
+from StackedZonal import raster_field_names
+from TableWriter import summarize_columns, write_table
+
 # Check Spatial Analyst extention
 arcpy.CheckOutExtension("Spatial")
 #Define input and output parameters
@@ -39,12 +50,75 @@ def create_basin_centroid(basin_shapefile, output_folder, output_point_shapefile
     print("Centroid points shapefile created successfully at:", output_point_shapefile)
 
 
+# Output field names of the rasters we report, keyed by the 10-character name ExtractMultiValuesToPoints gave them
+ATLAS14_FIELDS = {"Atlas14_10": "PrecFr10yr", "Atlas14_2y": "PrecFr2yr"}
+
+
+def basin_centroids(basin_shapefile, spatial_reference):
+    """
+    Returns the GIDs and centroid coordinates of the basins in the raster's
+    coordinate system, one row per GID: like the point-shapefile workflow, a
+    GID made of several polygons is sampled at its first polygon's centroid.
+    """
+    gids, xs, ys = [], [], []
+    seen = set()
+    with arcpy.da.SearchCursor(basin_shapefile, ["GID", "SHAPE@TRUECENTROID"], spatial_reference=spatial_reference) as cursor:
+        # Rows come in OID order, as the point shapefile was read
+        for gid, (x, y) in cursor:
+            if gid in seen:
+                continue
+            seen.add(gid)
+            gids.append(gid)
+            xs.append(x)
+            ys.append(y)
+    return gids, np.array(xs), np.array(ys)
+
+
+def sample_atlas14(basin_shapefile, rasters, method="nearest", window=0, raster_cache_folder=None):
+    """
+    Samples every Atlas14 raster at every basin centroid in one vectorized lookup
+    per raster. method is "nearest" (what ExtractMultiValuesToPoints "NONE" did)
+    or "bilinear"; window > 0 averages the cells around each centroid. With
+    raster_cache_folder the rasters are read from the memory-mapped raster cache.
+    Returns the sorted GIDs and a dict of field name -> values in inches.
+    """
+    grid = cached_grid(rasters[0], raster_cache_folder)
+    spatial_reference = arcpy.SpatialReference(text=grid["spatial_reference"])
+    with span("centroids"):
+        gids, xs, ys = basin_centroids(basin_shapefile, spatial_reference)
+    count("features_read", len(gids))
+    order = sorted(range(len(gids)), key=lambda index: gids[index])
+
+    # Checked before sampling so colliding rasters fail fast instead of overwriting a column
+    names = raster_field_names(rasters, 10, ATLAS14_FIELDS)
+    columns = {}
+    with span("sample_rasters", rasters=len(rasters), points=len(gids)):
+        samples = sample_rasters(rasters, xs, ys, method, window, raster_cache_folder)
+    for name, values in zip(names, samples):
+        # Atlas14 grids store precipitation in thousandths of an inch
+        columns[name] = values[order] / 1000
+    return [gids[index] for index in order], columns
+
+
 if __name__ == "__main__":
-    
-    
+    start_trace_from_environment("NoaaAtlas14")
+
     input_folder = arcpy.GetParameterAsText(0)
     output_folder = arcpy.GetParameterAsText(1)
     basin_shapefile = arcpy.GetParameterAsText(2)
+    # Sample centroids in memory instead of building a point shapefile and querying it per GID
+    use_single_pass = True
+    sampling_method = "nearest"
+    sampling_window = 0
+    # Only sample the basins that are new or changed since the last run
+    use_incremental = True
+    # Read the rasters from a memory-mapped copy, converted once, instead of decoding the TIFFs every run
+    use_raster_cache = True
+    raster_cache_folder = os.path.join(output_folder, "raster_cache") if use_raster_cache else None
+    # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+    columnar_folder = os.path.join(output_folder, "columnar")
+    # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+    results_store = os.path.join(output_folder, STORE_NAME)
     
     
     print("Parameters read. Functions start!")
@@ -69,66 +143,72 @@ if __name__ == "__main__":
     print(len(rasters))
     print(rasters)
     
-    # Create a temporary folder if it doesn't exist
-    temp_folder = os.path.join(gdb_folder, "temp")
-    if not os.path.exists(temp_folder):
-        os.makedirs(temp_folder)
+    if use_single_pass:
+        if use_incremental:
+            gids, columns = incremental_columns(
+                "Atlas14", basin_shapefile, rasters,
+                lambda basins: sample_atlas14(basins, rasters, sampling_method, sampling_window, raster_cache_folder),
+                os.path.join(gdb_folder, "result_cache"), settings=[sampling_method, sampling_window],
+                results_store=results_store, table_name="NOAA_Atlas14_Precipitation_Frequency")
+        else:
+            gids, columns = sample_atlas14(basin_shapefile, rasters, sampling_method, sampling_window,
+                                           raster_cache_folder)
+        summarize_columns("NOAA_Atlas14_Precipitation_Frequency", gids, columns)
+        final_output_table = write_table(gdb_path, "NOAA_Atlas14_Precipitation_Frequency", gids, columns)
+        if columnar_folder:
+            export_table(columnar_folder, "NOAA_Atlas14_Precipitation_Frequency", gids, columns)
+        if results_store:
+            upsert_columns(results_store, "NOAA_Atlas14_Precipitation_Frequency", gids, columns)
+        print("Final output table created successfully at:", final_output_table)
+
+    else:
+        # Create a temporary folder if it doesn't exist
+        temp_folder = os.path.join(gdb_folder, "temp")
+        if not os.path.exists(temp_folder):
+            os.makedirs(temp_folder)
     
-    # Create a duplicate of the basin shapefile under the temporary folder
-    basin_shapefile_copy = os.path.join(temp_folder, os.path.basename(basin_shapefile))
+        # Create a duplicate of the basin shapefile under the temporary folder
+        basin_shapefile_copy = os.path.join(temp_folder, os.path.basename(basin_shapefile))
     
-    # Define output point shapefile path
-    output_point_shapefile = os.path.join(temp_folder, "basin_centroid_points.shp")
+        # Define output point shapefile path
+        output_point_shapefile = os.path.join(temp_folder, "basin_centroid_points.shp")
     
-    print("Temp folder created")
-    print(temp_folder)
+        print("Temp folder created")
+        print(temp_folder)
 
-    create_basin_centroid(basin_shapefile, gdb_folder, output_point_shapefile)
-    print("output_point_shapefile created at")
-    print(output_point_shapefile)
+        create_basin_centroid(basin_shapefile, gdb_folder, output_point_shapefile)
+        print("output_point_shapefile created at")
+        print(output_point_shapefile)
 
-    # Run Extract Multi Values to Points tool
-    arcpy.sa.ExtractMultiValuesToPoints(output_point_shapefile, rasters, "NONE")
+        # Run Extract Multi Values to Points tool
+        arcpy.sa.ExtractMultiValuesToPoints(output_point_shapefile, rasters, "NONE")
     
-    print(f"Values extracted from rasters to points shapefile: {output_point_shapefile}")
-
-
-    final_output_table = os.path.join(gdb_path, "NOAA_Atlas14_Precipitation_Frequency")
-
-    # Create the final output table and add fields
-    arcpy.CreateTable_management(gdb_path, "NOAA_Atlas14_Precipitation_Frequency")
-    arcpy.AddField_management(final_output_table, "GID", "TEXT")
-    arcpy.AddField_management(final_output_table, "PrecFr10yr", "DOUBLE")
-    arcpy.AddField_management(final_output_table, "PrecFr2yr", "DOUBLE")
-
-    # Retrieve unique GIDs from output_point_shapefile
-    gids = set()
-    with arcpy.da.SearchCursor(output_point_shapefile, "GID") as cursor:
-        for row in cursor:
-            gids.add(row[0])
-    print("gids are")
-    print(gids)
-
-    # Insert records into final_output_table
-with arcpy.da.InsertCursor(final_output_table, ["GID", "PrecFr10yr", "PrecFr2yr"]) as cursor:
-    for gid in sorted(gids):
-        # Get PrecFr10yr and PrecFr2yr values for the current GID
-        prec_fr_10yr = None
-        prec_fr_2yr = None
-        with arcpy.da.SearchCursor(output_point_shapefile, ["GID", "Atlas14_10", "Atlas14_2y"], where_clause=f"GID = '{gid}'") as search_cursor:
-            for row in search_cursor:
-                gid, prec_fr_10yr, prec_fr_2yr = row
-                # Divide the values by 1000
-                prec_fr_10yr /= 1000
-                prec_fr_2yr /= 1000
-                break  # Assuming there's only one record per GID
-        
-        # Insert values into the final_output_table
-        cursor.insertRow((gid, prec_fr_10yr, prec_fr_2yr))
+        print(f"Values extracted from rasters to points shapefile: {output_point_shapefile}")
 
-    print("Final output table created successfully at:", final_output_table)
 
+        final_output_table = os.path.join(gdb_path, "NOAA_Atlas14_Precipitation_Frequency")
 
-    
-# Check in Spatial Analyst extension
-arcpy.CheckInExtension("Spatial")
\ No newline at end of file
+        # Create the final output table and add fields
+        arcpy.CreateTable_management(gdb_path, "NOAA_Atlas14_Precipitation_Frequency")
+        arcpy.AddField_management(final_output_table, "GID", "TEXT")
+        arcpy.AddField_management(final_output_table, "PrecFr10yr", "DOUBLE")
+        arcpy.AddField_management(final_output_table, "PrecFr2yr", "DOUBLE")
+
+        # Read the extracted values for every GID in one pass over output_point_shapefile
+        point_values = {}
+        with arcpy.da.SearchCursor(output_point_shapefile, ["GID", "Atlas14_10", "Atlas14_2y"]) as search_cursor:
+            for gid, prec_fr_10yr, prec_fr_2yr in search_cursor:
+                # Divide the values by 1000, keeping the first record per GID
+                if gid not in point_values:
+                    point_values[gid] = (prec_fr_10yr / 1000, prec_fr_2yr / 1000)
+        print(f"{len(point_values)} gids read")
+
+        # Insert records into final_output_table
+        with arcpy.da.InsertCursor(final_output_table, ["GID", "PrecFr10yr", "PrecFr2yr"]) as cursor:
+            for gid in sorted(point_values):
+                cursor.insertRow((gid,) + point_values[gid])
+
+        print("Final output table created successfully at:", final_output_table)
+
+    # Check in Spatial Analyst extension
+    arcpy.CheckInExtension("Spatial")
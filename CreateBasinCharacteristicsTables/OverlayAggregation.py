@@ -0,0 +1,70 @@
+#-------------------------------------------------------------------------------
+# Name:        OverlayAggregation.py
+# Purpose:     Group-by aggregation of overlay fragments (basin x source polygon
+#              pieces) in NumPy, in place of one clip shapefile per basin
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+
+def group_fragment_areas(gids, classes, areas):
+    """
+    Sums fragment areas by (GID, class). Returns (gids, classes, areas) with one
+    entry per pair, sorted by GID then class.
+    """
+    gids = np.asarray(gids)
+    classes = np.asarray(classes)
+    areas = np.asarray(areas, dtype=np.float64)
+
+    unique_gids, gid_codes = np.unique(gids, return_inverse=True)
+    unique_classes, class_codes = np.unique(classes, return_inverse=True)
+    pair_codes = gid_codes.ravel() * len(unique_classes) + class_codes.ravel()
+
+    unique_pairs, pair_index = np.unique(pair_codes, return_inverse=True)
+    pair_areas = np.bincount(pair_index.ravel(), weights=areas, minlength=len(unique_pairs))
+    return unique_gids[unique_pairs // len(unique_classes)], unique_classes[unique_pairs % len(unique_classes)], pair_areas
+
+
+def area_percentages(gids, areas):
+    """Each entry's area as a percentage of the total area of its GID."""
+    gids = np.asarray(gids)
+    areas = np.asarray(areas, dtype=np.float64)
+    _, gid_codes = np.unique(gids, return_inverse=True)
+    totals = np.bincount(gid_codes.ravel(), weights=areas)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(totals[gid_codes] > 0, areas / totals[gid_codes] * 100, 0.0)
+
+
+def pivot_to_wide(gids, classes, values):
+    """
+    Pivots long (GID, class, value) entries into one row per GID and one column
+    per class, collecting the full class set first. Values of repeated pairs are
+    added. Returns (gids, classes, matrix) with NaN where a GID has no entry.
+    """
+    unique_gids, gid_codes = np.unique(np.asarray(gids), return_inverse=True)
+    unique_classes, class_codes = np.unique(np.asarray(classes), return_inverse=True)
+
+    matrix = np.zeros((len(unique_gids), len(unique_classes)), dtype=np.float64)
+    seen = np.zeros(matrix.shape, dtype=bool)
+    np.add.at(matrix, (gid_codes.ravel(), class_codes.ravel()), np.asarray(values, dtype=np.float64))
+    seen[gid_codes.ravel(), class_codes.ravel()] = True
+    matrix[~seen] = np.nan
+    return unique_gids, unique_classes, matrix
+
+
+def mismatched_totals(actual, expected, tolerance=0.001):
+    """
+    Compares two dicts of GID -> {class: area}, such as overlay totals against
+    the per-basin workflow's. A class missing on either side counts as 0.
+    Returns (gid, class, actual, expected) for every area that differs by more
+    than tolerance relative to the expected one, sorted by GID and class.
+    """
+    mismatches = []
+    for gid in sorted(expected):
+        for key in sorted(expected[gid]):
+            actual_area = actual.get(gid, {}).get(key, 0.0)
+            expected_area = expected[gid][key]
+            if abs(actual_area - expected_area) > tolerance * max(abs(expected_area), 1e-9):
+                mismatches.append((gid, key, actual_area, expected_area))
+    return mismatches
@@ -7,11 +7,20 @@
 #-------------------------------------------------------------------------------
 import arcpy
 from arcpy.sa import *
+import argparse
 import csv
 import sys
 import os
 from os import path
 
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import mark, start_trace_from_environment
+from StackedZonal import stacked_zonal_means
+from TableWriter import align_columns, summarize_columns, write_table
+from ZoneLabels import cached_zone_labels
+
 # Check Spatial Analyst extention
 arcpy.CheckOutExtension("Spatial")
 #Define input and output parameters
@@ -33,8 +42,26 @@ def zonal_statistics_summary(basin_shapefile, zone_field, output_folder, raster)
         arcpy.AddMessage(arcpy.GetMessages())
         return None
 
+def prism_zonal_means(basin_shapefile, rasters, zone_field, gdb_folder, max_memory_mb=1024, workers=1,
+                      raster_cache_folder=None):
+    """Zonal means of every PRISM raster per basin in one stacked pass. Returns the GIDs and columns."""
+    zone_cache_folder = os.path.join(gdb_folder, "zone_cache")
+    gids, zones, zone_grid = cached_zone_labels(basin_shapefile, rasters[0], zone_cache_folder, zone_field,
+                                                max_memory_mb)
+    scratch_root = os.path.join(gdb_folder, "prism_scratch")
+    columns = stacked_zonal_means(rasters, zones, zone_grid, len(gids), max_memory_mb, workers, scratch_root,
+                                  raster_cache_folder)
+    mark(f"Zonal means of {len(rasters)} rasters for {len(gids)} basins done")
+    return gids, columns
+
 if __name__ == "__main__":
+    start_trace_from_environment("PRISM")
 
+    # --workers N fans the stacked zonal pass out to N processes; strip it before reading the tool parameters
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--workers", type=int, default=1)
+    options, remaining = parser.parse_known_args()
+    sys.argv[1:] = remaining
     
     input_folder = arcpy.GetParameterAsText(0)
     output_folder = arcpy.GetParameterAsText(1)
@@ -42,6 +69,18 @@ if __name__ == "__main__":
     zone_field = arcpy.GetParameterAsText(3)
     #statistics_type=arcpy.GetParameterAsText(4)
     statistics_type= "MEAN"
+    # Read every raster in one block-streamed pass instead of one ZonalStatisticsAsTable per raster
+    use_stacked_zonal = True
+    max_memory_mb = 1024
+    # Only compute the basins that are new or changed since the last run
+    use_incremental = True
+    # Read the rasters from a memory-mapped copy, converted once, instead of decoding the TIFFs every run
+    use_raster_cache = True
+    raster_cache_folder = os.path.join(output_folder, "raster_cache") if use_raster_cache else None
+    # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+    columnar_folder = os.path.join(output_folder, "columnar")
+    # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+    results_store = os.path.join(output_folder, STORE_NAME)
     
     '''
     
@@ -73,110 +112,71 @@ if __name__ == "__main__":
     print("Number of rasters are ")
     print(len(rasters))
     
-    temp_folder = os.path.join(gdb_folder, "prism_temp_tables")
-    if not os.path.exists(temp_folder):
-        os.makedirs(temp_folder)
+    if use_stacked_zonal:
+        if use_incremental:
+            gids, columns = incremental_columns(
+                "PRISM", basin_shapefile, rasters,
+                lambda basins: prism_zonal_means(basins, rasters, zone_field, gdb_folder, max_memory_mb,
+                                                 options.workers, raster_cache_folder),
+                os.path.join(gdb_folder, "result_cache"), zone_field, results_store=results_store, table_name="PRISM")
+        else:
+            gids, columns = prism_zonal_means(basin_shapefile, rasters, zone_field, gdb_folder, max_memory_mb,
+                                              options.workers, raster_cache_folder)
+
+        summarize_columns("PRISM", gids, columns)
+        final_output_table = write_table(gdb_path, "PRISM", gids, columns)
+
+        print('final_output_table is... ')
+        print(final_output_table)
+
+    else:
+        temp_folder = os.path.join(gdb_folder, "prism_temp_tables")
+        if not os.path.exists(temp_folder):
+            os.makedirs(temp_folder)
 
 
-    print("Temp folder created")
-    print(temp_folder)
+        print("Temp folder created")
+        print(temp_folder)
 
-    # Initialize the intermediate tables list at the beginning of the script
-    intermediate_tables = []
+        # Initialize the intermediate tables list at the beginning of the script
+        intermediate_tables = []
 
-    # Process each raster and create intermediate tables
+        # Process each raster and create intermediate tables
   
-    for raster in rasters:
-        intermediate_table = zonal_statistics_summary(basin_shapefile, zone_field, temp_folder, raster)
-        print('looping intermedite table')
-        print(intermediate_table)
-        intermediate_tables.append(intermediate_table)
+        for raster in rasters:
+            intermediate_table = zonal_statistics_summary(basin_shapefile, zone_field, temp_folder, raster)
+            print('looping intermedite table')
+            print(intermediate_table)
+            intermediate_tables.append(intermediate_table)
 
     
-    #arcpy.Merge_management([os.path.join(temp_folder, table_name + ".dbf") for table_name in set([os.path.splitext(os.path.basename(raster))[0] for raster in rasters])], final_output_table)
+        #arcpy.Merge_management([os.path.join(temp_folder, table_name + ".dbf") for table_name in set([os.path.splitext(os.path.basename(raster))[0] for raster in rasters])], final_output_table)
     
-    print('intermediate tables are... ')
-    print(intermediate_tables)       
+        print('intermediate tables are... ')
+        print(intermediate_tables)       
     
 
     
-    # Create a dictionary to store the values for each intermediate table
-    values_dict = {}
-    
-    # Loop through intermediate tables to populate the dictionary
-    for intermediate_table in intermediate_tables:
-        table_name = os.path.splitext(os.path.basename(intermediate_table))[0]
-        with arcpy.da.SearchCursor(intermediate_table, ["GID", "MEAN"]) as cursor:
-            for row in cursor:
-                gid, mean_value = row[0], row[1]
-                if gid not in values_dict:
-                    values_dict[gid] = {}
-                values_dict[gid][table_name] = mean_value
-    
-    print('values_dict is... ')
-    print(values_dict)    
-    
-    
-    # Create a list of unique Basins_IDs from values_dict
-    unique_basin_ids = list(values_dict.keys())
-    print("unique_basin_ids are")
-    print(unique_basin_ids)
+        # Read each table's MEAN column straight into an array, one column per raster
+        gids_by_column = {}
+        values_by_column = {}
+        for intermediate_table in intermediate_tables:
+            table_name = os.path.splitext(os.path.basename(intermediate_table))[0]
+            table = arcpy.da.TableToNumPyArray(intermediate_table, ["GID", "MEAN"], skip_nulls=True)
+            gids_by_column[table_name] = table["GID"].tolist()
+            values_by_column[table_name] = table["MEAN"]
 
-    # Create the table
-    final_output_table = os.path.join(gdb_path, "PRISM")
-    
-    arcpy.CreateTable_management(gdb_path, "PRISM")
-    arcpy.AddField_management(final_output_table, "GID", "TEXT")
-    
-    #Populate the new table with the unique_basin_ids values
-    with arcpy.da.InsertCursor(final_output_table,["GID"]) as cursor:
-        for gid in unique_basin_ids:
-            cursor.insertRow([gid])
+        gids, columns = align_columns(gids_by_column, values_by_column)
+        summarize_columns("PRISM", gids, columns)
+        final_output_table = write_table(gdb_path, "PRISM", gids, columns)
 
-    
-    # Add PRISM fields
-    
-    # Define the field names and data types based on values_dict
-    field_names = list(values_dict[unique_basin_ids[0]].keys())
-    field_types = ["DOUBLE"] * len(field_names)
-    print('field_names are')
-    print(field_names)
-    
-    # Add fields to the table
-    for field_name, field_type in zip(field_names, field_types):
-        arcpy.AddField_management(final_output_table,field_name,field_type)
-        print(field_name)
-        print("field added")
-  
-    print('final_output_table is... ')
-    print(final_output_table)
-
-
-    # Create an update cursor to modify the table
-    with arcpy.da.UpdateCursor(final_output_table, ["GID"] + field_names) as cursor:
-        field_names = cursor.fields  # Get the field names
-        print(field_names)
-        for row in cursor:
-            gid = row[0]
-            print("Start looping writing PRISM")
-            print('basin_id is')
-            print(gid)
-
-            if gid in values_dict:
-                for table_name, mean_value in values_dict[gid].items():
-                    # Handle special characters in field names
-                    print('table name is')
-                    print(table_name)
-                    field_name = table_name 
-                    if field_name in field_names:
-                        field_index = field_names.index(field_name)
-                        row[field_index] = mean_value
-                        print('field_name is in the loop is')
-                        print(field_name)
-                    else:
-                        print(f"Field {field_name} not found in the table.")
-                cursor.updateRow(row)
-    
-    
-# Check in Spatial Analyst extension
-arcpy.CheckInExtension("Spatial")
\ No newline at end of file
+        print('final_output_table is... ')
+        print(final_output_table)
+
+    if columnar_folder:
+        export_table(columnar_folder, "PRISM", gids, columns)
+    if results_store:
+        upsert_columns(results_store, "PRISM", gids, columns)
+
+    # Check in Spatial Analyst extension
+    arcpy.CheckInExtension("Spatial")
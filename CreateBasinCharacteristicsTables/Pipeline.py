@@ -0,0 +1,403 @@
+#-------------------------------------------------------------------------------
+# Name:        Pipeline.py
+# Purpose:     Runs the basin characteristic tools as one DAG of stages. The
+#              basins are read once and shared, zone labels and overlay indexes
+#              go to shared caches, independent stages run concurrently in
+#              worker processes under a global worker and memory budget, and
+#              every table is written to one geodatabase in one invocation.
+#              Each tool script can still be run on its own.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from ColumnarExport import columnar_available, export_tables, rebuild_wide_table
+from IncrementalCache import file_identity
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import mark, merge_traces, span, start_trace, stop_trace
+from StackedZonal import init_worker
+from TableWriter import summarize_columns, write_table
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+DEFAULT_CONFIG = {
+    "basins": None,            # basins_final_merge.shp
+    "output_folder": None,
+    "nlcd_raster": None,
+    "prism_folder": None,      # folder of PRISM .tif rasters
+    "atlas14_folder": None,    # folder of NOAA Atlas14 .tif rasters
+    "ecoregion": None,
+    "wetland": None,
+    "soil": None,
+    "zone_field": "GID",
+    "sampling_method": "nearest",
+    "sampling_window": 0,
+    "incremental": True,
+    "workers": 2,
+    "max_memory_mb": 4096,
+    "raster_cache": True,      # read rasters from memory-mapped copies in pipeline/raster_cache
+    "results_store": True,     # also upsert every table into output_folder/BasinCharacteristics.sqlite
+    "columnar_folder": None,   # also write every table, and a GID-joined wide table, as Parquet/Arrow here
+    "columnar_format": "parquet",
+    "trace_folder": None,      # write a timing trace of the run here (Chrome trace-event format)
+}
+
+GDB_NAME = "BasinCharacteristics.gdb"
+
+
+def stage(name, function, deps=(), inputs=(), memory_mb=512):
+    """
+    A pipeline stage. function(config, products, memory_mb) gets the products
+    of its dependencies by stage name and returns its own product; a
+    characteristic stage returns (table_name, gids, columns). The stage only
+    runs when every config key in inputs is set.
+    """
+    return {"name": name, "function": function, "deps": list(deps), "inputs": list(inputs), "memory_mb": memory_mb}
+
+
+def topological_order(stages):
+    """Orders the stages so every stage follows its dependencies. Raises ValueError on a cycle or unknown dependency."""
+    by_name = {item["name"]: item for item in stages}
+    order, state = [], {}
+
+    def visit(name, path):
+        if name not in by_name:
+            raise ValueError(f"Stage {path[-1]} depends on unknown stage {name}")
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError("Stage cycle: " + " -> ".join(path + [name]))
+        state[name] = "visiting"
+        for dep in by_name[name]["deps"]:
+            visit(dep, path + [name])
+        state[name] = "done"
+        order.append(by_name[name])
+
+    for item in stages:
+        visit(item["name"], [])
+    return order
+
+
+def enabled_stages(stages, config, selected=None):
+    """
+    Keeps the stages whose inputs are configured (and, with selected, the
+    selected ones), plus everything they depend on.
+    """
+    by_name = {item["name"]: item for item in stages}
+    wanted = [item["name"] for item in stages
+              if all(config.get(key) for key in item["inputs"]) and (selected is None or item["name"] in selected)]
+    keep = set()
+    while wanted:
+        name = wanted.pop()
+        if name not in keep:
+            keep.add(name)
+            wanted.extend(by_name[name]["deps"])
+    return [item for item in topological_order(stages) if item["name"] in keep]
+
+
+def stage_trace_prefix(config, name):
+    return os.path.join(config["trace_folder"], f"stage_{name}")
+
+
+def run_traced_stage(name, function, config, products, memory_mb):
+    """Runs a stage in a worker, inside a stage span of its own trace when config["trace_folder"] is set."""
+    if not config.get("trace_folder"):
+        return function(config, products, memory_mb)
+    start_trace(stage_trace_prefix(config, name))
+    try:
+        with span(name, "stage", memory_mb=memory_mb):
+            return function(config, products, memory_mb)
+    finally:
+        stop_trace()
+
+
+def run_stages(stages, config, on_result=None, executor_factory=None):
+    """
+    Runs the stages in dependency order. A stage starts once its dependencies
+    are done, a worker is free and its memory_mb fits in what is left of
+    config["max_memory_mb"] (a stage larger than the budget runs alone).
+    A failed stage is reported and its dependents skipped; the others carry on.
+    on_result(stage name, product) is called in this process as stages finish.
+    Returns a dict of stage name -> "done", "failed" or "skipped".
+    """
+    stages = topological_order(stages)
+    budget = config["max_memory_mb"]
+    products, status, running = {}, {}, {}
+    executor_factory = executor_factory or (lambda: ProcessPoolExecutor(
+        max_workers=config["workers"], initializer=init_worker, initargs=(config["scratch_root"],)))
+
+    with executor_factory() as executor:
+        while len(status) < len(stages):
+            for item in stages:
+                if item["name"] in status or item["name"] in running.values():
+                    continue
+                if any(status.get(dep) in ("failed", "skipped") for dep in item["deps"]):
+                    status[item["name"]] = "skipped"
+                    print(f"Stage {item['name']} skipped: a dependency failed")
+                    continue
+                if not all(status.get(dep) == "done" for dep in item["deps"]):
+                    continue
+                in_use = sum(by_stage["memory_mb"] for by_stage in stages if by_stage["name"] in running.values())
+                if len(running) >= config["workers"] or (running and in_use + item["memory_mb"] > budget):
+                    continue
+                memory_mb = min(item["memory_mb"], budget)
+                dep_products = {dep: products[dep] for dep in item["deps"]}
+                running[executor.submit(run_traced_stage, item["name"], item["function"], config, dep_products,
+                                        memory_mb)] = item["name"]
+                mark(f"Stage {item['name']} started ({memory_mb} MB)")
+
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    products[name] = future.result()
+                except Exception as error:
+                    status[name] = "failed"
+                    print(f"Stage {name} failed: {error}")
+                    continue
+                status[name] = "done"
+                mark(f"Stage {name} done")
+                if on_result is not None:
+                    on_result(name, products[name])
+    return status
+
+
+def stage_folder(config, name):
+    folder = os.path.join(config["output_folder"], "pipeline", name)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return folder
+
+
+def raster_cache_folder(config):
+    """Folder of the memory-mapped raster copies, or None when the pipeline reads the rasters directly."""
+    if not config["raster_cache"]:
+        return None
+    return os.path.join(config["output_folder"], "pipeline", "raster_cache")
+
+
+def results_store_path(config):
+    """The SQLite results store every table is upserted into, or None when it is turned off."""
+    if not config["results_store"]:
+        return None
+    return os.path.join(config["output_folder"], STORE_NAME)
+
+
+def list_rasters(folder):
+    return sorted(os.path.join(folder, file) for file in os.listdir(folder) if file.lower().endswith(".tif"))
+
+
+def characteristic_columns(config, products, characteristic, table_name, sources, compute_fn, settings=None,
+                           attribute_fields=None):
+    """
+    Runs compute_fn on the shared basins, through the result cache when the
+    pipeline is incremental. Basins removed since the last run are then also
+    deleted from table_name in the results store. A stage whose compute_fn
+    reads basin attributes names them in attribute_fields; its basins are then
+    hashed with those attributes instead of sharing the geometry-only hashes.
+    """
+    # Tool modules need arcpy at import, so they are imported inside the stage functions
+    from IncrementalCache import basin_hashes, incremental_columns
+
+    basins = products["basins"]
+    if not config["incremental"]:
+        return compute_fn(basins["path"])
+    hashes = basins["hashes"]
+    if attribute_fields:
+        hashes = basin_hashes(basins["path"], config["zone_field"], attribute_fields)
+    return incremental_columns(characteristic, basins["path"], sources, compute_fn,
+                               os.path.join(config["output_folder"], "pipeline", "result_cache"),
+                               config["zone_field"], settings, hashes, results_store_path(config), table_name)
+
+
+def prepare_basins(config, products, memory_mb):
+    """
+    Copies the basins next to the outputs once (the source often sits on a
+    network share) and hashes them once for every incremental stage.
+    The copy is refreshed only when the source files change.
+    """
+    from IncrementalCache import basin_hashes
+
+    folder = stage_folder(config, "basins")
+    local_path = os.path.join(folder, "basins.shp")
+    identity_path = os.path.join(folder, "source.json")
+    identity = json.loads(json.dumps(file_identity(config["basins"])))
+
+    previous = None
+    if os.path.exists(identity_path):
+        with open(identity_path) as identity_file:
+            previous = json.load(identity_file)
+    if previous != identity or not arcpy.Exists(local_path):
+        arcpy.management.CopyFeatures(config["basins"], local_path)
+        with open(identity_path, "w") as identity_file:
+            json.dump(identity, identity_file)
+
+    return {"path": local_path, "hashes": basin_hashes(local_path, config["zone_field"])}
+
+
+def nlcd_stage(config, products, memory_mb):
+    from NLCDHistogram import zonal_histogram_NLCD
+
+    zone_cache_folder = os.path.join(config["output_folder"], "pipeline", "zone_cache")
+    compute = lambda basins: zonal_histogram_NLCD(config["nlcd_raster"], basins, zone_cache_folder,
+                                                  config["zone_field"], memory_mb, raster_cache_folder(config))
+    gids, columns = characteristic_columns(config, products, "NLCD", "NLCD", [config["nlcd_raster"]], compute)
+    return "NLCD", gids, columns
+
+
+def prism_stage(config, products, memory_mb):
+    from PRISM import prism_zonal_means
+
+    rasters = list_rasters(config["prism_folder"])
+    folder = stage_folder(config, "prism")
+    compute = lambda basins: prism_zonal_means(basins, rasters, config["zone_field"], folder, memory_mb,
+                                               raster_cache_folder=raster_cache_folder(config))
+    gids, columns = characteristic_columns(config, products, "PRISM", "PRISM", rasters, compute)
+    return "PRISM", gids, columns
+
+
+def atlas14_stage(config, products, memory_mb):
+    from NoaaAtlas14 import sample_atlas14
+
+    rasters = list_rasters(config["atlas14_folder"])
+    method, window = config["sampling_method"], config["sampling_window"]
+    compute = lambda basins: sample_atlas14(basins, rasters, method, window, raster_cache_folder(config))
+    table_name = "NOAA_Atlas14_Precipitation_Frequency"
+    gids, columns = characteristic_columns(config, products, "Atlas14", table_name, rasters, compute, [method, window])
+    return table_name, gids, columns
+
+
+def ecoregion_stage(config, products, memory_mb):
+    from Ecoregion import ecoregion_columns, overlay_area_percentages
+
+    index_cache_folder = os.path.join(config["output_folder"], "pipeline", "index_cache")
+    compute = lambda basins: ecoregion_columns(*overlay_area_percentages(config["ecoregion"], basins,
+                                                                         index_cache_folder))
+    gids, columns = characteristic_columns(config, products, "Ecoregion", "Ecoregion", [config["ecoregion"]], compute)
+    return "Ecoregion", gids, columns
+
+
+def wetland_stage(config, products, memory_mb):
+    from Wetlands import BASIN_ATTRIBUTE_FIELDS, overlay_wetland_areas, wetland_percentage_columns
+
+    index_cache_folder = os.path.join(config["output_folder"], "pipeline", "index_cache")
+    compute = lambda basins: wetland_percentage_columns(basins, overlay_wetland_areas(config["wetland"], basins,
+                                                                                      index_cache_folder))
+    gids, columns = characteristic_columns(config, products, "Wetland", "NationalWetland", [config["wetland"]],
+                                           compute, attribute_fields=BASIN_ATTRIBUTE_FIELDS)
+    return "NationalWetland", gids, columns
+
+
+def soil_stage(config, products, memory_mb):
+    from SoilMapUnits import soil_type_ksat_columns
+
+    folder = stage_folder(config, "soil")
+    compute = lambda basins: soil_type_ksat_columns(config["soil"], basins, folder)
+    gids, columns = characteristic_columns(config, products, "Soil", "SoilMapUnits", [config["soil"]], compute)
+    return "SoilMapUnits", gids, columns
+
+
+def pipeline_stages():
+    """The characteristic tools as a DAG; every characteristic shares the basins stage."""
+    return [
+        stage("basins", prepare_basins, inputs=["basins"], memory_mb=256),
+        stage("nlcd", nlcd_stage, ["basins"], ["nlcd_raster"], memory_mb=1024),
+        stage("prism", prism_stage, ["basins"], ["prism_folder"], memory_mb=1024),
+        stage("atlas14", atlas14_stage, ["basins"], ["atlas14_folder"], memory_mb=256),
+        stage("ecoregion", ecoregion_stage, ["basins"], ["ecoregion"], memory_mb=1024),
+        stage("wetland", wetland_stage, ["basins"], ["wetland"], memory_mb=2048),
+        stage("soil", soil_stage, ["basins"], ["soil"], memory_mb=2048),
+    ]
+
+
+def load_config(config_path, overrides=None):
+    """Reads a JSON config over DEFAULT_CONFIG. Paths are the keys of DEFAULT_CONFIG."""
+    config = dict(DEFAULT_CONFIG)
+    with open(config_path) as config_file:
+        config.update(json.load(config_file))
+    config.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {sorted(unknown)}")
+    if not config["basins"] or not config["output_folder"]:
+        raise ValueError("basins and output_folder are required")
+    # run_stages never starts a stage with no worker slot, so it would wait forever
+    if not isinstance(config["workers"], int) or config["workers"] < 1:
+        raise ValueError(f"workers must be a whole number of at least 1, not {config['workers']!r}")
+    return config
+
+
+def run_pipeline(config, selected=None):
+    """
+    Runs every configured characteristic (or the selected ones) and writes each
+    table into output_folder/BasinCharacteristics.gdb as soon as it is ready.
+    Tables are written from this process only, so the workers never share a
+    geodatabase lock. Each table is also upserted into the SQLite results
+    store, so a partial run updates its characteristics in place. With
+    columnar_folder every table is also written as Parquet/Arrow and the wide
+    table is rebuilt from all table files there, so a run of selected stages
+    still updates the joined table.
+    Returns the stage status dict.
+    """
+    config = dict(config)
+    config["scratch_root"] = stage_folder(config, "scratch")
+    gdb_path = os.path.join(config["output_folder"], GDB_NAME)
+    store_path = results_store_path(config)
+    if config["trace_folder"]:
+        start_trace(os.path.join(config["trace_folder"], "pipeline"))
+
+    tables = {}
+
+    def write_result(name, product):
+        if name == "basins":
+            return
+        table_name, gids, columns = product
+        summarize_columns(table_name, gids, columns)
+        print("Table written:", write_table(gdb_path, table_name, gids, columns))
+        if store_path:
+            upsert_columns(store_path, table_name, gids, columns)
+        tables[table_name] = (gids, columns)
+
+    stages = enabled_stages(pipeline_stages(), config, selected)
+    print("Stages:", ", ".join(item["name"] for item in stages))
+    status = run_stages(stages, config, write_result)
+    mark("Pipeline finished: " + json.dumps(status))
+
+    if config["columnar_folder"] and tables:
+        export_tables(config["columnar_folder"], tables, config["columnar_format"], wide_table_name=None)
+        if columnar_available():
+            print("Wide table written:", rebuild_wide_table(config["columnar_folder"], config["columnar_format"]))
+
+    if config["trace_folder"]:
+        # One trace of the whole run: this process's table writes plus every stage's worker trace
+        paths = [stop_trace()[0]]
+        paths += [stage_trace_prefix(config, name) + ".jsonl" for name, state in status.items() if state != "skipped"]
+        print("Run trace:", merge_traces(paths, os.path.join(config["trace_folder"], "pipeline_run")))
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build every basin characteristic table in one run.")
+    parser.add_argument("config", help="JSON file with the input paths, see DEFAULT_CONFIG")
+    parser.add_argument("--stages", help="comma-separated stages to run (default: every configured stage)")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--max-memory-mb", type=int)
+    parser.add_argument("--trace-folder", help="write a timing trace of the run to this folder")
+    parser.add_argument("--columnar-folder", help="also write the tables as Parquet/Arrow to this folder")
+    options = parser.parse_args()
+
+    config = load_config(options.config, {"workers": options.workers, "max_memory_mb": options.max_memory_mb,
+                                          "trace_folder": options.trace_folder,
+                                          "columnar_folder": options.columnar_folder})
+    selected = set(options.stages.split(",")) if options.stages else None
+    status = run_pipeline(config, selected)
+    if any(value != "done" for value in status.values()):
+        raise SystemExit(1)
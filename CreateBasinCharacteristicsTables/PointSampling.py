@@ -0,0 +1,142 @@
+#-------------------------------------------------------------------------------
+# Name:        PointSampling.py
+# Purpose:     Sample raster values at many points at once (basin centroids) in
+#              place of writing a point shapefile for ExtractMultiValuesToPoints.
+#              Points are converted to cells once per grid and values are read
+#              block by block, only for the blocks that hold points.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+from RasterBlocks import DEFAULT_BLOCK_SIZE
+from RasterCache import cached_grid, window_reader
+from ZoneLabels import grid_key
+
+SAMPLING_METHODS = ["nearest", "bilinear"]
+
+
+def world_to_cell(xs, ys, grid):
+    """
+    Converts map coordinates to row/col indices of the grid. Returns (rows, cols,
+    inside) where inside marks the points that fall on the grid.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    rows = np.floor((grid["ymax"] - ys) / grid["cell_height"]).astype(np.int64)
+    cols = np.floor((xs - grid["xmin"]) / grid["cell_width"]).astype(np.int64)
+    inside = (rows >= 0) & (rows < grid["rows"]) & (cols >= 0) & (cols < grid["cols"])
+    return rows, cols, inside
+
+
+def point_taps(xs, ys, grid, method="nearest", window=0):
+    """
+    Works out which cells each point reads and with what weight. Returns
+    (rows, cols, weights), each shaped (n_points, n_taps):
+      nearest            the cell under the point
+      nearest, window=w  the (2w+1) x (2w+1) cells around it, equally weighted
+      bilinear           the four cell centres around the point
+    A point whose own cell is off the grid gets zero weights, so it samples
+    NaN even when some of its window or bilinear taps fall on the grid.
+    """
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method {method}, expected one of {SAMPLING_METHODS}")
+    if method == "bilinear" and window:
+        raise ValueError("Window averaging is only available with nearest sampling")
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    rows, cols, inside = world_to_cell(xs, ys, grid)
+
+    if method == "nearest":
+        offsets = np.arange(-window, window + 1)
+        row_offsets, col_offsets = np.meshgrid(offsets, offsets, indexing="ij")
+        tap_rows = rows[:, np.newaxis] + row_offsets.ravel()
+        tap_cols = cols[:, np.newaxis] + col_offsets.ravel()
+        weights = np.ones(tap_rows.shape, dtype=np.float64)
+        weights[~inside] = 0.0
+        return tap_rows, tap_cols, weights
+
+    # Bilinear weights are measured between cell centres
+    fractional_rows = (grid["ymax"] - ys) / grid["cell_height"] - 0.5
+    fractional_cols = (xs - grid["xmin"]) / grid["cell_width"] - 0.5
+    row0 = np.floor(fractional_rows).astype(np.int64)
+    col0 = np.floor(fractional_cols).astype(np.int64)
+    dr = fractional_rows - row0
+    dc = fractional_cols - col0
+
+    tap_rows = np.stack([row0, row0, row0 + 1, row0 + 1], axis=1)
+    tap_cols = np.stack([col0, col0 + 1, col0, col0 + 1], axis=1)
+    weights = np.stack([(1 - dr) * (1 - dc), (1 - dr) * dc, dr * (1 - dc), dr * dc], axis=1)
+    weights[~inside] = 0.0
+    return tap_rows, tap_cols, weights
+
+
+def sample_taps(read_window, grid, tap_rows, tap_cols, weights):
+    """
+    Reads the taps block by block and returns the weighted mean per point.
+    Only native blocks that hold a point are read, each once, widened by the
+    taps' reach. Taps off the grid, on NoData or NaN are left out and the
+    remaining weights renormalized; a point with no valid tap gets NaN.
+    read_window(row0, col0, nrows, ncols) returns a window of the grid.
+    """
+    n_points = tap_rows.shape[0]
+    totals = np.zeros(n_points, dtype=np.float64)
+    weight_sums = np.zeros(n_points, dtype=np.float64)
+
+    # Zero-weight taps (points off the grid) are not read at all
+    on_grid = (tap_rows >= 0) & (tap_rows < grid["rows"]) & (tap_cols >= 0) & (tap_cols < grid["cols"]) & (weights > 0)
+
+    # Group the points by the native block under their first tap
+    block_rows = grid.get("block_rows") or DEFAULT_BLOCK_SIZE
+    block_cols = grid.get("block_cols") or DEFAULT_BLOCK_SIZE
+    anchor_rows = np.clip(tap_rows.min(axis=1), 0, grid["rows"] - 1)
+    anchor_cols = np.clip(tap_cols.min(axis=1), 0, grid["cols"] - 1)
+    block_ids = (anchor_rows // block_rows) * (grid["cols"] // block_cols + 1) + anchor_cols // block_cols
+
+    for block_id in np.unique(block_ids[on_grid.any(axis=1)]):
+        points = np.nonzero((block_ids == block_id) & on_grid.any(axis=1))[0]
+        rows, cols, valid = tap_rows[points], tap_cols[points], on_grid[points]
+
+        row0, row1 = rows[valid].min(), rows[valid].max() + 1
+        col0, col1 = cols[valid].min(), cols[valid].max() + 1
+        values = np.asarray(read_window(row0, col0, row1 - row0, col1 - col0), dtype=np.float64)
+
+        tap_values = np.zeros(rows.shape, dtype=np.float64)
+        tap_values[valid] = values[rows[valid] - row0, cols[valid] - col0]
+        if grid.get("nodata") is not None:
+            valid &= tap_values != grid["nodata"]
+        valid &= ~np.isnan(tap_values)
+
+        tap_weights = np.where(valid, weights[points], 0.0)
+        totals[points] += (np.where(valid, tap_values, 0.0) * tap_weights).sum(axis=1)
+        weight_sums[points] += tap_weights.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(weight_sums > 0, totals / weight_sums, np.nan)
+
+
+def sample_points(read_window, grid, xs, ys, method="nearest", window=0):
+    """Samples one grid at every point. See point_taps for the methods."""
+    tap_rows, tap_cols, weights = point_taps(xs, ys, grid, method, window)
+    return sample_taps(read_window, grid, tap_rows, tap_cols, weights)
+
+
+def sample_rasters(rasters, xs, ys, method="nearest", window=0, raster_cache_folder=None):
+    """
+    Samples many rasters at the same points. The point-to-cell conversion is done
+    once per distinct grid, so a stack of co-registered grids costs one
+    conversion. With raster_cache_folder the values come from the memory-mapped
+    raster cache. Returns a list of value arrays in raster order.
+    """
+    taps_by_grid = {}
+    samples = []
+    for raster in rasters:
+        grid = cached_grid(raster, raster_cache_folder)
+        key = grid_key(grid)
+        if key not in taps_by_grid:
+            taps_by_grid[key] = point_taps(xs, ys, grid, method, window)
+        tap_rows, tap_cols, weights = taps_by_grid[key]
+        read_window = window_reader(raster, grid, raster_cache_folder)
+        samples.append(sample_taps(read_window, grid, tap_rows, tap_cols, weights))
+    return samples
@@ -0,0 +1,162 @@
+#-------------------------------------------------------------------------------
+# Name:        RasterBlocks.py
+# Purpose:     Describe a source raster's grid, read windows of it into NumPy and
+#              stream it block by block under a memory ceiling
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import math
+import sys
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Block size used when the raster does not report its own
+DEFAULT_BLOCK_SIZE = 512
+
+
+def raster_grid(raster_path):
+    """
+    Describes the grid of a raster as a plain dict so it can be compared, hashed
+    and handed to worker processes.
+    """
+    raster = arcpy.Raster(raster_path)
+    extent = raster.extent
+    raster_info = raster.getRasterInfo()
+    return {
+        "xmin": extent.XMin,
+        "ymin": extent.YMin,
+        "xmax": extent.XMax,
+        "ymax": extent.YMax,
+        "cell_width": raster.meanCellWidth,
+        "cell_height": raster.meanCellHeight,
+        "rows": raster.height,
+        "cols": raster.width,
+        "nodata": raster.noDataValue,
+        "block_rows": raster_info.blockHeight or DEFAULT_BLOCK_SIZE,
+        "block_cols": raster_info.blockWidth or DEFAULT_BLOCK_SIZE,
+        "spatial_reference": raster.spatialReference.exportToString(),
+    }
+
+
+def subgrid(grid, xmin, ymin, xmax, ymax, whole_blocks=True):
+    """
+    Returns the part of grid covering the given extent, widened to whole native
+    blocks so windows of the subgrid stay aligned with the source's blocks.
+    With whole_blocks=False it covers just the cells the extent touches.
+    row_offset/col_offset locate the subgrid inside the full grid.
+    """
+    block_rows = (grid.get("block_rows") or DEFAULT_BLOCK_SIZE) if whole_blocks else 1
+    block_cols = (grid.get("block_cols") or DEFAULT_BLOCK_SIZE) if whole_blocks else 1
+
+    row0 = int(math.floor((grid["ymax"] - ymax) / grid["cell_height"])) // block_rows * block_rows
+    col0 = int(math.floor((xmin - grid["xmin"]) / grid["cell_width"])) // block_cols * block_cols
+    row1 = int(math.ceil((grid["ymax"] - ymin) / grid["cell_height"]))
+    col1 = int(math.ceil((xmax - grid["xmin"]) / grid["cell_width"]))
+    row0, col0 = max(row0, 0), max(col0, 0)
+    row1, col1 = min(row1, grid["rows"]), min(col1, grid["cols"])
+
+    window = dict(grid)
+    window.update({
+        "xmin": grid["xmin"] + col0 * grid["cell_width"],
+        "xmax": grid["xmin"] + col1 * grid["cell_width"],
+        "ymax": grid["ymax"] - row0 * grid["cell_height"],
+        "ymin": grid["ymax"] - row1 * grid["cell_height"],
+        "rows": max(row1 - row0, 0),
+        "cols": max(col1 - col0, 0),
+        "row_offset": grid.get("row_offset", 0) + row0,
+        "col_offset": grid.get("col_offset", 0) + col0,
+    })
+    return window
+
+
+def grid_rows(grid, row0, nrows):
+    """Returns the band of grid made of rows row0 to row0 + nrows, in the same form as subgrid."""
+    band = dict(grid)
+    band.update({
+        "ymax": grid["ymax"] - row0 * grid["cell_height"],
+        "ymin": grid["ymax"] - (row0 + nrows) * grid["cell_height"],
+        "rows": nrows,
+        "row_offset": grid.get("row_offset", 0) + row0,
+    })
+    return band
+
+
+def read_raster_window(raster_path, grid, row0=0, col0=0, nrows=None, ncols=None, nodata_to_value=None):
+    """
+    Reads a window of the raster as a NumPy array. Rows are counted from the top
+    of the grid. Without nrows/ncols the whole raster is read. NoData cells keep
+    the raster's NoData value unless nodata_to_value is given.
+    """
+    if nrows is None:
+        nrows = grid["rows"] - row0
+    if ncols is None:
+        ncols = grid["cols"] - col0
+
+    # RasterToNumPyArray is anchored on the lower left corner of the window
+    lower_left = arcpy.Point(grid["xmin"] + col0 * grid["cell_width"],
+                             grid["ymax"] - (row0 + nrows) * grid["cell_height"])
+    if nodata_to_value is None:
+        return arcpy.RasterToNumPyArray(raster_path, lower_left, ncols, nrows)
+    return arcpy.RasterToNumPyArray(raster_path, lower_left, ncols, nrows, nodata_to_value)
+
+
+def block_windows(grid, max_memory_mb=512, bytes_per_cell=8):
+    """
+    Splits the grid into windows made of whole native blocks. Windows span the
+    full raster width and as many block rows as fit in max_memory_mb; if a single
+    block row is already too large it is split along the columns as well.
+    bytes_per_cell is what the caller holds per cell while working on a window
+    (values, zone labels and temporaries). Yields (row0, col0, nrows, ncols).
+    """
+    rows, cols = grid["rows"], grid["cols"]
+    block_rows = grid.get("block_rows") or DEFAULT_BLOCK_SIZE
+    block_cols = grid.get("block_cols") or DEFAULT_BLOCK_SIZE
+    budget_cells = max(int(max_memory_mb * 1024 * 1024 // bytes_per_cell), block_rows * block_cols)
+
+    # Grow the window by whole block rows, and fall back to whole blocks across
+    if block_rows * cols <= budget_cells:
+        window_rows = (budget_cells // cols) // block_rows * block_rows
+        window_cols = cols
+    else:
+        window_rows = block_rows
+        window_cols = (budget_cells // block_rows) // block_cols * block_cols
+
+    for row0 in range(0, rows, window_rows):
+        for col0 in range(0, cols, window_cols):
+            yield row0, col0, min(window_rows, rows - row0), min(window_cols, cols - col0)
+
+
+def stream_blocks(read_window, grid, max_memory_mb=512, bytes_per_cell=8):
+    """
+    Walks the grid window by window and yields ((row0, col0, nrows, ncols), block).
+    read_window(row0, col0, nrows, ncols) returns the block; for a raster on disk
+    pass functools.partial(read_raster_window, raster_path, grid), for a
+    synthetic array any function slicing it will do.
+    """
+    for window in block_windows(grid, max_memory_mb, bytes_per_cell):
+        yield window, read_window(*window)
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if unknown."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / (1024 * 1024)
+    return None
@@ -0,0 +1,138 @@
+#-------------------------------------------------------------------------------
+# Name:        RasterCache.py
+# Purpose:     One-time conversion of a source raster (NLCD, PRISM, Atlas14) to
+#              an uncompressed memory-mapped .npy array plus a small JSON header
+#              (grid, nodata, dtype, source identity). Windows are then served
+#              as zero-copy views of the mapped file instead of decoding the TIFF
+#              again on every run. The cache is rebuilt when the source's path,
+#              size or mtime changes. The array is one row-major file rather
+#              than a tiled chunk store: every window the tools read (row bands,
+#              subgrids) is then a strided view of it, where tiles would need a
+#              copy to assemble any window crossing a tile edge.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import functools
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+
+from IncrementalCache import file_identity
+from RasterBlocks import raster_grid, read_raster_window, stream_blocks
+from RunTrace import count, span
+
+# Bump when the layout of the cached files changes, so old entries are rebuilt
+CACHE_VERSION = 1
+
+
+def cache_paths(raster_path, cache_folder):
+    """(array path, header path) of a raster's cache entry, keyed by its absolute path."""
+    key = hashlib.sha1(os.path.abspath(raster_path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_folder, f"raster_{key}.npy"), os.path.join(cache_folder, f"raster_{key}.json")
+
+
+def source_identity(raster_path):
+    return {"version": CACHE_VERSION, "source": json.loads(json.dumps(file_identity(raster_path)))}
+
+
+def read_header(header_path):
+    if not os.path.exists(header_path):
+        return None
+    with open(header_path) as header_file:
+        return json.load(header_file)
+
+
+def convert_raster(raster_path, array_path, grid, max_memory_mb=512, reader=read_raster_window):
+    """
+    Streams the raster block by block into an uncompressed .npy file at
+    array_path, so memory stays under max_memory_mb whatever the raster size.
+    reader(raster_path, grid, row0, col0, nrows, ncols) reads a window, as
+    read_raster_window does. Returns the dtype of the stored values.
+    """
+    blocks = stream_blocks(functools.partial(reader, raster_path, grid), grid, max_memory_mb, 8)
+    first = next(blocks, None)
+    # The stored dtype is whatever the raster decodes to; a grid with no cells has no reads to go by
+    dtype = first[1].dtype if first is not None else np.dtype(grid.get("dtype", "float64"))
+    array = np.lib.format.open_memmap(array_path, mode="w+", dtype=dtype, shape=(grid["rows"], grid["cols"]))
+    if first is not None:
+        for (row0, col0, nrows, ncols), block in itertools.chain([first], blocks):
+            array[row0:row0 + nrows, col0:col0 + ncols] = block
+            count("pixels_scanned", block.size)
+    array.flush()
+    dtype = str(array.dtype)
+    del array
+    return dtype
+
+
+def cached_raster(raster_path, cache_folder, max_memory_mb=512, describe=raster_grid, reader=read_raster_window):
+    """
+    Returns (grid, array): the raster's grid and a read-only memory-mapped
+    (rows, cols) array of its values, NoData cells keeping the NoData value.
+    The array is converted from the source on first use and whenever the
+    source file changed since; otherwise only the header is read.
+    describe(raster_path) gives the grid and reader reads windows for the
+    conversion (raster_grid and read_raster_window by default).
+    """
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    array_path, header_path = cache_paths(raster_path, cache_folder)
+    identity = source_identity(raster_path)
+
+    header = read_header(header_path)
+    if header is None or header["identity"] != identity or not os.path.exists(array_path):
+        grid = describe(raster_path)
+        # Convert under a temporary name so an interrupted run never leaves a bad cache entry
+        temp_path = array_path + ".partial.npy"
+        with span("convert_raster", raster=os.path.basename(raster_path), rows=grid["rows"], cols=grid["cols"]):
+            dtype = convert_raster(raster_path, temp_path, grid, max_memory_mb, reader)
+        os.replace(temp_path, array_path)
+        header = {"identity": identity, "grid": grid, "dtype": dtype, "nodata": grid["nodata"]}
+        with open(header_path, "w") as header_file:
+            json.dump(header, header_file)
+        print(f"Raster cached at {array_path}")
+
+    return header["grid"], np.load(array_path, mmap_mode="r")
+
+
+def read_cached_window(array, cached_grid, grid, row0=0, col0=0, nrows=None, ncols=None):
+    """
+    Same window as read_raster_window(raster, grid, row0, col0, nrows, ncols),
+    as a view of the cached array; nothing is copied or decoded. grid must lie
+    on the cached raster's grid, as every subgrid and row band of it does
+    (row_offset/col_offset locate it).
+    """
+    if nrows is None:
+        nrows = grid["rows"] - row0
+    if ncols is None:
+        ncols = grid["cols"] - col0
+    top = grid.get("row_offset", 0) + row0
+    left = grid.get("col_offset", 0) + col0
+    if top < 0 or left < 0 or top + nrows > cached_grid["rows"] or left + ncols > cached_grid["cols"]:
+        raise ValueError(f"Window ({top}, {left}, {nrows}, {ncols}) is outside the cached raster")
+    return array[top:top + nrows, left:left + ncols]
+
+
+def window_reader(raster_path, grid, cache_folder=None, max_memory_mb=512):
+    """
+    A read_window(row0, col0, nrows, ncols) for the raster on grid, as
+    stream_blocks and the samplers expect: served from the raster cache in
+    cache_folder, or straight from the raster when no folder is given.
+    """
+    if not cache_folder:
+        return functools.partial(read_raster_window, raster_path, grid)
+    cached_grid, array = cached_raster(raster_path, cache_folder, max_memory_mb)
+    if (cached_grid["cell_width"], cached_grid["cell_height"]) != (grid["cell_width"], grid["cell_height"]):
+        raise ValueError(f"{raster_path} is cached on a grid with another cell size")
+    return functools.partial(read_cached_window, array, cached_grid, grid)
+
+
+def cached_grid(raster_path, cache_folder=None):
+    """The grid of a raster, from its cache header when the cache is current (no arcpy call needed)."""
+    if cache_folder:
+        header = read_header(cache_paths(raster_path, cache_folder)[1])
+        if header is not None and header["identity"] == source_identity(raster_path):
+            return header["grid"]
+    return raster_grid(raster_path)
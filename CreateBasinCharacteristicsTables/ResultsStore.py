@@ -0,0 +1,196 @@
+#-------------------------------------------------------------------------------
+# Name:        ResultsStore.py
+# Purpose:     One local SQLite store for every basin characteristic: a table
+#              per characteristic keyed on GID, written with batched upserts so
+#              reruns and partial runs update rows in place, a table of every
+#              GID in the store, and a view joining all characteristics to it.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import argparse
+import re
+import sqlite3
+
+import numpy as np
+
+from RunTrace import count, span
+from TableWriter import summarize_columns
+
+STORE_NAME = "BasinCharacteristics.sqlite"
+# The joined view of every characteristic table
+VIEW_NAME = "BasinCharacteristics"
+# Every GID with a row in any characteristic table, kept up to date by upserts and deletes
+GID_TABLE = "BasinGIDs"
+# Rows per executemany call of an upsert
+UPSERT_BATCH = 5000
+
+NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def quote(name):
+    """A table or column name as an SQL identifier. Names are checked, not escaped."""
+    if not NAME_PATTERN.match(name):
+        raise ValueError(f"Not a valid table or column name: {name!r}")
+    return f'"{name}"'
+
+
+def open_results_store(store_path):
+    """Opens (creating if needed) the store, with its GID table."""
+    # Tools run side by side may write to one store; wait for each other's writes instead of failing
+    connection = sqlite3.connect(store_path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {quote(GID_TABLE)} (GID TEXT PRIMARY KEY NOT NULL) WITHOUT ROWID")
+    return connection
+
+
+def characteristic_tables(connection):
+    return [name for (name,) in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name != ? "
+        "ORDER BY name", (GID_TABLE,))]
+
+
+def view_names(connection):
+    return [name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'view'")]
+
+
+def table_columns(connection, table_name):
+    """Column names of a characteristic table, GID excluded."""
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({quote(table_name)})") if row[1] != "GID"]
+
+
+def ensure_table(connection, table_name, column_names):
+    """
+    Creates the table of a characteristic if it is missing, clustered on GID
+    as its primary key, and adds any column it does not have yet. Returns True
+    when the schema changed.
+    """
+    existing = table_columns(connection, table_name)
+    if not existing:
+        definitions = ", ".join(f"{quote(name)} REAL" for name in column_names)
+        connection.execute(f"CREATE TABLE {quote(table_name)} (GID TEXT PRIMARY KEY NOT NULL"
+                           f"{', ' + definitions if definitions else ''}) WITHOUT ROWID")
+        return True
+    added = [name for name in column_names if name not in existing]
+    for name in added:
+        connection.execute(f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(name)} REAL")
+    return bool(added)
+
+
+def create_joined_view(connection):
+    """
+    (Re)creates the view of every characteristic per GID, left-joining every
+    table to the GID table on its key. A column name used by more than one
+    table is prefixed with its table name, as in the wide Parquet table.
+    """
+    tables = {name: table_columns(connection, name) for name in characteristic_tables(connection)}
+    name_counts = {}
+    for columns in tables.values():
+        for name in columns:
+            name_counts[name] = name_counts.get(name, 0) + 1
+
+    connection.execute(f"DROP VIEW IF EXISTS {quote(VIEW_NAME)}")
+    if not tables:
+        return
+    selected = ["g.GID"]
+    joins = []
+    for table_name, columns in tables.items():
+        for name in columns:
+            alias = name if name_counts[name] == 1 else f"{table_name}_{name}"
+            selected.append(f"{quote(table_name)}.{quote(name)} AS {quote(alias)}")
+        joins.append(f"LEFT JOIN {quote(table_name)} ON {quote(table_name)}.GID = g.GID")
+    connection.execute(f"CREATE VIEW {quote(VIEW_NAME)} AS SELECT {', '.join(selected)} "
+                       f"FROM {quote(GID_TABLE)} AS g {' '.join(joins)}")
+
+
+def upsert_columns(store_path, table_name, gids, columns, batch_size=UPSERT_BATCH):
+    """
+    Writes a columnar result into store_path/table_name: basins already in the
+    table are updated in place, new ones inserted, and basins not in gids are
+    left as they are, so a partial run never drops rows. NaN is stored as
+    NULL. Returns the number of rows written.
+    """
+    names = list(columns)
+    arrays = [np.asarray(columns[name], dtype=np.float64) for name in names]
+    placeholders = ", ".join("?" for _ in range(len(names) + 1))
+    column_list = ", ".join(["GID"] + [quote(name) for name in names])
+    if names:
+        updates = ", ".join(f"{quote(name)} = excluded.{quote(name)}" for name in names)
+        conflict = f"ON CONFLICT(GID) DO UPDATE SET {updates}"
+    else:
+        conflict = "ON CONFLICT(GID) DO NOTHING"
+    statement = f"INSERT INTO {quote(table_name)} ({column_list}) VALUES ({placeholders}) {conflict}"
+    gid_statement = f"INSERT OR IGNORE INTO {quote(GID_TABLE)} (GID) VALUES (?)"
+
+    connection = open_results_store(store_path)
+    try:
+        with span("upsert_columns", table=table_name, rows=len(gids)):
+            with connection:
+                schema_changed = ensure_table(connection, table_name, names)
+                if schema_changed or VIEW_NAME not in view_names(connection):
+                    create_joined_view(connection)
+                for start in range(0, len(gids), batch_size):
+                    stop = min(start + batch_size, len(gids))
+                    rows = [(str(gids[position]),) + tuple(None if np.isnan(array[position]) else float(array[position])
+                                                           for array in arrays)
+                            for position in range(start, stop)]
+                    connection.executemany(statement, rows)
+                    connection.executemany(gid_statement, [row[:1] for row in rows])
+        count("rows_upserted", len(gids))
+    finally:
+        connection.close()
+    return len(gids)
+
+
+def delete_gids(store_path, gids, table_names=None):
+    """
+    Removes basins from the given tables (all of them by default), for basins
+    dropped from the basin file. Tables the store does not have yet are
+    skipped. A GID left in no table is removed from the GID table as well.
+    Returns the number of GIDs that left the store.
+    """
+    gids = [(str(gid),) for gid in gids]
+    connection = open_results_store(store_path)
+    try:
+        with connection:
+            tables = characteristic_tables(connection)
+            for table_name in [name for name in (table_names or tables) if name in tables]:
+                connection.executemany(f"DELETE FROM {quote(table_name)} WHERE GID = ?", gids)
+            unused = " AND ".join(f"NOT EXISTS (SELECT 1 FROM {quote(name)} WHERE GID = ?)" for name in tables)
+            removed = connection.executemany(f"DELETE FROM {quote(GID_TABLE)} WHERE GID = ?"
+                                             f"{' AND ' + unused if unused else ''}",
+                                             [gid * (len(tables) + 1) for gid in gids]).rowcount
+    finally:
+        connection.close()
+    return removed
+
+
+def read_characteristics(store_path, table_name=VIEW_NAME, gids=None):
+    """
+    (gids, columns) of one characteristic table, or of the joined view by
+    default, sorted by GID; NULL comes back as NaN. With gids only those basins
+    are read, through the GID key.
+    """
+    connection = open_results_store(store_path)
+    try:
+        cursor = connection.execute(f"SELECT * FROM {quote(table_name)} LIMIT 0")
+        names = [description[0] for description in cursor.description][1:]
+        query = f"SELECT * FROM {quote(table_name)}"
+        if gids is None:
+            rows = connection.execute(query + " ORDER BY GID").fetchall()
+        else:
+            rows = []
+            for gid in sorted(str(gid) for gid in gids):
+                rows.extend(connection.execute(query + " WHERE GID = ?", (gid,)).fetchall())
+    finally:
+        connection.close()
+
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(names))
+    return [row[0] for row in rows], {name: values[:, position] for position, name in enumerate(names)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the characteristics in a results store.")
+    parser.add_argument("store")
+    parser.add_argument("--table", default=VIEW_NAME, help="characteristic table (default: the joined view)")
+    options = parser.parse_args()
+    summarize_columns(options.table, *read_characteristics(options.store, options.table))
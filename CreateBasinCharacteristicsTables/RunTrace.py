@@ -0,0 +1,220 @@
+#-------------------------------------------------------------------------------
+# Name:        RunTrace.py
+# Purpose:     Timing traces for the tools: nested spans (stage -> basin ->
+#              operation), counters (features read, pixels scanned, bytes
+#              written) and peak-memory samples, exported as JSON lines and as
+#              Chrome trace events (chrome://tracing, Perfetto). Tracing is off
+#              unless start_trace is called or BASIN_TRACE names a folder; when
+#              off, span and count return at once.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from RasterBlocks import peak_rss_mb
+
+# Folder to write traces to; tools call start_trace_from_environment at start-up
+TRACE_ENVIRONMENT_VARIABLE = "BASIN_TRACE"
+
+_trace = None
+_exit_hook = False
+
+
+class _NullSpan:
+    """What span returns while tracing is off: a context manager that does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, trace, name, category, args):
+        self.trace = trace
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        stack = self.trace.stack()
+        self.depth = len(stack)
+        stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.trace.stack().pop()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.add_span(self, end)
+        return False
+
+
+class _Trace:
+    def __init__(self, output_prefix, sample_memory):
+        self.output_prefix = output_prefix
+        self.sample_memory = sample_memory
+        # Timestamps are wall-clock microseconds, so traces of different processes line up when merged
+        self.origin = time.perf_counter() - time.time()
+        self.events = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pid = os.getpid()
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def microseconds(self, seconds):
+        return round((seconds - self.origin) * 1e6, 1)
+
+    def add_span(self, span, end):
+        event = {"type": "span", "name": span.name, "cat": span.category, "ts": self.microseconds(span.start),
+                 "dur": round((end - span.start) * 1e6, 1), "depth": span.depth, "pid": self.pid,
+                 "tid": threading.get_ident(), "args": span.args}
+        with self.lock:
+            self.events.append(event)
+        if self.sample_memory:
+            self.add_counter("peak_rss_mb", peak_rss_mb(), end, absolute=True)
+
+    def add_counter(self, name, value, now=None, absolute=False):
+        if value is None:
+            return
+        with self.lock:
+            self.counters[name] = value if absolute else self.counters.get(name, 0) + value
+            self.events.append({"type": "counter", "name": name, "ts": self.microseconds(now or time.perf_counter()),
+                                "value": self.counters[name], "pid": self.pid, "tid": threading.get_ident()})
+
+    def add_mark(self, message):
+        with self.lock:
+            self.events.append({"type": "mark", "name": message, "ts": self.microseconds(time.perf_counter()),
+                                "pid": self.pid, "tid": threading.get_ident()})
+
+
+def tracing():
+    """True while a trace is being recorded."""
+    return _trace is not None
+
+
+def start_trace(output_prefix, sample_memory=True):
+    """
+    Starts recording. The trace is written to <output_prefix>.jsonl and
+    <output_prefix>.trace.json by stop_trace, or at exit if the run dies first.
+    With sample_memory the peak RSS is sampled at the end of every span.
+    """
+    global _trace, _exit_hook
+    folder = os.path.dirname(output_prefix)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    _trace = _Trace(output_prefix, sample_memory)
+    if not _exit_hook:
+        atexit.register(stop_trace)
+        _exit_hook = True
+    return _trace
+
+
+def start_trace_from_environment(tool_name):
+    """Starts a trace in the folder named by BASIN_TRACE, if it is set. Returns True when tracing."""
+    folder = os.environ.get(TRACE_ENVIRONMENT_VARIABLE)
+    if not folder:
+        return False
+    start_trace(os.path.join(folder, f"{tool_name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"))
+    return True
+
+
+def stop_trace():
+    """Stops recording and writes the trace. Returns the (jsonl, chrome) paths, or None when not tracing."""
+    global _trace
+    trace, _trace = _trace, None
+    if trace is None:
+        return None
+    jsonl_path = trace.output_prefix + ".jsonl"
+    chrome_path = trace.output_prefix + ".trace.json"
+    write_jsonl(trace.events, jsonl_path)
+    write_chrome_trace(trace.events, chrome_path)
+    print("Trace written to", chrome_path)
+    return jsonl_path, chrome_path
+
+
+def span(name, category="operation", **args):
+    """
+    Times a block: with span("intersect", gid=gid): ... Categories used by the
+    tools are "stage", "basin" and "operation"; args end up in the trace.
+    """
+    if _trace is None:
+        return _NULL_SPAN
+    return _Span(_trace, name, category, args)
+
+
+def count(name, value=1):
+    """Adds value to a running counter such as features_read or pixels_scanned."""
+    if _trace is not None:
+        _trace.add_counter(name, value)
+
+
+def mark(message):
+    """Prints a progress message with the time of day, and records it in the trace."""
+    print(message, "at", time.strftime("%m-%d %X", time.localtime()))
+    if _trace is not None:
+        _trace.add_mark(message)
+
+
+def write_jsonl(events, path):
+    with open(path, "w") as jsonl_file:
+        for event in events:
+            jsonl_file.write(json.dumps(event, default=str) + "\n")
+
+
+def chrome_events(events):
+    """Converts trace events to the Chrome trace-event format."""
+    converted = []
+    for event in events:
+        if event["type"] == "span":
+            converted.append({"name": event["name"], "cat": event["cat"], "ph": "X", "ts": event["ts"],
+                              "dur": event["dur"], "pid": event["pid"], "tid": event["tid"], "args": event["args"]})
+        elif event["type"] == "counter":
+            converted.append({"name": event["name"], "ph": "C", "ts": event["ts"], "pid": event["pid"],
+                              "tid": event["tid"], "args": {event["name"]: event["value"]}})
+        else:
+            converted.append({"name": event["name"], "ph": "i", "s": "p", "ts": event["ts"], "pid": event["pid"],
+                              "tid": event["tid"]})
+    return converted
+
+
+def write_chrome_trace(events, path):
+    with open(path, "w") as trace_file:
+        json.dump({"traceEvents": chrome_events(events), "displayTimeUnit": "ms"}, trace_file, default=str)
+
+
+def read_jsonl(path):
+    with open(path) as jsonl_file:
+        return [json.loads(line) for line in jsonl_file if line.strip()]
+
+
+def merge_traces(jsonl_paths, output_prefix):
+    """
+    Combines the traces of several processes (pipeline workers) into one
+    trace, one pid track per process.
+    """
+    events = [event for path in jsonl_paths for event in read_jsonl(path)]
+    write_jsonl(events, output_prefix + ".jsonl")
+    write_chrome_trace(events, output_prefix + ".trace.json")
+    return output_prefix + ".trace.json"
+
+
+def slowest_spans(events, category="basin", top=10):
+    """The longest spans of a category, to find the slow basins of a run."""
+    spans = [event for event in events if event["type"] == "span" and event["cat"] == category]
+    return sorted(spans, key=lambda event: event["dur"], reverse=True)[:top]
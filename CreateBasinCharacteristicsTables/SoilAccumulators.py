@@ -0,0 +1,111 @@
+#-------------------------------------------------------------------------------
+# Name:        SoilAccumulators.py
+# Purpose:     Fixed-size per-GID running sums for the soil characteristics
+#              (hydrologic soil group areas and area-weighted ksat), updated
+#              chunk by chunk while streaming the soil/basin intersect
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+
+from IncrementalCache import source_identity
+
+# Output fields, in table order; anything that is not one of the first seven goes to OtherSoilTypes
+SOIL_TYPE_FIELDS = ['SoilType_A', 'SoilType_B', 'SoilType_C', 'SoilType_D', 'SoilType_A_D', 'SoilType_B_D',
+                    'SoilType_C_D', 'OtherSoilTypes']
+OTHER_SOIL_TYPE = len(SOIL_TYPE_FIELDS) - 1
+
+
+def soil_type_code(soil_type):
+    """Column index of a SoilType value (as written by AddSoilTypeField) in SOIL_TYPE_FIELDS."""
+    field_name = f"SoilType_{soil_type}" if soil_type else ""
+    if field_name in SOIL_TYPE_FIELDS:
+        return SOIL_TYPE_FIELDS.index(field_name)
+    return OTHER_SOIL_TYPE
+
+
+def soil_accumulators(n_gids):
+    """Empty running sums for n_gids basins. Their size does not depend on the number of fragments."""
+    return {
+        "area": np.zeros(n_gids, dtype=np.float64),
+        "ksat_area": np.zeros(n_gids, dtype=np.float64),
+        # Area of the fragments that have a ksat value, the denominator of ksat_weighted
+        "ksat_known_area": np.zeros(n_gids, dtype=np.float64),
+        "type_area": np.zeros((n_gids, len(SOIL_TYPE_FIELDS)), dtype=np.float64),
+    }
+
+
+def accumulate_soil_chunk(accumulators, gid_codes, type_codes, ksat, areas):
+    """
+    Adds one chunk of intersect fragments to the running sums. gid_codes index
+    the GID list (-1 for fragments of unknown basins, which are skipped),
+    type_codes index SOIL_TYPE_FIELDS. A fragment with no ksat (NaN) adds to
+    the soil type areas but is left out of the ksat average entirely.
+    """
+    gid_codes = np.asarray(gid_codes, dtype=np.int64)
+    type_codes = np.asarray(type_codes, dtype=np.int64)
+    ksat = np.asarray(ksat, dtype=np.float64)
+    areas = np.asarray(areas, dtype=np.float64)
+
+    known = gid_codes >= 0
+    gid_codes, type_codes, ksat, areas = gid_codes[known], type_codes[known], ksat[known], areas[known]
+
+    n_gids, n_types = accumulators["type_area"].shape
+    accumulators["area"] += np.bincount(gid_codes, weights=areas, minlength=n_gids)
+    has_ksat = ~np.isnan(ksat)
+    accumulators["ksat_area"] += np.bincount(gid_codes[has_ksat], weights=ksat[has_ksat] * areas[has_ksat],
+                                             minlength=n_gids)
+    accumulators["ksat_known_area"] += np.bincount(gid_codes[has_ksat], weights=areas[has_ksat], minlength=n_gids)
+    accumulators["type_area"] += np.bincount(gid_codes * n_types + type_codes, weights=areas,
+                                             minlength=n_gids * n_types).reshape(n_gids, n_types)
+    return accumulators
+
+
+def merge_accumulators(target, other):
+    """Adds the running sums of other into target (for partial results from tiles or workers)."""
+    for key in target:
+        target[key] += other[key]
+    return target
+
+
+def tile_partial_path(partial_folder, tile_path, soil_map_units_shp, basins_list_shp, gids):
+    """
+    Where a tile's saved sums live. The name carries a hash of the tile, soil
+    and basin files (path, size, mtime), the GID list the sums are indexed by
+    and the accumulator names, so sums saved for other inputs are never merged.
+    """
+    tile_name = os.path.splitext(os.path.basename(tile_path))[0]
+    key = source_identity([tile_path, soil_map_units_shp, basins_list_shp],
+                          settings={"gids": [str(gid) for gid in gids], "sums": sorted(soil_accumulators(0))})
+    return os.path.join(partial_folder, f"{tile_name}_{key[:16]}.npz")
+
+
+def remove_stale_partials(partial_folder, partial_paths):
+    """Deletes every saved tile sum in partial_folder that is not one of partial_paths. Returns how many."""
+    keep = set(os.path.basename(path) for path in partial_paths)
+    stale = [name for name in os.listdir(partial_folder) if name.endswith(".npz") and name not in keep]
+    for name in stale:
+        os.remove(os.path.join(partial_folder, name))
+    return len(stale)
+
+
+def soil_results(gids, accumulators):
+    """
+    Turns the running sums into the SoilMapUnits columns: the percentage of each
+    soil type and the ksat weighted by the area that has a ksat value (NaN for
+    a basin with none). Basins without any soil are dropped.
+    Returns (gids, columns).
+    """
+    area = accumulators["area"]
+    present = area > 0
+
+    columns = {}
+    for index, field_name in enumerate(SOIL_TYPE_FIELDS):
+        columns[field_name] = accumulators["type_area"][present, index] / area[present] * 100
+    ksat_known_area = accumulators["ksat_known_area"][present]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["ksat_weighted"] = np.where(ksat_known_area > 0,
+                                            accumulators["ksat_area"][present] / ksat_known_area, np.nan)
+    return [gid for gid, keep in zip(gids, present) if keep], columns
@@ -1,12 +1,49 @@
 import arcpy
 import os
-import time
-from collections import defaultdict
+
+import numpy as np
+
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import count, mark, span, start_trace_from_environment
+from SoilAccumulators import (accumulate_soil_chunk, merge_accumulators, remove_stale_partials, soil_accumulators,
+                              soil_results, soil_type_code, tile_partial_path)
+from SpatialIndex import pruned_overlay_inputs
+from StackedZonal import worker_pool
+from TableWriter import summarize_columns, write_table
+
+# Number of intersect fragments buffered before each vectorized update
+CHUNK_SIZE = 100000
 
 # Enable overwriting of output
 arcpy.env.overwriteOutput = True
 
-def SoilTypeKsat(soil_map_units_shp,basins_list_shp, output_folder):
+def soil_type_ksat_columns(soil_map_units_shp, basins_list_shp, temp_folder):
+    """Soil type area percentages and area-weighted ksat per basin. Returns the GIDs and columns."""
+    # Only soil polygons and basins whose envelopes meet take part in the intersect
+    soil_layer, basin_layer, n_pairs = pruned_overlay_inputs(soil_map_units_shp, basins_list_shp,
+                                                             os.path.join(temp_folder, "index_cache"))
+    gids = basin_gids(basins_list_shp)
+    accumulators = soil_accumulators(len(gids))
+
+    if n_pairs > 0:
+        # Intersect soil map units with basins
+        intersect_output = os.path.join(temp_folder, "intersected.shp")
+        with span("intersect"):
+            arcpy.Intersect_analysis([soil_layer, basin_layer], intersect_output, "ALL", "", "INPUT")
+
+        mark("Intersection completed")
+
+        # Stream the intersect into fixed-size per-GID running sums
+        with span("accumulate"):
+            accumulate_intersect(intersect_output, gids, accumulators)
+
+    mark("Data gathered for calculations")
+    return soil_results(gids, accumulators)
+
+def SoilTypeKsat(soil_map_units_shp,basins_list_shp, output_folder, use_incremental=False, columnar_folder=None,
+                 results_store=None):
 
     # Create output geodatabase and temp folder
     gdb_name = "Soil.gdb"
@@ -18,119 +55,197 @@ def SoilTypeKsat(soil_map_units_shp,basins_list_shp, output_folder):
     if not os.path.exists(temp_folder):
         os.makedirs(temp_folder)
 
-    print("GDB and temp folder created:", time.ctime())  # Track progress
+    mark("GDB and temp folder created")
 
-    # Prepare the output table
+    # The output table is written in one go once the sums are complete
     table_name = "SoilMapUnits"
-    table_path = os.path.join(gdb_path, table_name)
-    if arcpy.Exists(table_path):
-        arcpy.Delete_management(table_path)
-    arcpy.CreateTable_management(gdb_path, table_name)
-    arcpy.AddField_management(table_path, "GID", "TEXT")
 
-    print("Output table prepared:", time.ctime())  # Track progress
+    # With use_incremental only basins that are new or changed since the last run are intersected
+    if use_incremental:
+        gids, columns = incremental_columns(
+            "Soil", basins_list_shp, [soil_map_units_shp],
+            lambda basins: soil_type_ksat_columns(soil_map_units_shp, basins, temp_folder),
+            os.path.join(temp_folder, "result_cache"), results_store=results_store, table_name=table_name)
+    else:
+        gids, columns = soil_type_ksat_columns(soil_map_units_shp, basins_list_shp, temp_folder)
+    summarize_columns(table_name, gids, columns)
+    write_table(gdb_path, table_name, gids, columns)
+    # With columnar_folder the table is also written as Parquet, with results_store upserted into the SQLite store
+    if columnar_folder:
+        export_table(columnar_folder, table_name, gids, columns)
+    if results_store:
+        upsert_columns(results_store, table_name, gids, columns)
+
+    mark("Table populated with data")
+
+
+def basin_gids(basins_list_shp):
+    """Sorted unique GIDs of the basins; their position is the GID code used by the accumulators."""
+    with arcpy.da.SearchCursor(basins_list_shp, ["GID"]) as cursor:
+        return sorted(set(row[0] for row in cursor))
+
+
+def accumulate_intersect(intersect_output, gids, accumulators=None, chunk_size=CHUNK_SIZE):
+    """
+    Reads the intersect output in one streaming pass and adds every chunk of
+    fragments to the per-GID accumulators. Only one chunk of rows is held at a
+    time, so memory does not grow with the number of fragments.
+    """
+    if accumulators is None:
+        accumulators = soil_accumulators(len(gids))
+    gid_index = {gid: index for index, gid in enumerate(gids)}
+    type_index = {}
+
+    chunk = []
+    with arcpy.da.SearchCursor(intersect_output, ["GID", "SoilType", "ksat", "SHAPE@AREA"]) as cursor:
+        for row in cursor:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                accumulate_rows(accumulators, chunk, gid_index, type_index)
+                chunk = []
+    if chunk:
+        accumulate_rows(accumulators, chunk, gid_index, type_index)
+    return accumulators
+
+
+def accumulate_rows(accumulators, rows, gid_index, type_index):
+    """Encodes a chunk of (GID, SoilType, ksat, area) rows and adds it to the accumulators."""
+    count("features_read", len(rows))
+    gid_codes, soil_types, ksat, areas = zip(*rows)
+    for soil_type in set(soil_types) - set(type_index):
+        type_index[soil_type] = soil_type_code(soil_type)
+    accumulate_soil_chunk(accumulators,
+                          [gid_index.get(gid, -1) for gid in gid_codes],
+                          [type_index[soil_type] for soil_type in soil_types],
+                          [float("nan") if value is None else value for value in ksat],
+                          areas)
+
+
+def intersect_tile(tile_path, soil_map_units_shp, basins_list_shp, gids, partial_path):
+    """
+    Intersects the soil inside one tile with the basins touching that tile and
+    saves the tile's per-GID sums to partial_path (see tile_partial_path). The
+    soil is clipped to the tile first, so a soil polygon or basin crossing tile
+    edges is split between tiles and every piece of area is counted exactly
+    once, as long as the tiles do not overlap. Tiles already saved by an earlier
+    run on the same inputs are skipped.
+    """
+    tile_name = os.path.splitext(os.path.basename(tile_path))[0]
+    if os.path.exists(partial_path):
+        return partial_path
+
+    soil_layer = arcpy.management.MakeFeatureLayer(soil_map_units_shp, f"soil_{tile_name}")[0]
+    basin_layer = arcpy.management.MakeFeatureLayer(basins_list_shp, f"basins_{tile_name}")[0]
+    arcpy.management.SelectLayerByLocation(soil_layer, "INTERSECT", tile_path)
+    arcpy.management.SelectLayerByLocation(basin_layer, "INTERSECT", tile_path)
+
+    accumulators = soil_accumulators(len(gids))
+    if int(arcpy.management.GetCount(basin_layer)[0]) > 0:
+        soil_clip = rf"memory\soil_clip_{tile_name}"
+        intersect_output = rf"memory\soil_intersect_{tile_name}"
+        arcpy.analysis.Clip(soil_layer, tile_path, soil_clip)
+        arcpy.Intersect_analysis([soil_clip, basin_layer], intersect_output, "ALL", "", "INPUT")
+        accumulate_intersect(intersect_output, gids, accumulators)
+        arcpy.Delete_management(soil_clip)
+        arcpy.Delete_management(intersect_output)
+
+    arcpy.Delete_management(soil_layer)
+    arcpy.Delete_management(basin_layer)
+
+    # Write under a temporary name so an interrupted tile is redone on resume
+    temp_path = os.path.splitext(partial_path)[0] + ".partial.npz"
+    np.savez(temp_path, **accumulators)
+    os.replace(temp_path, partial_path)
+    return partial_path
+
+
+def SoilTypeKsatByTile(soil_map_units_shp, basins_list_shp, tiles_folder, output_folder, workers=1,
+                       columnar_folder=None, results_store=None):
+    """
+    Partitioned version of SoilTypeKsat: one intersect per tile in tiles_folder
+    (for example the DEM extent tiles), run in a pool of worker processes. The
+    per-tile sums are merged in tile order. Completed tiles are kept in
+    soil_temp/tiles, so a stopped run resumes where it left off; sums saved for
+    other soil, basin or tile files are deleted first.
+    """
+    gdb_name = "Soil.gdb"
+    gdb_path = os.path.join(output_folder, gdb_name)
+    partial_folder = os.path.join(output_folder, "soil_temp", "tiles")
+    scratch_root = os.path.join(output_folder, "soil_temp", "scratch")
+    if not os.path.exists(partial_folder):
+        os.makedirs(partial_folder)
+    if not arcpy.Exists(gdb_path):
+        arcpy.CreateFileGDB_management(output_folder, gdb_name)
 
-    # Intersect soil map units with basins
-    intersect_output = os.path.join(temp_folder, "intersected.shp")
-    arcpy.Intersect_analysis([soil_map_units_shp, basins_list_shp], intersect_output, "ALL", "", "INPUT")
+    gids = basin_gids(basins_list_shp)
+    tiles = sorted(os.path.join(tiles_folder, f) for f in os.listdir(tiles_folder) if f.endswith(".shp"))
+    mark(f"{len(tiles)} tiles, {len(gids)} basins, {workers} workers")
 
-    print("Intersection completed:", time.ctime())  # Track progress
+    partial_paths = [tile_partial_path(partial_folder, tile, soil_map_units_shp, basins_list_shp, gids)
+                     for tile in tiles]
+    removed = remove_stale_partials(partial_folder, partial_paths)
+    if removed:
+        mark(f"{removed} tile sums from other inputs removed")
 
-    # Calculate area of each intersected feature
-    arcpy.AddField_management(intersect_output, "Area", "DOUBLE")
-    arcpy.CalculateField_management(intersect_output, "Area", "!shape.area@squaremeters!", "PYTHON3")
+    with worker_pool(workers, scratch_root) as executor:
+        futures = [executor.submit(intersect_tile, tile, soil_map_units_shp, basins_list_shp, gids, partial_path)
+                   for tile, partial_path in zip(tiles, partial_paths)]
+        for future in futures:
+            future.result()
 
-    print("Area calculated:", time.ctime())  # Track progress
+    mark("Tiles intersected")
 
-    # Gather data for calculations
-    data = defaultdict(lambda: defaultdict(list))
-    with arcpy.da.SearchCursor(intersect_output, ["GID", "SoilType", "ksat", "Area"]) as cursor:
-        for row in cursor:
-            gid, soil_type, ksat, area = row
+    accumulators = soil_accumulators(len(gids))
+    for partial_path in partial_paths:
+        with np.load(partial_path) as partial:
+            merge_accumulators(accumulators, {key: partial[key] for key in accumulators})
 
-            data[gid]['ksat'].append(ksat * area)
-            data[gid][soil_type].append(area)
+    table_name = "SoilMapUnits"
+    gids, columns = soil_results(gids, accumulators)
+    summarize_columns(table_name, gids, columns)
+    write_table(gdb_path, table_name, gids, columns)
+    if columnar_folder:
+        export_table(columnar_folder, table_name, gids, columns)
+    if results_store:
+        upsert_columns(results_store, table_name, gids, columns)
 
-    print("Data gathered for calculations:", time.ctime())  # Track progress
+    mark("Table populated with data")
 
-    # Calculate statistics
-    results = {}
-    for gid, values in data.items():
-        total_area = sum([sum(values[soil_type]) for soil_type in values if soil_type != 'ksat'])
-        soil_type_percentages = {soil_type: (sum(values[soil_type]) / total_area * 100) for soil_type in values if soil_type != 'ksat'}
-        ksat_weighted_sum = sum(values['ksat']) / total_area
-        results[gid] = {'soil_type_percentages': soil_type_percentages, 'ksat_weighted_sum': ksat_weighted_sum}
 
-    print("Statistics calculated:", time.ctime())  # Track progress
-    print("Results are", results)
+if __name__ == "__main__":
+    # Inputs
 
-    # Before adding fields, create a list of field names to be added to the table
-    unique_soil_types = set(soil_type for gid in results for soil_type in results[gid]['soil_type_percentages'])
+    soil_map_units_shp = arcpy.GetParameterAsText(0)  # 'SoilMapUnits.shp'
+    basins_list_shp = arcpy.GetParameterAsText(1)    # 'basins_list.shp'
+    output_folder = arcpy.GetParameterAsText(2)      # Output folder for gdb and temp files
+    tiles_folder = arcpy.GetParameterAsText(3)       # Optional folder of tile shapefiles to partition the intersect by
+    workers = int(arcpy.GetParameterAsText(4) or 1)  # Worker processes for the partitioned intersect
 
-    # Update field names list to include the desired field names
-    field_names = ["GID"]  # Start with GID and OtherSoilType
-    print("unique_soil_types are", unique_soil_types)
     '''
-    for soil_type in unique_soil_types:
-        if soil_type != ' ':
-            field_name = f"{soil_type}"
-            field_names.append(field_name)  # Remove SoilType_ prefix for other types
-    field_names.append("ksat_weighted")  # Add ksat_weighted field
+    soil_map_units_shp = r'U:\1937\193709666\03_data\gis_cad\gis\Basin_Characteristics\SourceData\SoilsMapUnits\Soils_1025.shp'  # 'SoilMapUnits.shp'
+    basins_list_shp = r'U:\1937\193709666\03_data\gis_cad\gis\Basin_Characteristics_Testing\Testing_Dataset\PreProcessing_1025\basins_final_merge.shp'    # 'basins_list.shp'
+    output_folder = r'U:\1937\193709666\03_data\gis_cad\gis\Basin_Characteristics_Testing\Testing_Dataset\Soil'
     '''
-    
-    # Adding soil types fields
-    Soil_Type_fields = ['SoilType_A', 'SoilType_B', 'SoilType_C', 'SoilType_D', 'SoilType_A_D', 'SoilType_B_D', 'SoilType_C_D', 'OtherSoilTypes']
-
-    for field_name in Soil_Type_fields:  # Skip 'GID' as it's already added
-        arcpy.AddField_management(table_path, field_name, "DOUBLE")
-
-    # Add ksat_weighted field
-    arcpy.AddField_management(table_path, "ksat_weighted", "DOUBLE")
-    
-    print("Fields added to table:", time.ctime())  # Track progress
-
-    # Populate the table
-    with arcpy.da.InsertCursor(table_path, field_names) as cursor:
-        for gid, stats in results.items():
-            row = [gid]
-            for soil_type in unique_soil_types:
-                row.append(stats['soil_type_percentages'].get(soil_type, 0))
-            row.append(stats['ksat_weighted_sum'])  # Add ksat_weighted sum for each GID
-            cursor.insertRow(row)
-
-    print("Table populated with data:", time.ctime())  # Track progress
-    
-    # Update rows where soil type fields are not in the unique soil types
-    with arcpy.da.UpdateCursor(table_path, Soil_Type_fields) as cursor:
-        for row in cursor:
-            for i in range(len(row)):
-                if Soil_Type_fields[i] not in unique_soil_types:
-                    row[i] = 0  # Fill with 0 if soil type field not in unique soil types
-            cursor.updateRow(row)
-
-    print("Filled missing soil type fields with 0:", time.ctime())  # Track progress
-
-
-# Inputs
-
-soil_map_units_shp = arcpy.GetParameterAsText(0)  # 'SoilMapUnits.shp'
-basins_list_shp = arcpy.GetParameterAsText(1)    # 'basins_list.shp'
-output_folder = arcpy.GetParameterAsText(2)      # Output folder for gdb and temp files
 
-'''
-soil_map_units_shp = r'U:\1937\193709666\03_data\gis_cad\gis\Basin_Characteristics\SourceData\SoilsMapUnits\Soils_1025.shp'  # 'SoilMapUnits.shp'
-basins_list_shp = r'U:\1937\193709666\03_data\gis_cad\gis\Basin_Characteristics_Testing\Testing_Dataset\PreProcessing_1025\basins_final_merge.shp'    # 'basins_list.shp'
-output_folder = r'U:\1937\193709666\03_data\gis_cad\gis\Basin_Characteristics_Testing\Testing_Dataset\Soil'
-'''
+    start_trace_from_environment("SoilMapUnits")
+    mark("Start")
 
-print("Start:", time.ctime())  # Track progress
+    # Create soil folder
 
-# Create soil folder
+    soil_folder = os.path.join(output_folder, "Soil")
 
-soil_folder = os.path.join(output_folder, "Soil")
+    if not os.path.exists(soil_folder):
+        os.makedirs(soil_folder)
 
-if not os.path.exists(soil_folder):
-    os.makedirs(soil_folder)
+    # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+    columnar_folder = os.path.join(output_folder, "columnar")
+    # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+    results_store = os.path.join(output_folder, STORE_NAME)
         
-SoilTypeKsat(soil_map_units_shp,basins_list_shp, soil_folder)
-arcpy.AddMessage("Processing completed successfully.")
\ No newline at end of file
+    if tiles_folder:
+        SoilTypeKsatByTile(soil_map_units_shp, basins_list_shp, tiles_folder, soil_folder, workers, columnar_folder,
+                           results_store)
+    else:
+        SoilTypeKsat(soil_map_units_shp,basins_list_shp, soil_folder, use_incremental=True,
+                     columnar_folder=columnar_folder, results_store=results_store)
+    arcpy.AddMessage("Processing completed successfully.")
@@ -0,0 +1,282 @@
+#-------------------------------------------------------------------------------
+# Name:        SpatialIndex.py
+# Purpose:     Packed STR-tree over feature bounding boxes held in NumPy arrays,
+#              with a bulk query that returns every (basin, source feature) pair
+#              whose envelopes overlap. Used to hand the overlays only the
+#              source features and basins that can possibly intersect.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import math
+import os
+
+import numpy as np
+
+from RunTrace import span
+from ZoneLabels import dataset_hash
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+# Children per tree node
+NODE_CAPACITY = 16
+# Query boxes processed per step of a bulk query, to bound the candidate arrays
+QUERY_CHUNK = 4096
+
+
+def str_order(boxes, node_capacity):
+    """
+    Sort-Tile-Recursive order of boxes: vertical slabs by centre x, then centre
+    y within each slab, so every run of node_capacity boxes is spatially tight.
+    """
+    n = len(boxes)
+    n_nodes = int(math.ceil(n / float(node_capacity)))
+    n_slabs = int(math.ceil(math.sqrt(n_nodes)))
+    slab_size = n_slabs * node_capacity
+
+    center_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    center_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    by_x = np.argsort(center_x, kind="stable")
+
+    order = np.empty(n, dtype=np.int64)
+    for start in range(0, n, slab_size):
+        slab = by_x[start:start + slab_size]
+        order[start:start + len(slab)] = slab[np.argsort(center_y[slab], kind="stable")]
+    return order
+
+
+def group_bounds(boxes, node_capacity):
+    """Bounding box of every consecutive run of node_capacity boxes, and the runs' start/end."""
+    starts = np.arange(0, len(boxes), node_capacity)
+    ends = np.minimum(starts + node_capacity, len(boxes))
+    bounds = np.column_stack([
+        np.minimum.reduceat(boxes[:, 0], starts),
+        np.minimum.reduceat(boxes[:, 1], starts),
+        np.maximum.reduceat(boxes[:, 2], starts),
+        np.maximum.reduceat(boxes[:, 3], starts),
+    ])
+    return bounds, starts, ends
+
+
+def build_str_tree(boxes, node_capacity=NODE_CAPACITY):
+    """
+    Bulk-loads a packed STR-tree from an (n, 4) array of xmin, ymin, xmax, ymax.
+    Returns a dict of arrays: the boxes, the item order of the leaves, and for
+    each level (leaves first) the node boxes and the [start, end) range of
+    their children in the level below (in item_order for the leaves).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    item_order = str_order(boxes, node_capacity) if len(boxes) else np.zeros(0, dtype=np.int64)
+
+    levels = []
+    node_boxes, starts, ends = group_bounds(boxes[item_order], node_capacity) if len(boxes) else \
+        (np.zeros((0, 4)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    while len(node_boxes) > node_capacity:
+        # Reorder this level so each parent's children are contiguous, then group it
+        order = str_order(node_boxes, node_capacity)
+        node_boxes, starts, ends = node_boxes[order], starts[order], ends[order]
+        levels.append((node_boxes, starts, ends))
+        node_boxes, starts, ends = group_bounds(node_boxes, node_capacity)
+    levels.append((node_boxes, starts, ends))
+
+    return {"boxes": boxes, "item_order": item_order, "node_capacity": node_capacity, "levels": levels}
+
+
+def boxes_overlap(a, b):
+    """Row-wise envelope overlap test of two (n, 4) arrays (touching counts as overlap)."""
+    return (a[:, 0] <= b[:, 2]) & (a[:, 2] >= b[:, 0]) & (a[:, 1] <= b[:, 3]) & (a[:, 3] >= b[:, 1])
+
+
+def expand_ranges(starts, ends):
+    """Returns (owner, index) for every index in each [start, end) range, owner being the range's position."""
+    counts = ends - starts
+    owner = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, np.repeat(starts, counts) + offsets
+
+
+def query_pairs(tree, query_boxes, query_chunk=QUERY_CHUNK):
+    """
+    Returns (query_index, feature_index) for every query box and tree box whose
+    envelopes overlap, walking the tree top-down for all query boxes at once.
+    """
+    query_boxes = np.asarray(query_boxes, dtype=np.float64).reshape(-1, 4)
+    levels = tree["levels"]
+    found_queries, found_features = [], []
+
+    for chunk_start in range(0, len(query_boxes), query_chunk):
+        chunk = query_boxes[chunk_start:chunk_start + query_chunk]
+
+        # Start from every (query, root node) pair
+        root_boxes = levels[-1][0]
+        queries = np.repeat(np.arange(len(chunk)), len(root_boxes))
+        nodes = np.tile(np.arange(len(root_boxes)), len(chunk))
+
+        for level in range(len(levels) - 1, -1, -1):
+            node_boxes, starts, ends = levels[level]
+            keep = boxes_overlap(chunk[queries], node_boxes[nodes])
+            queries, nodes = queries[keep], nodes[keep]
+            owner, children = expand_ranges(starts[nodes], ends[nodes])
+            queries, nodes = queries[owner], children
+
+        # nodes now index item_order; test the feature boxes themselves
+        features = tree["item_order"][nodes]
+        keep = boxes_overlap(chunk[queries], tree["boxes"][features])
+        found_queries.append(queries[keep] + chunk_start)
+        found_features.append(features[keep])
+
+    if not found_queries:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(found_queries), np.concatenate(found_features)
+
+
+def brute_force_pairs(query_boxes, boxes, query_chunk=256):
+    """Reference answer for query_pairs: every query box tested against every box."""
+    query_boxes = np.asarray(query_boxes, dtype=np.float64).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    found_queries, found_features = [], []
+    for chunk_start in range(0, len(query_boxes), query_chunk):
+        chunk = query_boxes[chunk_start:chunk_start + query_chunk]
+        overlap = ((chunk[:, np.newaxis, 0] <= boxes[:, 2]) & (chunk[:, np.newaxis, 2] >= boxes[:, 0]) &
+                   (chunk[:, np.newaxis, 1] <= boxes[:, 3]) & (chunk[:, np.newaxis, 3] >= boxes[:, 1]))
+        queries, features = np.nonzero(overlap)
+        found_queries.append(queries + chunk_start)
+        found_features.append(features)
+    if not found_queries:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(found_queries), np.concatenate(found_features)
+
+
+def save_str_tree(tree, path, **extra):
+    """Writes the tree (and any extra arrays, such as feature ids) to an .npz file."""
+    arrays = {"boxes": tree["boxes"], "item_order": tree["item_order"],
+              "node_capacity": np.array(tree["node_capacity"]), "n_levels": np.array(len(tree["levels"]))}
+    for level, (node_boxes, starts, ends) in enumerate(tree["levels"]):
+        arrays[f"level{level}_boxes"] = node_boxes
+        arrays[f"level{level}_starts"] = starts
+        arrays[f"level{level}_ends"] = ends
+    arrays.update(extra)
+    np.savez(path, **arrays)
+
+
+def load_str_tree(path):
+    """Reads a tree written by save_str_tree. Returns (tree, dict of the extra arrays)."""
+    with np.load(path) as data:
+        levels = [(data[f"level{level}_boxes"], data[f"level{level}_starts"], data[f"level{level}_ends"])
+                  for level in range(int(data["n_levels"]))]
+        tree = {"boxes": data["boxes"], "item_order": data["item_order"],
+                "node_capacity": int(data["node_capacity"]), "levels": levels}
+        known = set(["boxes", "item_order", "node_capacity", "n_levels"]) | \
+            set(f"level{level}_{part}" for level in range(len(levels)) for part in ["boxes", "starts", "ends"])
+        extra = {key: data[key] for key in data.files if key not in known}
+    return tree, extra
+
+
+def feature_envelopes(feature_class, spatial_reference=None):
+    """Returns the OIDs and an (n, 4) array of envelopes of every feature."""
+    oids, boxes = [], []
+    with arcpy.da.SearchCursor(feature_class, ["OID@", "SHAPE@"], spatial_reference=spatial_reference) as cursor:
+        for oid, shape in cursor:
+            if shape is None:
+                continue
+            extent = shape.extent
+            oids.append(oid)
+            boxes.append((extent.XMin, extent.YMin, extent.XMax, extent.YMax))
+    return np.array(oids, dtype=np.int64), np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def cached_source_index(source_fc, cache_folder, spatial_reference=None):
+    """
+    STR-tree of a source layer's feature envelopes, stored in cache_folder and
+    keyed by the layer's content hash so it is rebuilt only when the data change.
+    Returns (tree, oids).
+    """
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    reference_name = spatial_reference.name if spatial_reference is not None else ""
+    index_path = os.path.join(cache_folder, f"strtree_{dataset_hash(source_fc)}_{reference_name}.npz")
+
+    if os.path.exists(index_path):
+        tree, extra = load_str_tree(index_path)
+        return tree, extra["oids"]
+
+    oids, boxes = feature_envelopes(source_fc, spatial_reference)
+    tree = build_str_tree(boxes)
+    save_str_tree(tree, index_path, oids=oids)
+    return tree, oids
+
+
+def oid_ranges(oids):
+    """Runs of consecutive values in the unique OIDs. Returns (starts, ends), both inclusive."""
+    oids = np.unique(np.asarray(oids, dtype=np.int64))
+    if not len(oids):
+        return oids, oids
+    breaks = np.nonzero(np.diff(oids) != 1)[0] + 1
+    return oids[np.r_[0, breaks]], oids[np.r_[breaks - 1, len(oids) - 1]]
+
+
+def oid_where_clause(oid_field, oids):
+    """
+    One where clause matching exactly the given OIDs: a range test per run of
+    consecutive OIDs and a single IN list for the OIDs that stand alone.
+    Returns (clause, number of terms).
+    """
+    starts, ends = oid_ranges(oids)
+    runs = starts != ends
+    terms = [f"({oid_field} >= {start} AND {oid_field} <= {end})" for start, end in zip(starts[runs], ends[runs])]
+    singles = starts[~runs]
+    if len(singles):
+        terms.append(f"{oid_field} IN ({','.join(str(int(oid)) for oid in singles)})")
+    return " OR ".join(terms) or f"{oid_field} < 0", len(starts)
+
+
+def selection_clause(oid_field, oids, all_oids=None):
+    """
+    The shorter of the clauses selecting oids directly or selecting the other
+    features of all_oids and inverting. Returns (clause, invert).
+    """
+    clause, n_terms = oid_where_clause(oid_field, oids)
+    if all_oids is not None:
+        other_clause, n_other_terms = oid_where_clause(oid_field, np.setdiff1d(all_oids, oids))
+        if n_other_terms < n_terms:
+            return other_clause, True
+    return clause, False
+
+
+def select_oids(layer, oids, all_oids=None):
+    """
+    Selects the given OIDs on a feature layer in a single selection. Consecutive
+    OIDs become range tests and, when all_oids (every OID of the layer) is
+    given, the features left out are selected and inverted if that takes fewer
+    terms. An empty selection means "all features" to geoprocessing tools, so
+    callers must not run an overlay when oids is empty.
+    """
+    oid_field = arcpy.Describe(layer).OIDFieldName
+    clause, invert = selection_clause(oid_field, oids, all_oids)
+    arcpy.management.SelectLayerByAttribute(layer, "NEW_SELECTION", clause, "INVERT" if invert else "NON_INVERT")
+    return layer
+
+
+def pruned_overlay_inputs(source_fc, basins_fc, cache_folder):
+    """
+    Feature layers of the source features and basins that take part in at least
+    one candidate (basin, feature) pair, so the overlay skips everything else.
+    Envelopes are compared in the source's coordinate system.
+    Returns (source_layer, basin_layer, number of candidate pairs).
+    """
+    spatial_reference = arcpy.Describe(source_fc).spatialReference
+    with span("prune_overlay_inputs"):
+        tree, source_oids = cached_source_index(source_fc, cache_folder)
+        basin_oids, basin_boxes = feature_envelopes(basins_fc, spatial_reference)
+        basin_index, feature_index = query_pairs(tree, basin_boxes)
+
+    source_layer = arcpy.management.MakeFeatureLayer(source_fc, "pruned_source")[0]
+    basin_layer = arcpy.management.MakeFeatureLayer(basins_fc, "pruned_basins")[0]
+    select_oids(source_layer, source_oids[feature_index], source_oids)
+    select_oids(basin_layer, basin_oids[basin_index], basin_oids)
+    print(f"{len(basin_index)} candidate basin/feature pairs, "
+          f"{len(np.unique(feature_index))} of {len(source_oids)} source features kept")
+    return source_layer, basin_layer, len(basin_index)
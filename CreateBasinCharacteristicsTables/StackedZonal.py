@@ -0,0 +1,219 @@
+#-------------------------------------------------------------------------------
+# Name:        StackedZonal.py
+# Purpose:     Zonal means of many co-registered rasters in one block-streamed
+#              pass, instead of one ZonalStatisticsAsTable run per raster.
+#              The pass can be split into raster x row-band units and fanned out
+#              to a process pool.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import math
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from RasterBlocks import block_windows, grid_rows, raster_grid
+from RasterCache import cached_raster, window_reader
+from RunTrace import count, span
+from ZonalStatistics import zonal_means, zonal_sum_count
+from ZoneLabels import grid_key
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+
+def raster_field_name(raster, length=8):
+    """Field name of a raster's column, the first 8 characters of its file name as in the dbf workflow."""
+    return os.path.splitext(os.path.basename(raster))[0][0:length]
+
+
+def raster_field_names(rasters, length=8, renames=None):
+    """
+    Field names of the rasters' columns: the 8-character names of the dbf
+    workflow (`length` characters for tools whose legacy names were longer)
+    where they are unique, otherwise the whole file name (non-word characters
+    as "_"), so rasters such as PRISM_ppt_... and PRISM_pptx... do not
+    overwrite each other. renames maps a unique short name to the reported
+    field name. Raises ValueError if names still collide.
+    """
+    short_names = [raster_field_name(raster, length) for raster in rasters]
+    renames = renames or {}
+    names = []
+    for raster, short_name in zip(rasters, short_names):
+        if short_names.count(short_name) == 1:
+            names.append(renames.get(short_name, short_name))
+        else:
+            names.append(re.sub(r"\W", "_", os.path.splitext(os.path.basename(raster))[0]))
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError(f"Rasters with the same field name: {duplicates}")
+    return names
+
+
+def check_coregistered(grids, rasters):
+    """Raises ValueError if the rasters do not share the same grid."""
+    reference = grid_key(grids[0])
+    for grid, raster in zip(grids[1:], rasters[1:]):
+        if grid_key(grid) != reference:
+            raise ValueError(f"{raster} is not on the same grid as {rasters[0]}")
+
+
+def stacked_zonal_sums(rasters, nodata_values, zones, zone_grid, n_zones, max_memory_mb=1024,
+                       raster_cache_folder=None, readers=None):
+    """
+    Streams every raster over zone_grid window by window and accumulates per-zone
+    sums and data-cell counts for all of them in the same pass. With
+    raster_cache_folder the windows are views of the memory-mapped raster cache.
+    readers, one read_window(row0, col0, nrows, ncols) per raster, replaces
+    reading the rasters themselves.
+    Returns (sums, counts), each shaped (len(rasters), n_zones).
+    """
+    sums = np.zeros((len(rasters), n_zones), dtype=np.float64)
+    counts = np.zeros((len(rasters), n_zones), dtype=np.int64)
+
+    # Per cell: one float window per raster is read at a time plus the zone layers and temporaries
+    bytes_per_cell = 8 + 4 * zones.shape[0] + 24
+    if readers is None:
+        readers = [window_reader(raster, zone_grid, raster_cache_folder, max_memory_mb) for raster in rasters]
+    for row0, col0, nrows, ncols in block_windows(zone_grid, max_memory_mb, bytes_per_cell):
+        zone_block = zones[:, row0:row0 + nrows, col0:col0 + ncols]
+        for index, read_window in enumerate(readers):
+            block = read_window(row0, col0, nrows, ncols)
+            zonal_sum_count(block, zone_block, n_zones, nodata_values[index], sums[index], counts[index])
+            count("pixels_scanned", block.size)
+
+    return sums, counts
+
+
+def zonal_units(n_rasters, zone_grid, workers):
+    """
+    Splits the work into about two units per worker: groups of rasters times
+    bands of whole block rows. Returns a list of (raster_indices, row0, nrows),
+    empty when there are no rasters.
+    """
+    if n_rasters == 0:
+        return []
+    n_groups = min(workers, n_rasters)
+    n_bands = max(1, int(math.ceil(2.0 * workers / n_groups)))
+
+    block_rows = zone_grid.get("block_rows") or 1
+    band_rows = int(math.ceil(zone_grid["rows"] / float(n_bands) / block_rows)) * block_rows
+    band_rows = max(band_rows, block_rows)
+
+    groups = [list(indices) for indices in np.array_split(np.arange(n_rasters), n_groups)]
+    units = []
+    for group in groups:
+        for row0 in range(0, zone_grid["rows"], band_rows):
+            units.append((group, row0, min(band_rows, zone_grid["rows"] - row0)))
+    return units
+
+
+def init_worker(scratch_root):
+    """
+    Gives each worker process its own scratch directory and arcpy environment,
+    so workers never share arcpy.env or temp files.
+    """
+    scratch = tempfile.mkdtemp(prefix=f"worker_{os.getpid()}_", dir=scratch_root)
+    os.environ["TMP"] = os.environ["TEMP"] = os.environ["TMPDIR"] = scratch
+    tempfile.tempdir = scratch
+    if arcpy is not None:
+        arcpy.env.scratchWorkspace = scratch
+        arcpy.env.workspace = scratch
+        arcpy.env.overwriteOutput = True
+
+
+@contextmanager
+def worker_pool(workers, scratch_root):
+    """
+    A process pool whose workers get their scratch directories (init_worker)
+    in a folder made for this run under scratch_root. The folder is removed
+    once the pool has shut down.
+    """
+    if not os.path.exists(scratch_root):
+        os.makedirs(scratch_root)
+    run_scratch = tempfile.mkdtemp(prefix="run_", dir=scratch_root)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(run_scratch,)) as executor:
+            yield executor
+    finally:
+        shutil.rmtree(run_scratch, ignore_errors=True)
+
+
+def run_zonal_unit(unit_index, rasters, nodata_values, zone_path, zone_grid, row0, nrows, n_zones, max_memory_mb,
+                   raster_cache_folder=None):
+    """Runs one raster group over one row band. Returns (unit_index, sums, counts)."""
+    zones = np.load(zone_path, mmap_mode="r")[:, row0:row0 + nrows, :]
+    band = grid_rows(zone_grid, row0, nrows)
+    sums, counts = stacked_zonal_sums(rasters, nodata_values, zones, band, n_zones, max_memory_mb,
+                                      raster_cache_folder)
+    return unit_index, sums, counts
+
+
+def parallel_stacked_zonal_sums(rasters, nodata_values, zone_path, zone_grid, n_zones, workers, scratch_root,
+                                max_memory_mb=1024, raster_cache_folder=None):
+    """
+    Same result as stacked_zonal_sums, computed by a pool of worker processes.
+    Partial sums are merged in unit order so the totals do not depend on which
+    worker finishes first. The memory ceiling is shared between the workers.
+    """
+    units = zonal_units(len(rasters), zone_grid, workers)
+    worker_memory_mb = max_memory_mb / float(workers)
+    with worker_pool(workers, scratch_root) as executor:
+        futures = []
+        for unit_index, (group, row0, nrows) in enumerate(units):
+            futures.append(executor.submit(run_zonal_unit, unit_index, [rasters[i] for i in group],
+                                           [nodata_values[i] for i in group], zone_path, zone_grid, row0, nrows,
+                                           n_zones, worker_memory_mb, raster_cache_folder))
+        results = sorted((future.result() for future in futures), key=lambda result: result[0])
+
+    sums = np.zeros((len(rasters), n_zones), dtype=np.float64)
+    counts = np.zeros((len(rasters), n_zones), dtype=np.int64)
+    for unit_index, unit_sums, unit_counts in results:
+        group = units[unit_index][0]
+        sums[group] += unit_sums
+        counts[group] += unit_counts
+    return sums, counts
+
+
+def stacked_zonal_means(rasters, zones, zone_grid, n_zones, max_memory_mb=1024, workers=1, scratch_root=None,
+                        raster_cache_folder=None):
+    """
+    Zonal mean of every raster per zone from a single pass over the rasters.
+    With workers > 1 the pass is split across a process pool; zones must then be
+    the memory-mapped array from the zone-label cache so workers can open it.
+    With raster_cache_folder the rasters are read from the memory-mapped raster
+    cache, converted here first so workers never convert the same raster.
+    Returns a dict of field name -> mean array (NaN where a zone has no data).
+    """
+    if not rasters:
+        return {}
+    names = raster_field_names(rasters)
+    if raster_cache_folder:
+        grids = [cached_raster(raster, raster_cache_folder, max_memory_mb)[0] for raster in rasters]
+    else:
+        grids = [raster_grid(raster) for raster in rasters]
+    check_coregistered(grids, rasters)
+
+    nodata_values = [grid["nodata"] for grid in grids]
+    with span("stacked_zonal_sums", rasters=len(rasters), zones=n_zones, workers=workers):
+        if workers > 1:
+            sums, counts = parallel_stacked_zonal_sums(rasters, nodata_values, zones.filename, zone_grid, n_zones,
+                                                       workers, scratch_root or tempfile.gettempdir(), max_memory_mb,
+                                                       raster_cache_folder)
+            # Workers do not trace; count their pixels here
+            count("pixels_scanned", len(rasters) * zone_grid["rows"] * zone_grid["cols"])
+        else:
+            sums, counts = stacked_zonal_sums(rasters, nodata_values, zones, zone_grid, n_zones, max_memory_mb,
+                                              raster_cache_folder)
+
+    columns = {}
+    for index, name in enumerate(names):
+        columns[name] = zonal_means(sums[index], counts[index])
+    return columns
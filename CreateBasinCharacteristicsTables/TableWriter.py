@@ -0,0 +1,81 @@
+#-------------------------------------------------------------------------------
+# Name:        TableWriter.py
+# Purpose:     Columnar basin characteristic results (a GID index plus one NumPy
+#              array per column) and a bulk writer for geodatabase tables
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+
+from RunTrace import count, span
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+
+def columns_to_records(gids, columns):
+    """
+    Packs a GID index and a dict of column name -> array into one structured
+    array: GID as text, every other column as float64 (NaN for missing).
+    """
+    gid_length = max([len(str(gid)) for gid in gids] + [1])
+    dtype = [("GID", f"<U{gid_length}")] + [(name, np.float64) for name in columns]
+    records = np.zeros(len(gids), dtype=dtype)
+    records["GID"] = [str(gid) for gid in gids]
+    for name, values in columns.items():
+        records[name] = np.asarray(values, dtype=np.float64)
+    return records
+
+
+def align_columns(gids_by_column, values_by_column):
+    """
+    Builds a columnar result from columns that each come with their own GID
+    list. Returns the sorted union of GIDs and a dict of aligned arrays.
+    """
+    gids = sorted(set(gid for column_gids in gids_by_column.values() for gid in column_gids))
+    index = {gid: position for position, gid in enumerate(gids)}
+
+    columns = {}
+    for name, column_gids in gids_by_column.items():
+        column = np.full(len(gids), np.nan)
+        positions = np.array([index[gid] for gid in column_gids], dtype=np.int64)
+        column[positions] = np.asarray(values_by_column[name], dtype=np.float64)
+        columns[name] = column
+    return gids, columns
+
+
+def summarize_columns(table_name, gids, columns):
+    """Prints a one-screen summary of a result instead of one line per value."""
+    print(f"{table_name}: {len(gids)} basins x {len(columns)} columns")
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=np.float64)
+        missing = int(np.isnan(values).sum())
+        if missing == len(values):
+            print(f"  {name}: all missing")
+            continue
+        print(f"  {name}: min {np.nanmin(values):.4g}  mean {np.nanmean(values):.4g}  "
+              f"max {np.nanmax(values):.4g}  missing {missing}")
+
+
+def write_table(gdb_path, table_name, gids, columns):
+    """
+    Writes the result as gdb_path/table_name in one bulk operation. The schema
+    comes from the structured array, so every field exists before any row is
+    written, and an existing table is replaced.
+    """
+    if not arcpy.Exists(gdb_path):
+        arcpy.CreateFileGDB_management(os.path.dirname(gdb_path), os.path.basename(gdb_path))
+
+    table_path = os.path.join(gdb_path, table_name)
+    if arcpy.Exists(table_path):
+        arcpy.Delete_management(table_path)
+
+    with span("write_table", table=table_name, rows=len(gids)):
+        records = columns_to_records(gids, columns)
+        arcpy.da.NumPyArrayToTable(records, table_path)
+    count("bytes_written", records.nbytes)
+    return table_path
@@ -1,17 +1,24 @@
 import arcpy
 import os
-import time
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+import numpy as np
 
+from ColumnarExport import export_table
+from IncrementalCache import incremental_columns
+from OverlayAggregation import group_fragment_areas, mismatched_totals
+from ResultsStore import STORE_NAME, upsert_columns
+from RunTrace import count, mark, span, start_trace_from_environment
+from SpatialIndex import pruned_overlay_inputs
+from TableWriter import summarize_columns, write_table
 
 # Check Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
 # Enable overwriting of output files
 arcpy.env.overwriteOutput = True
 
+# Basin attributes the percentages are computed from, hashed with the geometry by the result cache
+BASIN_ATTRIBUTE_FIELDS = ["TDA_SqMi"]
+
 
 def batch_clip(input_wetland, input_clip_polygon, output_directory):
     """
@@ -36,10 +43,11 @@ def batch_clip(input_wetland, input_clip_polygon, output_directory):
         for row in cursor:
             gage_id = row[0]
             query = f"GID = '{gage_id}'"
-            arcpy.SelectLayerByAttribute_management(clip_polygon_layer, "NEW_SELECTION", query)
-            
-            output_shapefile = os.path.join(clip_subfolder, f"{gage_id}_Wetland.shp")
-            arcpy.analysis.Clip(input_wetland, clip_polygon_layer, output_shapefile)
+            with span("clip", "basin", gid=gage_id):
+                arcpy.SelectLayerByAttribute_management(clip_polygon_layer, "NEW_SELECTION", query)
+
+                output_shapefile = os.path.join(clip_subfolder, f"{gage_id}_Wetland.shp")
+                arcpy.analysis.Clip(input_wetland, clip_polygon_layer, output_shapefile)
             print(f"Clipped and saved: {output_shapefile}")
     
     arcpy.SelectLayerByAttribute_management(clip_polygon_layer, "CLEAR_SELECTION")
@@ -61,7 +69,8 @@ def batch_dissolve(input_folder, output_folder):
             output_shapefile = os.path.join(output_folder, f"{os.path.splitext(shapefile)[0]}_dissolved.shp")
             
             # Perform dissolve
-            arcpy.management.Dissolve(input_shapefile, output_shapefile, "TYPE")
+            with span("dissolve", "basin", gid=shapefile.split('_')[0]):
+                arcpy.management.Dissolve(input_shapefile, output_shapefile, "TYPE")
             print(f"Dissolved and saved: {output_shapefile}")
     
     except arcpy.ExecuteError:
@@ -99,6 +108,9 @@ def create_national_wetland_table(basin_shapefile, output_gdb, dissolve_folder):
         arcpy.AddField_management(national_wetland_table, "GID", "TEXT")
         arcpy.AddField_management(national_wetland_table, "Wetland_Pctg", "DOUBLE")
         arcpy.AddField_management(national_wetland_table, "LakePond_Pctg", "DOUBLE")
+    else:
+        # Empty the table left by an earlier run, so a rerun does not insert every GID again
+        arcpy.TruncateTable_management(national_wetland_table)
 
     # Get a list of shapefiles in the dissolve folder
     dissolve_shapefiles = [f for f in os.listdir(dissolve_folder) if f.endswith(".shp")]
@@ -153,55 +165,192 @@ def create_national_wetland_table(basin_shapefile, output_gdb, dissolve_folder):
     print("Process completed successfully.")
 
 
-basin_shapefile = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Input_Basins\1012\basins_final_merge.shp"
-wetland_shapefile = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Wetland_Local\Processed\reproject\1012_merged.shp"
-output_folder = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Wetland_Tool\1012"
-
-print("Input read. Start processing.") 
-
-# Get the base filename
-base_filename = os.path.basename(wetland_shapefile)
-
-# Split the filename by underscore
-prefix = base_filename.split('_')[0]
-print('prefix is ', prefix)
-
-
-   
-# Create output subfolder if it doesn't exist
-wetland_subfolder = os.path.join(output_folder, f"Wetland_{prefix}")
-if not os.path.exists(wetland_subfolder):
-    os.makedirs(wetland_subfolder)
-
-# Create output subfolder if it doesn't exist
-clip_subfolder = os.path.join(wetland_subfolder, f"clip_{prefix}")
-if not os.path.exists(clip_subfolder):
-    os.makedirs(clip_subfolder)
-batch_clip(wetland_shapefile, basin_shapefile, clip_subfolder)
-print("batch_clip Done at")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
-
-# Create output subfolder if it doesn't exist
-dissolve_subfolder = os.path.join(wetland_subfolder, f"dissolve_{prefix}")
-if not os.path.exists(dissolve_subfolder):
-    os.makedirs(dissolve_subfolder)
-batch_dissolve(clip_subfolder,dissolve_subfolder)
-print("batch_dissolve Done at")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
-
-add_area_field(dissolve_subfolder)
-
-# Create the file geodatabase
-gdb_path = os.path.join(wetland_subfolder, f"NationalWetland_{prefix}.gdb")
-if not arcpy.Exists(gdb_path):
-    arcpy.CreateFileGDB_management(wetland_subfolder, f"NationalWetland_{prefix}.gdb")
-create_national_wetland_table(basin_shapefile, gdb_path,dissolve_subfolder)
-print("create_national_wetland_table Done at")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
-
-print("Tool Done at")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+def overlay_wetland_areas(wetland_shapefile, basin_shapefile, index_cache_folder=None):
+    """
+    Intersects all basins with the wetland layer in one overlay, dissolves the
+    pieces by GID and TYPE so overlapping wetlands are not counted twice (as the
+    per-basin dissolve did), and sums Wetland and LakePond area per GID in
+    square miles, measured in NAD83 Nebraska (WKID 26852) like add_area_field.
+    With index_cache_folder only wetlands and basins whose envelopes meet
+    (STR-tree, cached there) go into the overlay.
+    Returns a dict of GID -> {"wetland": area, "lakepond": area}.
+    """
+    if index_cache_folder:
+        wetland_shapefile, basin_shapefile, n_pairs = pruned_overlay_inputs(wetland_shapefile, basin_shapefile,
+                                                                            index_cache_folder)
+        if n_pairs == 0:
+            return {}
+
+    intersect_output = r"memory\wetland_intersect"
+    dissolve_output = r"memory\wetland_dissolve"
+    with span("intersect"):
+        arcpy.analysis.Intersect([basin_shapefile, wetland_shapefile], intersect_output, "ALL", "", "INPUT")
+    with span("dissolve"):
+        arcpy.management.Dissolve(intersect_output, dissolve_output, ["GID", "TYPE"])
+
+    area_reference = arcpy.SpatialReference(26852)
+    with span("read_fragments"):
+        fragments = arcpy.da.FeatureClassToNumPyArray(dissolve_output, ["GID", "TYPE", "SHAPE@AREA"],
+                                                      spatial_reference=area_reference)
+    arcpy.Delete_management(intersect_output)
+    arcpy.Delete_management(dissolve_output)
+    count("features_read", len(fragments))
+
+    # Square miles from the squared linear unit of the area coordinate system
+    square_miles = fragments["SHAPE@AREA"] * area_reference.metersPerUnit ** 2 / 2589988.110336
+    gids, types, areas = group_fragment_areas(fragments["GID"], fragments["TYPE"], square_miles)
+
+    gid_totals = {}
+    for gid, wetland_type, area in zip(gids, types, areas):
+        totals = gid_totals.setdefault(str(gid), {"wetland": 0.0, "lakepond": 0.0})
+        if wetland_type == "Wetland":
+            totals["wetland"] += area
+        elif wetland_type == "LakePond":
+            totals["lakepond"] += area
+    return gid_totals
+
+def compare_wetland_totals(gid_totals, dissolve_folder, tolerance=0.001, gids=None):
+    """
+    Checks the overlay totals against the per-basin pipeline's dissolved
+    shapefiles (Area_SqMi). With gids only those basins are checked. Prints
+    every GID whose Wetland or LakePond area differs by more than tolerance
+    (relative) and returns their count.
+    """
+    expected = {}
+    for dissolve_shapefile in [f for f in os.listdir(dissolve_folder) if f.endswith(".shp")]:
+        gid = dissolve_shapefile.split('_')[0]
+        if gids is not None and gid not in gids:
+            continue
+        totals = expected.setdefault(gid, {"wetland": 0.0, "lakepond": 0.0})
+        with arcpy.da.SearchCursor(os.path.join(dissolve_folder, dissolve_shapefile), ["TYPE", "Area_SqMi"]) as cursor:
+            for wetland_type, area in cursor:
+                if wetland_type == "Wetland":
+                    totals["wetland"] += area
+                elif wetland_type == "LakePond":
+                    totals["lakepond"] += area
+
+    mismatches = mismatched_totals(gid_totals, expected, tolerance)
+    for gid, key, actual_area, expected_area in mismatches:
+        print(f"{gid} {key}: overlay {actual_area:.6f} vs per-basin {expected_area:.6f} sq mi")
+    print(f"{len(mismatches)} wetland totals differ by more than {tolerance:.3%}")
+    return len(mismatches)
+
+def wetland_percentage_columns(basin_shapefile, gid_totals):
+    """
+    Wetland and LakePond percentages of every basin's total drainage area
+    (TDA_SqMi). Every basin gets a row; basins without wetlands get 0.
+    """
+    # Calculate total area for each GID from basin_shapefile
+    basins = arcpy.da.TableToNumPyArray(basin_shapefile, ["GID", "TDA_SqMi"], skip_nulls=True)
+    gids, gid_codes = np.unique(basins["GID"], return_inverse=True)
+    total_areas = np.bincount(gid_codes.ravel(), weights=basins["TDA_SqMi"].astype(np.float64))
+
+    wetland = np.array([gid_totals.get(str(gid), {}).get("wetland", 0.0) for gid in gids])
+    lakepond = np.array([gid_totals.get(str(gid), {}).get("lakepond", 0.0) for gid in gids])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns = {
+            "Wetland_Pctg": np.where(total_areas != 0, wetland / total_areas * 100, 0.0),
+            "LakePond_Pctg": np.where(total_areas != 0, lakepond / total_areas * 100, 0.0),
+        }
+    return [str(gid) for gid in gids], columns
+
+def create_national_wetland_table_from_overlay(basin_shapefile, output_gdb, gid_totals):
+    """Writes NationalWetland in one step from the overlay totals."""
+    gids, columns = wetland_percentage_columns(basin_shapefile, gid_totals)
+    summarize_columns("NationalWetland", gids, columns)
+    write_table(output_gdb, "NationalWetland", gids, columns)
+    print("Process completed successfully.")
+
+
+if __name__ == "__main__":
+    start_trace_from_environment("Wetlands")
+    mark("Tool starts")
+
+    basin_shapefile = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Input_Basins\1012\basins_final_merge.shp"
+    wetland_shapefile = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Wetland_Local\Processed\reproject\1012_merged.shp"
+    output_folder = r"C:\Users\rfan\Documents\ArcGIS\Projects\NeDNR_Regression\Wetland_Tool\1012"
+
+    print("Input read. Start processing.") 
+
+    # Get the base filename
+    base_filename = os.path.basename(wetland_shapefile)
+
+    # Split the filename by underscore
+    prefix = base_filename.split('_')[0]
+    print('prefix is ', prefix)
+
+
+
+    # Create output subfolder if it doesn't exist
+    wetland_subfolder = os.path.join(output_folder, f"Wetland_{prefix}")
+    if not os.path.exists(wetland_subfolder):
+        os.makedirs(wetland_subfolder)
+
+    # One overlay of all basins instead of clip, dissolve and area per basin
+    use_single_overlay = True
+    # Only overlay the basins that are new or changed since the last run
+    use_incremental = True
+    # Also write the table as Parquet (set to None to skip), joined on GID with the other tables in that folder
+    columnar_folder = os.path.join(output_folder, "columnar")
+    # Upsert the table into one SQLite store of every characteristic, keyed on GID (set to None to skip)
+    results_store = os.path.join(output_folder, STORE_NAME)
+
+    if use_single_overlay:
+        index_cache_folder = os.path.join(wetland_subfolder, "index_cache")
+        # Dissolved shapefiles left by a per-basin run are checked against the overlay totals
+        dissolve_subfolder = os.path.join(wetland_subfolder, f"dissolve_{prefix}")
+        overlay_totals = {}
+        overlay_gids = set()
+
+        def compute(basins):
+            gid_totals = overlay_wetland_areas(wetland_shapefile, basins, index_cache_folder)
+            basin_gids, basin_columns = wetland_percentage_columns(basins, gid_totals)
+            overlay_totals.update(gid_totals)
+            overlay_gids.update(basin_gids)
+            return basin_gids, basin_columns
+
+        if use_incremental:
+            gids, columns = incremental_columns("Wetland", basin_shapefile, [wetland_shapefile], compute,
+                                                os.path.join(wetland_subfolder, "result_cache"),
+                                                results_store=results_store, table_name="NationalWetland",
+                                                attribute_fields=BASIN_ATTRIBUTE_FIELDS)
+        else:
+            gids, columns = compute(basin_shapefile)
+        mark("Wetland overlay Done")
+        if overlay_gids and os.path.isdir(dissolve_subfolder):
+            compare_wetland_totals(overlay_totals, dissolve_subfolder, gids=overlay_gids)
+
+        gdb_path = os.path.join(wetland_subfolder, f"NationalWetland_{prefix}.gdb")
+        summarize_columns("NationalWetland", gids, columns)
+        write_table(gdb_path, "NationalWetland", gids, columns)
+        if columnar_folder:
+            export_table(columnar_folder, "NationalWetland", gids, columns)
+        if results_store:
+            upsert_columns(results_store, "NationalWetland", gids, columns)
+        mark("create_national_wetland_table Done")
+
+    else:
+        # Create output subfolder if it doesn't exist
+        clip_subfolder = os.path.join(wetland_subfolder, f"clip_{prefix}")
+        if not os.path.exists(clip_subfolder):
+            os.makedirs(clip_subfolder)
+        batch_clip(wetland_shapefile, basin_shapefile, clip_subfolder)
+        mark("batch_clip Done")
+
+        # Create output subfolder if it doesn't exist
+        dissolve_subfolder = os.path.join(wetland_subfolder, f"dissolve_{prefix}")
+        if not os.path.exists(dissolve_subfolder):
+            os.makedirs(dissolve_subfolder)
+        batch_dissolve(clip_subfolder,dissolve_subfolder)
+        mark("batch_dissolve Done")
+
+        add_area_field(dissolve_subfolder)
+
+        # Create the file geodatabase
+        gdb_path = os.path.join(wetland_subfolder, f"NationalWetland_{prefix}.gdb")
+        if not arcpy.Exists(gdb_path):
+            arcpy.CreateFileGDB_management(wetland_subfolder, f"NationalWetland_{prefix}.gdb")
+        create_national_wetland_table(basin_shapefile, gdb_path,dissolve_subfolder)
+        mark("create_national_wetland_table Done")
+
+    mark("Tool Done")
@@ -0,0 +1,127 @@
+#-------------------------------------------------------------------------------
+# Name:        ZonalStatistics.py
+# Purpose:     Pure NumPy zonal accumulators shared by the raster characteristic
+#              tools. Nothing in here needs arcpy, so the math can be checked on
+#              synthetic arrays.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import numpy as np
+
+# NLCD categories keyed by the first digit of the class value, in table order
+NLCD_CATEGORIES = [
+    ("Water", "1"),
+    ("Developed", "2"),
+    ("Barren", "3"),
+    ("Forest", "4"),
+    ("Shrubland", "5"),
+    ("Herbaceous", "7"),
+    ("Planted_Cultivated", "8"),
+    ("Wetlands", "9"),
+]
+
+
+def as_zone_layers(zones):
+    """
+    Returns the zone labels as a (layers, rows, cols) array. A 2-D label grid is
+    treated as a single layer. Label 0 means "no basin", label k means basin k-1.
+    """
+    zones = np.asarray(zones)
+    if zones.ndim == 2:
+        zones = zones[np.newaxis, :, :]
+    return zones
+
+
+def valid_mask(values, nodata=None):
+    """Returns a boolean mask of the cells that hold data."""
+    mask = np.ones(values.shape, dtype=bool)
+    if nodata is not None:
+        mask &= values != nodata
+    if np.issubdtype(values.dtype, np.floating):
+        mask &= ~np.isnan(values)
+    return mask
+
+
+def zonal_class_histogram(values, zones, n_zones, nodata=None, counts=None, n_classes=256):
+    """
+    Counts the pixels of every class value inside every zone.
+
+    values is a 2-D array of integer class values and zones the matching zone
+    labels (2-D, or 3-D for nested basins stacked as layers). Returns an
+    (n_zones, n_classes) int64 array. When counts is passed the pixels are added
+    to it in place, which lets a caller feed the raster block by block.
+    """
+    if counts is None:
+        counts = np.zeros((n_zones, n_classes), dtype=np.int64)
+
+    values = np.asarray(values)
+    mask = valid_mask(values, nodata) & (values >= 0) & (values < n_classes)
+
+    for layer in as_zone_layers(zones):
+        in_zone = mask & (layer > 0)
+        if not in_zone.any():
+            continue
+        index = (layer[in_zone].astype(np.int64) - 1) * n_classes + values[in_zone].astype(np.int64)
+        counts += np.bincount(index, minlength=n_zones * n_classes).reshape(n_zones, n_classes)
+
+    return counts
+
+
+def nlcd_class_lookup(n_classes=256):
+    """Returns an array mapping every class value to its NLCD category index (-1 if none)."""
+    digits = [digit for _, digit in NLCD_CATEGORIES]
+    lookup = np.full(n_classes, -1, dtype=np.int64)
+    for value in range(1, n_classes):
+        first_digit = str(value)[0]
+        if first_digit in digits:
+            lookup[value] = digits.index(first_digit)
+    return lookup
+
+
+def nlcd_category_percentages(counts):
+    """
+    Converts an (n_zones, n_classes) histogram into NLCD category percentages.
+    Percentages are relative to every counted pixel in the zone, the same way the
+    polygon workflow divided by the total dissolved area.
+    Returns a dict of category name -> float array of length n_zones.
+    """
+    lookup = nlcd_class_lookup(counts.shape[1])
+    total = counts.sum(axis=1).astype(np.float64)
+
+    columns = {}
+    for index, (category, _) in enumerate(NLCD_CATEGORIES):
+        category_count = counts[:, lookup == index].sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns[category] = np.where(total > 0, category_count / total * 100, 0.0)
+    return columns
+
+
+def zonal_sum_count(values, zones, n_zones, nodata=None, sums=None, counts=None):
+    """
+    Accumulates the sum and the number of data cells of values inside every zone.
+    Returns (sums, counts), two arrays of length n_zones; pass them back in to keep
+    accumulating block by block. Mean = sums / counts.
+    """
+    if sums is None:
+        sums = np.zeros(n_zones, dtype=np.float64)
+    if counts is None:
+        counts = np.zeros(n_zones, dtype=np.int64)
+
+    values = np.asarray(values)
+    mask = valid_mask(values, nodata)
+
+    for layer in as_zone_layers(zones):
+        in_zone = mask & (layer > 0)
+        if not in_zone.any():
+            continue
+        index = layer[in_zone].astype(np.int64) - 1
+        sums += np.bincount(index, weights=values[in_zone].astype(np.float64), minlength=n_zones)
+        counts += np.bincount(index, minlength=n_zones)
+
+    return sums, counts
+
+
+def zonal_means(sums, counts):
+    """Returns sums / counts with NaN for zones that saw no data."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
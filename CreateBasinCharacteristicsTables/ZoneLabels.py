@@ -0,0 +1,214 @@
+#-------------------------------------------------------------------------------
+# Name:        ZoneLabels.py
+# Purpose:     Rasterize the basins onto a source raster's grid as integer zone
+#              labels. Nested basins overlap, so basins are split into layers
+#              that do not overlap and each layer is rasterized on its own.
+#              The labels are cached on disk keyed by the basin file hash and the
+#              grid definition, so reruns with unchanged basins skip this step.
+#              One entry is kept per basin file and grid: a changed file (such
+#              as the subset an incremental run selects) replaces its old entry.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import functools
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from RasterBlocks import raster_grid, read_raster_window, stream_blocks, subgrid
+from RunTrace import span
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+
+def assign_zone_layers(basin_shapefile, zone_field="GID"):
+    """
+    Reads the basins and assigns each polygon to the first layer in which it does
+    not overlap any other polygon. Returns the sorted unique zone values and a
+    dict of OID -> (zone label, layer index). Labels start at 1.
+    """
+    # zone_field "OID@" gives every polygon its own zone, which is what plain masks need
+    features = []
+    fields = ["OID@", "SHAPE@"] + ([] if zone_field == "OID@" else [zone_field])
+    with arcpy.da.SearchCursor(basin_shapefile, fields) as cursor:
+        for row in cursor:
+            features.append((row[0], row[-1] if zone_field != "OID@" else row[0], row[1]))
+
+    gids = sorted(set(gid for _, gid, _ in features))
+    labels = {gid: index + 1 for index, gid in enumerate(gids)}
+
+    # Larger basins first so the outer basin of a nest lands in layer 0
+    features.sort(key=lambda feature: feature[2].area, reverse=True)
+
+    layers = []
+    assignment = {}
+    for oid, gid, shape in features:
+        for layer_index, members in enumerate(layers):
+            if all(shape.disjoint(member) or shape.touches(member) for member in members
+                   if not shape.extent.disjoint(member.extent)):
+                members.append(shape)
+                break
+        else:
+            layer_index = len(layers)
+            layers.append([shape])
+        assignment[oid] = (labels[gid], layer_index)
+
+    return gids, assignment, len(layers)
+
+
+def rasterize_zone_labels(basin_shapefile, grid, snap_raster, zone_field="GID", out_path=None,
+                          max_memory_mb=512):
+    """
+    Rasterizes the basins onto the grid of snap_raster. Returns the sorted unique
+    zone values and an int32 array of shape (layers, rows, cols) where 0 is
+    outside every basin and k is the k-th zone value. With out_path the labels
+    are written block by block into a memory-mapped .npy file instead of RAM.
+    """
+    gids, assignment, n_layers = assign_zone_layers(basin_shapefile, zone_field)
+
+    # Work on an in-memory copy carrying the label and layer of each polygon
+    zone_fc = r"memory\zone_basins"
+    arcpy.management.CopyFeatures(basin_shapefile, zone_fc)
+    arcpy.management.AddField(zone_fc, "ZONE", "LONG")
+    arcpy.management.AddField(zone_fc, "ZLAYER", "SHORT")
+    with arcpy.da.UpdateCursor(zone_fc, ["OID@", "ZONE", "ZLAYER"]) as cursor:
+        for row in cursor:
+            row[1], row[2] = assignment[row[0]]
+            cursor.updateRow(row)
+
+    shape = (n_layers, grid["rows"], grid["cols"])
+    if out_path is None:
+        zones = np.zeros(shape, dtype=np.int32)
+    else:
+        zones = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.int32, shape=shape)
+
+    extent = arcpy.Extent(grid["xmin"], grid["ymin"], grid["xmax"], grid["ymax"])
+    with arcpy.EnvManager(snapRaster=snap_raster, cellSize=snap_raster, extent=extent,
+                          outputCoordinateSystem=grid["spatial_reference"]):
+        for layer_index in range(n_layers):
+            layer_name = "zone_layer"
+            arcpy.management.MakeFeatureLayer(zone_fc, layer_name, f"ZLAYER = {layer_index}")
+            zone_raster = rf"memory\zone_raster_{layer_index}"
+            arcpy.conversion.PolygonToRaster(layer_name, "ZONE", zone_raster, "CELL_CENTER", "", snap_raster)
+            read_window = functools.partial(read_raster_window, zone_raster, grid, nodata_to_value=0)
+            for (row0, col0, nrows, ncols), block in stream_blocks(read_window, grid, max_memory_mb, 8):
+                zones[layer_index, row0:row0 + nrows, col0:col0 + ncols] = block
+            arcpy.management.Delete(layer_name)
+            arcpy.management.Delete(zone_raster)
+
+    arcpy.management.Delete(zone_fc)
+    if out_path is not None:
+        zones.flush()
+    return gids, zones
+
+
+# Shapefile sidecars that define the geometry and attributes of the basins
+SHAPEFILE_PARTS = [".shp", ".shx", ".dbf", ".prj"]
+
+
+def dataset_hash(dataset_path):
+    """
+    Hashes the content of a dataset. Shapefiles are hashed from their sidecar
+    files; anything else (feature classes in a geodatabase) from its geometries
+    and attributes read through a cursor.
+    """
+    sha = hashlib.sha1()
+    base, extension = os.path.splitext(dataset_path)
+    if extension.lower() == ".shp":
+        for part in SHAPEFILE_PARTS:
+            part_path = base + part
+            if not os.path.exists(part_path):
+                continue
+            with open(part_path, "rb") as part_file:
+                for chunk in iter(lambda: part_file.read(1024 * 1024), b""):
+                    sha.update(chunk)
+    else:
+        fields = [field.name for field in arcpy.ListFields(dataset_path) if field.type not in ("Geometry", "OID")]
+        with arcpy.da.SearchCursor(dataset_path, ["SHAPE@WKB"] + fields) as cursor:
+            for row in cursor:
+                sha.update(bytes(row[0] or b""))
+                sha.update(repr(row[1:]).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def grid_key(grid):
+    """Hashes the parts of a grid definition that decide where each cell falls."""
+    definition = {key: grid[key] for key in
+                  ["xmin", "ymin", "xmax", "ymax", "cell_width", "cell_height", "rows", "cols", "spatial_reference"]}
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def zone_cache_paths(cache_folder, basin_shapefile, zone_field, zone_grid):
+    """
+    (labels .npy, GIDs .json) of the cache entry for the basins on zone_grid.
+    The name starts with a slot for the basin file path, zone field and grid,
+    followed by the hash of the file's content.
+    """
+    slot = hashlib.sha1(f"{os.path.abspath(basin_shapefile)}|{zone_field}|{grid_key(zone_grid)}".encode("utf-8"))
+    prefix = os.path.join(cache_folder, f"zones_{slot.hexdigest()[:16]}_{dataset_hash(basin_shapefile)}")
+    return prefix + ".npy", prefix + ".json"
+
+
+def evict_zone_labels(zone_path):
+    """
+    Removes the other entries in zone_path's slot, left by earlier versions of
+    the same basin file. Returns the number of files removed.
+    """
+    cache_folder, file_name = os.path.split(zone_path)
+    slot = file_name.rsplit("_", 1)[0] + "_"
+    current = os.path.splitext(file_name)[0]
+    removed = 0
+    for other in os.listdir(cache_folder):
+        if other.startswith(slot) and os.path.splitext(other)[0] != current and other.endswith((".npy", ".json")):
+            try:
+                os.remove(os.path.join(cache_folder, other))
+                removed += 1
+            except OSError:
+                # Still mapped by a run that is reading it; the next rebuild removes it
+                pass
+    return removed
+
+
+def cached_zone_labels(basin_shapefile, raster_path, cache_folder, zone_field="GID", max_memory_mb=512):
+    """
+    Returns (gids, zones, zone_grid) for the basins on the grid of raster_path.
+    zone_grid is the part of the raster grid covering the basins and zones a
+    read-only memory-mapped (layers, rows, cols) label array on it. The labels
+    are loaded from cache_folder when the basins and grid are unchanged and
+    rasterized (then stored, replacing the entry of the file's old content)
+    otherwise.
+    """
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+
+    grid = raster_grid(raster_path)
+    basin_extent = arcpy.Describe(basin_shapefile).extent
+    basin_extent = basin_extent.projectAs(arcpy.SpatialReference(text=grid["spatial_reference"]))
+    zone_grid = subgrid(grid, basin_extent.XMin, basin_extent.YMin, basin_extent.XMax, basin_extent.YMax)
+
+    zone_path, gids_path = zone_cache_paths(cache_folder, basin_shapefile, zone_field, zone_grid)
+
+    if os.path.exists(zone_path) and os.path.exists(gids_path):
+        print(f"Reusing cached zone labels {zone_path}")
+        with open(gids_path) as gids_file:
+            gids = json.load(gids_file)
+        return gids, np.load(zone_path, mmap_mode="r"), zone_grid
+
+    # Build under a temporary name so an interrupted run never leaves a bad cache entry
+    temp_path = zone_path + ".partial.npy"
+    with span("rasterize_zone_labels", rows=zone_grid["rows"], cols=zone_grid["cols"]):
+        gids, zones = rasterize_zone_labels(basin_shapefile, zone_grid, raster_path, zone_field, temp_path,
+                                            max_memory_mb)
+    del zones
+    os.replace(temp_path, zone_path)
+    with open(gids_path, "w") as gids_file:
+        json.dump(gids, gids_file)
+    evict_zone_labels(zone_path)
+    print(f"Zone labels cached at {zone_path}")
+
+    return gids, np.load(zone_path, mmap_mode="r"), zone_grid
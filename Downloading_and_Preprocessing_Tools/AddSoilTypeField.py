@@ -1,10 +1,28 @@
-import arcpy
 import os
-import time
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+import numpy as np
 
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
 
-# Function to clean and format SoilType values
+# Run tracing and the worker set-up live with the basin characteristic tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from RunTrace import count, mark, span, start_trace_from_environment
+from StackedZonal import init_worker
+
+SOIL_TYPE_FIELD = "SoilType"
+SOIL_TYPE_LENGTH = 50
+
+
+# Function to clean and format SoilType values; a tile has only a handful of distinct codes
+@lru_cache(maxsize=None)
 def format_soil_type(hydgrpdcd):
     if not hydgrpdcd or hydgrpdcd.strip() == "":
         return "OtherSoilTypes"
@@ -13,28 +31,100 @@ def format_soil_type(hydgrpdcd):
     else:
         return hydgrpdcd
 
-# Input folder containing shapefiles
-input_folder = arcpy.GetParameterAsText(0)
-
-current_time = time.strftime("%m-%d %X",time.localtime())
-print("Tool starts at", current_time)
-
-# Add field "SoilType" to each shapefile
-arcpy.AddMessage("Processing shapefiles...")
-for root, dirs, files in os.walk(input_folder):
-    for file in files:
-        if file.endswith(".shp"):
-            shapefile = os.path.join(root, file)
-            arcpy.AddMessage("Processing: " + shapefile)
-            arcpy.AddField_management(shapefile, "SoilType", "TEXT", field_length=50)
-            
-            # Update SoilType field based on hydgrpdcd field
-            with arcpy.da.UpdateCursor(shapefile, ["hydgrpdcd", "SoilType"]) as cursor:
-                for row in cursor:
-                    row[1] = format_soil_type(row[0])
-                    cursor.updateRow(row)
-
-arcpy.AddMessage("Script execution completed.")
-
-current_time = time.strftime("%m-%d %X",time.localtime())
-print("Tool done at", current_time)
\ No newline at end of file
+
+def soil_types(codes):
+    """SoilType of every hydgrpdcd code, formatting each distinct code once."""
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    formatted = np.array([format_soil_type(code) for code in unique_codes], dtype=f"<U{SOIL_TYPE_LENGTH}")
+    return formatted[inverse.reshape(-1)]
+
+
+def add_soil_type_field(shapefile):
+    """
+    Fills SoilType of one shapefile from hydgrpdcd: the codes are read in one
+    call, mapped per distinct code and written back in one ExtendTable on the
+    OID. A shapefile whose SoilType is already correct is left untouched.
+    Returns "updated", "skipped" or "no hydgrpdcd".
+    """
+    field_names = [field.name for field in arcpy.ListFields(shapefile)]
+    if "hydgrpdcd" not in field_names:
+        return "no hydgrpdcd"
+    has_soil_type = SOIL_TYPE_FIELD in field_names
+    oid_field = arcpy.Describe(shapefile).OIDFieldName
+
+    with span("soil_type", "tile", shapefile=os.path.basename(shapefile)):
+        read_fields = [oid_field, "hydgrpdcd"] + ([SOIL_TYPE_FIELD] if has_soil_type else [])
+        rows = arcpy.da.TableToNumPyArray(shapefile, read_fields, null_value={"hydgrpdcd": "", SOIL_TYPE_FIELD: ""})
+        count("features_read", len(rows))
+        types = soil_types(rows["hydgrpdcd"])
+        if has_soil_type and np.array_equal(rows[SOIL_TYPE_FIELD], types):
+            return "skipped"
+
+        if has_soil_type:
+            arcpy.DeleteField_management(shapefile, SOIL_TYPE_FIELD)
+        values = np.zeros(len(rows), dtype=[("OID_MATCH", np.int32), (SOIL_TYPE_FIELD, f"<U{SOIL_TYPE_LENGTH}")])
+        values["OID_MATCH"] = rows[oid_field]
+        values[SOIL_TYPE_FIELD] = types
+        arcpy.da.ExtendTable(shapefile, oid_field, values, "OID_MATCH")
+    return "updated"
+
+
+def add_soil_type_fields(input_folder, workers=1):
+    """
+    Fills SoilType in every shapefile under input_folder, in a pool of worker
+    processes when workers > 1. Returns a dict of shapefile -> status.
+    """
+    shapefiles = sorted(os.path.join(root, file) for root, dirs, files in os.walk(input_folder)
+                        for file in files if file.endswith(".shp"))
+    arcpy.AddMessage(f"Processing {len(shapefiles)} shapefiles with {workers} workers...")
+
+    if workers > 1:
+        scratch_root = tempfile.mkdtemp(prefix="soil_type_")
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(scratch_root,)) as executor:
+                statuses = dict(zip(shapefiles, executor.map(add_soil_type_field, shapefiles)))
+        finally:
+            shutil.rmtree(scratch_root, ignore_errors=True)
+    else:
+        statuses = {shapefile: add_soil_type_field(shapefile) for shapefile in shapefiles}
+
+    for shapefile, status in statuses.items():
+        if status == "no hydgrpdcd":
+            arcpy.AddWarning("No hydgrpdcd field: " + shapefile)
+    summary = {status: list(statuses.values()).count(status) for status in set(statuses.values())}
+    mark(f"SoilType fields done: {summary}")
+    return statuses
+
+
+if __name__ == "__main__":
+    # Input folder containing shapefiles
+    input_folder = arcpy.GetParameterAsText(0)
+    workers = int(arcpy.GetParameterAsText(1) or 1)  # Worker processes for the batch mode
+
+    start_trace_from_environment("AddSoilTypeField")
+    mark("Tool starts")
+
+    # Read, map and write each shapefile's SoilType in bulk (and skip those already done) instead of row by row
+    use_batch = True
+
+    if use_batch:
+        add_soil_type_fields(input_folder, workers)
+    else:
+        # Add field "SoilType" to each shapefile
+        arcpy.AddMessage("Processing shapefiles...")
+        for root, dirs, files in os.walk(input_folder):
+            for file in files:
+                if file.endswith(".shp"):
+                    shapefile = os.path.join(root, file)
+                    arcpy.AddMessage("Processing: " + shapefile)
+                    arcpy.AddField_management(shapefile, "SoilType", "TEXT", field_length=50)
+
+                    # Update SoilType field based on hydgrpdcd field
+                    with arcpy.da.UpdateCursor(shapefile, ["hydgrpdcd", "SoilType"]) as cursor:
+                        for row in cursor:
+                            row[1] = format_soil_type(row[0])
+                            cursor.updateRow(row)
+
+    arcpy.AddMessage("Script execution completed.")
+
+    mark("Tool done")
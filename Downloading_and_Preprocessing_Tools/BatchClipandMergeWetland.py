@@ -1,10 +1,15 @@
 import arcpy
 import os
-import time
+import sys
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+from DatasetCatalog import dataset_extent, overlapping_datasets, refresh_catalog
+
+# Run tracing lives with the basin characteristic tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from RunTrace import mark, span, start_trace_from_environment
+
+start_trace_from_environment("BatchClipandMergeWetland")
+mark("Tool starts")
 
 # Check Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
@@ -31,37 +36,37 @@ if not os.path.exists(clipped_folder):
 if not os.path.exists(merged_folder):
     os.makedirs(merged_folder)
 
+# Catalog the extents of both folders once; only files changed since the last run are described again
+tiles_catalog, described = refresh_catalog(tiles_folder)
+print(described, 'tile shapefiles described')
+wetlands_catalog, described = refresh_catalog(wetlands_folder)
+print(described, 'wetland shapefiles described')
+
 # Loop through each tile shapefile
 for tile_file in os.listdir(tiles_folder):
     if tile_file.endswith('.shp'):
         tile_name = os.path.splitext(tile_file)[0]
         tile_path = os.path.join(tiles_folder, tile_file)
-        tile_extent = arcpy.Describe(tile_path).extent
+        tile_extent = dataset_extent(tiles_catalog, tile_path)
         print('tile_name is', tile_name)
 
-        # Loop through each wetland shapefile
-        for wetland_file in os.listdir(wetlands_folder):
-            if wetland_file.endswith('.shp'):
-                wetland_name = os.path.splitext(wetland_file)[0]
-                wetland_path = os.path.join(wetlands_folder, wetland_file)
-
-                # Check for intersection
-                wetland_extent = arcpy.Describe(wetland_path).extent
-                if tile_extent.overlaps(wetland_extent):
-                    # Clip wetland by tile
-                    clipped_output = os.path.join(clipped_folder, f"{tile_name}_{wetland_name}.shp")
-                    arcpy.Clip_analysis(wetland_path, tile_path, clipped_output)
-                    print(wetland_name, ' is clipped')
+        # Clip every wetland shapefile whose extent intersects the tile
+        for wetland_path in overlapping_datasets(wetlands_catalog, *tile_extent, kind="shapefile"):
+            wetland_name = os.path.splitext(os.path.basename(wetland_path))[0]
+            clipped_output = os.path.join(clipped_folder, f"{tile_name}_{wetland_name}.shp")
+            with span("clip", "tile", tile=tile_name, wetland=wetland_name):
+                arcpy.Clip_analysis(wetland_path, tile_path, clipped_output)
+            print(wetland_name, ' is clipped')
 
         # Merge clipped features by tile
         clipped_files = [os.path.join(clipped_folder, f) for f in os.listdir(clipped_folder) if f.endswith('.shp') and f.startswith(tile_name)]
         if clipped_files:
-            arcpy.Merge_management(clipped_files, os.path.join(merged_folder, f"{tile_name}_merged.shp"))
-        print(f"{tile_name}_merged.shp", ' is merged at')
-        current_time = time.strftime("%m-%d %X",time.localtime())
-        print(current_time)
+            with span("merge", "tile", tile=tile_name, inputs=len(clipped_files)):
+                arcpy.Merge_management(clipped_files, os.path.join(merged_folder, f"{tile_name}_merged.shp"))
+        mark(f"{tile_name}_merged.shp is merged")
+
 
+tiles_catalog.close()
+wetlands_catalog.close()
 
-print("Tool done at:")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
\ No newline at end of file
+mark("Tool done")
\ No newline at end of file
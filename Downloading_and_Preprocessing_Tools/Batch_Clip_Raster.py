@@ -1,7 +1,15 @@
 import arcpy
 import os
-import time
+import sys
 
+import numpy as np
+
+# The zone-label cache lives with the basin characteristic tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from RasterBlocks import subgrid
+from RasterCache import window_reader
+from RunTrace import mark, span, start_trace_from_environment
+from ZoneLabels import cached_zone_labels
 
 
 # Check Spatial Analyst extension
@@ -9,7 +17,7 @@ arcpy.CheckOutExtension("Spatial")
 # Enable overwriting of output files
 arcpy.env.overwriteOutput = True
 
-def batch_clip_raster(input_folder, input_raster, output_folder):
+def batch_clip_raster(input_folder, input_raster, output_folder, raster_cache_folder=None):
     # Set workspace environment
     arcpy.env.workspace = input_folder
     arcpy.env.overwriteOutput = True
@@ -17,6 +25,11 @@ def batch_clip_raster(input_folder, input_raster, output_folder):
     # Check out Spatial Analyst extension
     arcpy.CheckOutExtension("Spatial")
 
+    # Masks are rasterized once per shapefile and reused on reruns; with raster_cache_folder
+    # the raster is decoded once into a memory-mapped copy and every window is a view of it
+    zone_cache_folder = os.path.join(output_folder, "zone_cache")
+    spatial_reference = arcpy.Describe(input_raster).spatialReference
+
     # Loop through each shapefile in the input folder
     for shapefile in arcpy.ListFeatureClasses("*.shp"):
         # Extract the filename without extension
@@ -24,16 +37,38 @@ def batch_clip_raster(input_folder, input_raster, output_folder):
         
         # Output raster name
         output_raster = os.path.join(output_folder, file_name + "_NLCD.tif")
-        
-        # Perform extract by mask
-        arcpy.gp.ExtractByMask_sa(input_raster, shapefile, output_raster)
+
+        with span("clip", "tile", shapefile=file_name):
+            # Every polygon of the shapefile is part of the mask
+            shapefile_path = os.path.join(input_folder, shapefile)
+            _, zones, zone_grid = cached_zone_labels(shapefile_path, input_raster, zone_cache_folder, "OID@")
+
+            # The zone grid is widened to whole raster blocks; cut it back to the cells under the
+            # shapefile's extent, so the output has the extent ExtractByMask gave it
+            extent = arcpy.Describe(shapefile_path).extent.projectAs(spatial_reference)
+            clip_grid = subgrid(zone_grid, extent.XMin, extent.YMin, extent.XMax, extent.YMax, whole_blocks=False)
+            row0 = clip_grid["row_offset"] - zone_grid.get("row_offset", 0)
+            col0 = clip_grid["col_offset"] - zone_grid.get("col_offset", 0)
+            nrows, ncols = clip_grid["rows"], clip_grid["cols"]
+            mask = (zones[:, row0:row0 + nrows, col0:col0 + ncols] > 0).any(axis=0)
+
+            # Cut the raster window under the mask and blank everything outside it
+            values = window_reader(input_raster, zone_grid, raster_cache_folder)(row0, col0, nrows, ncols)
+            nodata = zone_grid["nodata"]
+            if nodata is None:
+                nodata = np.nan if np.issubdtype(values.dtype, np.floating) else np.iinfo(values.dtype).max
+            values = np.where(mask, values, nodata).astype(values.dtype)
+
+            lower_left = arcpy.Point(clip_grid["xmin"], clip_grid["ymin"])
+            clipped = arcpy.NumPyArrayToRaster(values, lower_left, clip_grid["cell_width"], clip_grid["cell_height"], nodata)
+            clipped.save(output_raster)
+            arcpy.DefineProjection_management(output_raster, spatial_reference)
 
     # Release Spatial Analyst extension
     arcpy.CheckInExtension("Spatial")
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+start_trace_from_environment("Batch_Clip_Raster")
+mark("Tool starts")
 
 
 # Input folder containing HUC4 shapefiles
@@ -47,8 +82,12 @@ output_folder = r"C:\Users\Rachel\Documents\ArcGIS Pro 3.2\Projects\NE_Basin\Bas
 
 # Create output NLCD table with categories
 
-batch_clip_raster(input_folder, input_raster, output_folder)
-print("NLCD table populated at", time.ctime())  # Track progress
+# Decode the raster once for all shapefiles instead of once per shapefile
+use_raster_cache = True
+raster_cache_folder = os.path.join(output_folder, "raster_cache") if use_raster_cache else None
+
+batch_clip_raster(input_folder, input_raster, output_folder, raster_cache_folder)
+mark("NLCD table populated")
 print('****************************************')
 
-print("All Done", time.ctime())  # Track progress
+mark("All Done")
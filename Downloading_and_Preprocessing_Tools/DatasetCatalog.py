@@ -0,0 +1,120 @@
+#-------------------------------------------------------------------------------
+# Name:        DatasetCatalog.py
+# Purpose:     SQLite catalog of the shapefiles and rasters in a folder (extent,
+#              WKID and WKT of the CRS, feature count, size, mtime) so tools
+#              stop calling Describe on every file every run. Entries are
+#              refreshed only when a file's mtime or size changes.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import os
+import sqlite3
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+CATALOG_NAME = "dataset_catalog.sqlite"
+DATASET_EXTENSIONS = (".shp", ".tif", ".tiff", ".img")
+
+CREATE_CATALOG = """
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    xmin REAL, ymin REAL, xmax REAL, ymax REAL,
+    wkid INTEGER,
+    wkt TEXT,
+    feature_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS datasets_x ON datasets (xmin, xmax);
+CREATE INDEX IF NOT EXISTS datasets_y ON datasets (ymin, ymax);
+"""
+
+
+def open_catalog(folder, catalog_path=None):
+    """Opens (creating if needed) the catalog that lives next to the data in folder."""
+    connection = sqlite3.connect(catalog_path or os.path.join(folder, CATALOG_NAME))
+    connection.executescript(CREATE_CATALOG)
+    return connection
+
+
+def describe_dataset(path):
+    """
+    Reads the extent, CRS and feature count of one dataset with arcpy.Describe.
+    wkid is None for a custom coordinate system; wkt describes it either way.
+    """
+    description = arcpy.Describe(path)
+    extent = description.extent
+    is_raster = path.lower().endswith(DATASET_EXTENSIONS[1:])
+    feature_count = None if is_raster else int(arcpy.management.GetCount(path)[0])
+    return {
+        "kind": "raster" if is_raster else "shapefile",
+        "xmin": extent.XMin, "ymin": extent.YMin, "xmax": extent.XMax, "ymax": extent.YMax,
+        "wkid": description.spatialReference.factoryCode or None,
+        "wkt": description.spatialReference.exportToString(),
+        "feature_count": feature_count,
+    }
+
+
+def shapefile_size(path):
+    """Size of a dataset; for shapefiles the sum of the main sidecar files."""
+    base, extension = os.path.splitext(path)
+    if extension.lower() != ".shp":
+        return os.path.getsize(path)
+    return sum(os.path.getsize(base + part) for part in [".shp", ".shx", ".dbf"] if os.path.exists(base + part))
+
+
+def refresh_catalog(folder, connection=None, describe=describe_dataset):
+    """
+    Brings the catalog of folder up to date. Only datasets that are new or
+    whose mtime or size changed are described again; entries of deleted files
+    are dropped. Returns (connection, number of datasets described).
+    """
+    connection = connection or open_catalog(folder)
+    known = {path: (size, mtime) for path, size, mtime in connection.execute("SELECT path, size, mtime FROM datasets")}
+
+    present = set()
+    described = 0
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.lower().endswith(DATASET_EXTENSIONS):
+            continue
+        path = os.path.join(folder, file_name)
+        present.add(path)
+        size, mtime = shapefile_size(path), os.path.getmtime(path)
+        if known.get(path) == (size, mtime):
+            continue
+
+        entry = describe(path)
+        connection.execute(
+            "INSERT OR REPLACE INTO datasets (path, name, kind, size, mtime, xmin, ymin, xmax, ymax, wkid, wkt, "
+            "feature_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, os.path.splitext(file_name)[0], entry["kind"], size, mtime, entry["xmin"], entry["ymin"],
+             entry["xmax"], entry["ymax"], entry["wkid"], entry["wkt"], entry["feature_count"]))
+        described += 1
+
+    for path in set(known) - present:
+        connection.execute("DELETE FROM datasets WHERE path = ?", (path,))
+    connection.commit()
+    return connection, described
+
+
+def dataset_extent(connection, path):
+    """Returns the (xmin, ymin, xmax, ymax) recorded for a dataset."""
+    return connection.execute("SELECT xmin, ymin, xmax, ymax FROM datasets WHERE path = ?", (path,)).fetchone()
+
+
+def overlapping_datasets(connection, xmin, ymin, xmax, ymax, kind=None):
+    """
+    Paths of the cataloged datasets whose extent overlaps the given extent,
+    answered from the indexed extent columns.
+    """
+    query = "SELECT path FROM datasets WHERE xmin <= ? AND xmax >= ? AND ymin <= ? AND ymax >= ?"
+    parameters = [xmax, xmin, ymax, ymin]
+    if kind is not None:
+        query += " AND kind = ?"
+        parameters.append(kind)
+    return [row[0] for row in connection.execute(query + " ORDER BY path", parameters)]
@@ -8,16 +8,22 @@
 import arcpy
 from arcpy.sa import *
 import os
-import time
+import sys
+
+from DatasetCatalog import refresh_catalog
+from FeatureServiceDownload import download_tiles, merge_tile_pages, payload_options, report_payload
+
+# Run tracing lives with the basin characteristic tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from RunTrace import count, mark, span, start_trace_from_environment
 
 # Check Spatial Analyst extention
 arcpy.CheckOutExtension("Spatial")
 #Define input and output parameters
 arcpy.env.overwriteOutput = True
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+start_trace_from_environment("Extract_shp_from_SoilsMapUnits_Feature_Service")
+mark("Tool starts")
 
 
 # Define the paths to your input shapefile and the folder containing your clipping shapefiles
@@ -25,45 +31,79 @@ input_shapefile = "https://landscape11.arcgis.com/arcgis/rest/services/USA_Soils
 clipping_folder = r"E:\NE\DEM_Extent_Tiles"
 output_folder = r"E:\NE\Basin_Characteristics\Downloading_SoilMapUnits\64-79"
 
-# Set the workspace to the clipping folder to list all shapefiles
-arcpy.env.workspace = clipping_folder
+# Download the tiles with paged, resumable REST queries instead of clipping the remote layer directly
+use_paged_download = True
+page_cache_folder = os.path.join(output_folder, "page_cache")
+max_connections = 8
+# Only the fields AddSoilTypeField.py and SoilMapUnits.py read. Coordinates are
+# in the tiles' State Plane feet: generalize to 1 ft and keep 1 decimal place.
+soil_payload = payload_options(out_fields=["hydgrpdcd", "ksat"], max_allowable_offset=1, geometry_precision=1)
+
+if use_paged_download:
+    # Tile envelopes come from the catalog of the clipping folder. The query sends
+    # the envelope with a WKID, so tiles in a custom coordinate system are skipped
+    catalog, _ = refresh_catalog(clipping_folder)
+    tiles = {name: ((xmin, ymin, xmax, ymax), wkid) for name, xmin, ymin, xmax, ymax, wkid in
+             catalog.execute("SELECT name, xmin, ymin, xmax, ymax, wkid FROM datasets "
+                             "WHERE kind = 'shapefile' AND wkid IS NOT NULL")}
+    for (name,) in catalog.execute("SELECT name FROM datasets WHERE kind = 'shapefile' AND wkid IS NULL"):
+        arcpy.AddWarning(f"Skipping {name}: its coordinate system has no WKID")
+    tile_paths = dict(catalog.execute("SELECT name, path FROM datasets WHERE kind = 'shapefile'"))
+    catalog.close()
+
+    with span("download_tiles", "stage", tiles=len(tiles)):
+        results = download_tiles(input_shapefile, tiles, page_cache_folder, max_connections=max_connections,
+                                 payload=soil_payload)
+    count("features_read", sum(result["features"] for result in results))
+    count("bytes_received", sum(result["bytes_received"] for result in results))
+    count("bytes_written", sum(result["bytes_stored"] for result in results))
+    report_payload(results, os.path.join(page_cache_folder, "payload_report.json"))
+
+    # The envelope query returns every feature touching the tile's extent; clip to the tile itself
+    tile_folders = {result["tile"]: result["folder"] for result in results}
+    for tile_name in sorted(tiles):
+        output_shapefile_path = os.path.join(output_folder, f"clipped_{tile_name}.shp")
+        merged_json = os.path.join(page_cache_folder, f"{tile_name}.json")
+        if merge_tile_pages(tile_folders[tile_name], merged_json) == 0:
+            print(f"No features for {tile_name}")
+            continue
+        downloaded = os.path.join("memory", f"downloaded_{tile_name}")
+        with span("convert_and_clip", "tile", tile=tile_name):
+            arcpy.conversion.JSONToFeatures(merged_json, downloaded)
+            arcpy.Clip_analysis(downloaded, tile_paths[tile_name], output_shapefile_path)
+        arcpy.management.Delete(downloaded)
+        print(f"Clipped output saved to: {output_shapefile_path}")
+
+else:
+    # Set the workspace to the clipping folder to list all shapefiles
+    arcpy.env.workspace = clipping_folder
 
-# List all shapefiles in the clipping folder
-clipping_shapefiles = arcpy.ListFeatureClasses()
+    # List all shapefiles in the clipping folder
+    clipping_shapefiles = arcpy.ListFeatureClasses()
 
-# Loop through each clipping shapefile
-for clipping_shapefile in clipping_shapefiles:
-    clipping_path = os.path.join(clipping_folder, clipping_shapefile)
+    # Loop through each clipping shapefile
+    for clipping_shapefile in clipping_shapefiles:
+        clipping_path = os.path.join(clipping_folder, clipping_shapefile)
     
 
     
    
-    # Define the output shapefile name based on the clipping shapefile name
-    output_shapefile_name = f"clipped_{os.path.splitext(clipping_shapefile)[0]}.shp"
-    output_shapefile_path = os.path.join(output_folder, output_shapefile_name)
+        # Define the output shapefile name based on the clipping shapefile name
+        output_shapefile_name = f"clipped_{os.path.splitext(clipping_shapefile)[0]}.shp"
+        output_shapefile_path = os.path.join(output_folder, output_shapefile_name)
 
-    # Construct the path to the clipping shapefile
-    current_time = time.strftime("%m-%d %X",time.localtime())
-    
-    print('*****************************')
-    print(f"Start clipping {output_shapefile_name} at")
-    print(current_time)
+        print('*****************************')
+        mark(f"Start clipping {output_shapefile_name}")
 
-   
-   
-    # Perform the clipping operation
-    arcpy.Clip_analysis(input_shapefile, clipping_path, output_shapefile_path)
-   
-    
-    current_time = time.strftime("%m-%d %X",time.localtime())
-    print(f"{output_shapefile_name} is clipped")
-    print(current_time)
-    print(f"Clipped output saved to: {output_shapefile_path}")
-    print('*****************************')
+        # Perform the clipping operation
+        with span("clip", "tile", tile=clipping_shapefile):
+            arcpy.Clip_analysis(input_shapefile, clipping_path, output_shapefile_path)
+
+        mark(f"{output_shapefile_name} is clipped")
+        print(f"Clipped output saved to: {output_shapefile_path}")
+        print('*****************************')
 
 print("Batch clipping process completed.")
 
 
-print("Tool done at:")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+mark("Tool done")
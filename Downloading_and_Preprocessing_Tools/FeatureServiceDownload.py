@@ -0,0 +1,388 @@
+#-------------------------------------------------------------------------------
+# Name:        FeatureServiceDownload.py
+# Purpose:     Download features of an ArcGIS REST feature service layer by tile
+#              envelopes with paged queries. Tiles are fetched concurrently over
+#              a bounded number of connections, every completed page is
+#              checkpointed to disk with the offset of the next one, failed
+#              requests are retried with backoff, and a rerun resumes from the
+#              pages already on disk. Payload options
+#              (field whitelist, generalization, quantization) and gzip page
+#              storage cut the bytes moved and parsed per tile.
+# Created:     10/18/2026
+#-------------------------------------------------------------------------------
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Features per page; lowered to the layer's maxRecordCount when that is smaller
+PAGE_SIZE = 2000
+# Requests in flight at once across all tiles
+MAX_CONNECTIONS = 8
+# Attempts per page, and the first wait between attempts in seconds (doubled each time)
+RETRIES = 5
+BACKOFF_SECONDS = 1.0
+TIMEOUT_SECONDS = 120
+# HTTP statuses worth retrying; anything else is a real error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Compression level of the pages kept on disk
+PAGE_COMPRESSION = 6
+
+
+class DownloadError(Exception):
+    """A page could not be downloaded after every retry."""
+
+
+def payload_options(out_fields="*", max_allowable_offset=None, geometry_precision=None,
+                    quantization_tolerance=None):
+    """
+    Options that shrink each page:
+      out_fields              list of fields to return ("*" for all); OBJECTID is always added
+      max_allowable_offset    server-side generalization tolerance in map units
+      geometry_precision      decimal places kept in the coordinates
+      quantization_tolerance  snap coordinates to integer steps of this size in map units,
+                              delta-encoded by the server and decoded by dequantize_page
+    """
+    if out_fields != "*":
+        out_fields = ["OBJECTID"] + [field for field in out_fields if field != "OBJECTID"]
+    return {"out_fields": out_fields, "max_allowable_offset": max_allowable_offset,
+            "geometry_precision": geometry_precision, "quantization_tolerance": quantization_tolerance}
+
+
+# Every attribute at full precision, as the service returns it by default
+FULL_PAYLOAD = payload_options()
+
+
+def query_params(envelope, wkid, offset, page_size=PAGE_SIZE, payload=FULL_PAYLOAD, where="1=1"):
+    """
+    REST query parameters for one page of the features whose geometry
+    intersects envelope (xmin, ymin, xmax, ymax) given in the wkid coordinate
+    system. Pages are ordered by OBJECTID so offsets stay stable between requests.
+    """
+    xmin, ymin, xmax, ymax = envelope
+    extent = {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax, "spatialReference": {"wkid": wkid}}
+    out_fields = payload["out_fields"]
+    params = {
+        "f": "json",
+        "where": where,
+        "geometry": json.dumps(extent),
+        "geometryType": "esriGeometryEnvelope",
+        "inSR": wkid,
+        "outSR": wkid,
+        "spatialRel": "esriSpatialRelIntersects",
+        "outFields": out_fields if out_fields == "*" else ",".join(out_fields),
+        "returnGeometry": "true",
+        "returnZ": "false",
+        "returnM": "false",
+        "orderByFields": "OBJECTID",
+        "resultOffset": offset,
+        "resultRecordCount": page_size,
+    }
+    if payload["max_allowable_offset"] is not None:
+        params["maxAllowableOffset"] = payload["max_allowable_offset"]
+    if payload["geometry_precision"] is not None:
+        params["geometryPrecision"] = payload["geometry_precision"]
+    if payload["quantization_tolerance"] is not None:
+        params["quantizationParameters"] = json.dumps({"mode": "view", "originPosition": "upperLeft",
+                                                       "tolerance": payload["quantization_tolerance"],
+                                                       "extent": extent})
+    return params
+
+
+def fetch_layer_info(layer_url, params, timeout=TIMEOUT_SECONDS):
+    """Reads the layer's description (f=json). Returns (bytes received, response body)."""
+    url = layer_url.rstrip("/") + "?" + urllib.parse.urlencode(params)
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        body = response.read()
+        return len(body), body
+
+
+def fetch_page(layer_url, params, timeout=TIMEOUT_SECONDS):
+    """
+    Runs one query request with gzip transfer encoding.
+    Returns (bytes received, decoded response body).
+    """
+    data = urllib.parse.urlencode(params).encode("utf-8")
+    request = urllib.request.Request(layer_url.rstrip("/") + "/query", data=data,
+                                     headers={"Accept-Encoding": "gzip"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        wire = response.read()
+        if response.headers.get("Content-Encoding") == "gzip":
+            return len(wire), gzip.decompress(wire)
+        return len(wire), wire
+
+
+def parse_page(body):
+    """Decodes a query response. Feature services report errors with HTTP 200 and an error object."""
+    page = json.loads(body)
+    if "error" in page:
+        raise DownloadError(f"Service error: {page['error']}")
+    return page
+
+
+def dequantize_path(path, transform):
+    """Turns a delta-encoded path of integer steps back into map coordinates."""
+    scale_x, scale_y = transform["scale"][0], transform["scale"][1]
+    translate_x, translate_y = transform["translate"][0], transform["translate"][1]
+    upper_left = transform.get("originPosition", "upperLeft") == "upperLeft"
+    x = y = 0
+    points = []
+    for dx, dy in path:
+        x += dx
+        y += dy
+        points.append([translate_x + x * scale_x,
+                       translate_y - y * scale_y if upper_left else translate_y + y * scale_y])
+    return points
+
+
+def dequantize_page(page):
+    """Decodes the geometries of a quantized page in place; other pages are returned unchanged."""
+    transform = page.pop("transform", None)
+    if transform is None:
+        return page
+    for feature in page.get("features", []):
+        geometry = feature.get("geometry") or {}
+        for part in ["rings", "paths"]:
+            if part in geometry:
+                geometry[part] = [dequantize_path(path, transform) for path in geometry[part]]
+        if "x" in geometry:
+            geometry["x"], geometry["y"] = dequantize_path([[geometry["x"], geometry["y"]]], transform)[0]
+    return page
+
+
+def tile_folder_name(layer_url, tile_name, envelope, wkid, payload=FULL_PAYLOAD):
+    """
+    Folder of a tile's pages: the tile name and a hash of the layer and every
+    query and payload parameter but the paging, so pages fetched with other
+    fields, generalization or precision are never resumed or merged.
+    """
+    params = query_params(envelope, wkid, 0, payload=payload)
+    del params["resultOffset"], params["resultRecordCount"]
+    key = hashlib.sha1(json.dumps([layer_url.rstrip("/"), params], sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{tile_name}_{key[:12]}"
+
+
+def page_path(tile_folder, page_number):
+    return os.path.join(tile_folder, f"page_{page_number:05d}.json.gz")
+
+
+def checkpoint_path(tile_folder):
+    return os.path.join(tile_folder, "checkpoint.json")
+
+
+def read_progress(tile_folder):
+    """
+    The tile's checkpoint: pages done, resultOffset of the next page, features,
+    JSON and stored bytes so far, and whether the last page has been fetched.
+    A tile without one starts from the first page.
+    """
+    path = checkpoint_path(tile_folder)
+    if not os.path.exists(path):
+        return {"pages": 0, "offset": 0, "features": 0, "bytes_json": 0, "bytes_stored": 0, "done": False}
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def write_progress(tile_folder, progress):
+    """Writes the checkpoint next to its final name and renames it, as write_checkpoint does for pages."""
+    path = checkpoint_path(tile_folder)
+    with open(path + ".partial", "w") as checkpoint_file:
+        json.dump(progress, checkpoint_file)
+    os.replace(path + ".partial", path)
+
+
+def is_last_page(page, page_size):
+    """
+    The service sets exceededTransferLimit while more features remain. A full
+    page without the flag is not trusted, since some servers omit it, and costs
+    one more (empty) request.
+    """
+    return not page.get("exceededTransferLimit", False) and len(page.get("features", [])) < page_size
+
+
+async def fetch_with_retry(layer_url, params, semaphore, retries=RETRIES, backoff=BACKOFF_SECONDS, fetch=fetch_page):
+    """
+    Fetches and parses one page (or, with fetch=fetch_layer_info, the layer's
+    description), retrying network and server errors with exponential backoff.
+    Returns (bytes received, body, page, parse seconds).
+    """
+    request_name = f"Offset {params['resultOffset']}" if "resultOffset" in params else "Layer description"
+    for attempt in range(retries):
+        try:
+            async with semaphore:
+                received, body = await asyncio.to_thread(fetch, layer_url, params)
+            start = time.perf_counter()
+            page = parse_page(body)
+            return received, body, page, time.perf_counter() - start
+        except urllib.error.HTTPError as error:
+            if error.code not in RETRY_STATUSES:
+                raise DownloadError(f"HTTP {error.code} for {request_name.lower()}") from error
+            failure = error
+        except (urllib.error.URLError, TimeoutError, ConnectionError, DownloadError, ValueError) as error:
+            failure = error
+        if attempt < retries - 1:
+            await asyncio.sleep(backoff * 2 ** attempt)
+    raise DownloadError(f"{request_name} failed after {retries} attempts: {failure}")
+
+
+def write_checkpoint(path, body):
+    """
+    Writes a gzip-compressed page next to its final name and renames it, so a
+    page on disk is always complete. Returns the bytes written.
+    """
+    compressed = gzip.compress(body, PAGE_COMPRESSION)
+    partial_path = path + ".partial"
+    with open(partial_path, "wb") as page_file:
+        page_file.write(compressed)
+    os.replace(partial_path, path)
+    return len(compressed)
+
+
+def read_checkpoint(path):
+    with open(path, "rb") as page_file:
+        return gzip.decompress(page_file.read())
+
+
+async def download_tile(layer_url, tile_name, envelope, wkid, cache_folder, semaphore,
+                        page_size=PAGE_SIZE, payload=FULL_PAYLOAD, backoff=BACKOFF_SECONDS):
+    """
+    Downloads every page of one tile into its folder under cache_folder (see
+    tile_folder_name), resuming
+    after the pages already checkpointed. Each page starts at the offset where
+    the previous one ended, counted in the features it actually returned, so a
+    service that returns fewer than page_size features per page skips none.
+    Returns the tile's folder and payload statistics: pages, features, bytes
+    received, bytes of JSON, bytes stored and parse seconds. Bytes received
+    and parse seconds only count the pages fetched by this run.
+    """
+    tile_folder = os.path.join(cache_folder, tile_folder_name(layer_url, tile_name, envelope, wkid, payload))
+    if not os.path.exists(tile_folder):
+        os.makedirs(tile_folder)
+
+    progress = read_progress(tile_folder)
+    stats = {"tile": tile_name, "folder": tile_folder, "pages": progress["pages"], "features": progress["features"], "bytes_received": 0,
+             "bytes_json": progress["bytes_json"], "bytes_stored": progress["bytes_stored"], "parse_seconds": 0.0}
+    while not progress["done"]:
+        params = query_params(envelope, wkid, progress["offset"], page_size, payload)
+        received, body, page, parse_seconds = await fetch_with_retry(layer_url, params, semaphore, backoff=backoff)
+        stats["bytes_received"] += received
+        stats["parse_seconds"] += parse_seconds
+        stored = write_checkpoint(page_path(tile_folder, progress["pages"]), body)
+
+        n_features = len(page.get("features", []))
+        progress["pages"] += 1
+        progress["offset"] += n_features
+        progress["features"] += n_features
+        progress["bytes_json"] += len(body)
+        progress["bytes_stored"] += stored
+        progress["done"] = is_last_page(page, page_size)
+        write_progress(tile_folder, progress)
+        stats.update({key: progress[key] for key in ["pages", "features", "bytes_json", "bytes_stored"]})
+
+    print(f"{tile_name}: {stats['features']} features in {stats['pages']} pages")
+    return stats
+
+
+async def download_tiles_async(layer_url, tiles, cache_folder, page_size=PAGE_SIZE,
+                               max_connections=MAX_CONNECTIONS, payload=FULL_PAYLOAD, backoff=BACKOFF_SECONDS):
+    semaphore = asyncio.Semaphore(max_connections)
+    # A page the service caps at its maxRecordCount would otherwise look like the last one
+    _, _, layer_info, _ = await fetch_with_retry(layer_url, {"f": "json"}, semaphore, backoff=backoff,
+                                                 fetch=fetch_layer_info)
+    page_size = min(page_size, layer_info.get("maxRecordCount") or page_size)
+    jobs = [download_tile(layer_url, tile_name, envelope, wkid, cache_folder, semaphore, page_size, payload, backoff)
+            for tile_name, (envelope, wkid) in sorted(tiles.items())]
+    return await asyncio.gather(*jobs)
+
+
+def download_tiles(layer_url, tiles, cache_folder, page_size=PAGE_SIZE, max_connections=MAX_CONNECTIONS,
+                   payload=FULL_PAYLOAD, backoff=BACKOFF_SECONDS):
+    """
+    Downloads the features of every tile. tiles maps a tile name to
+    (envelope, wkid). Returns a list of per-tile payload statistics.
+    Rerunning after a failure only fetches the pages that are not on disk yet.
+    """
+    start = time.time()
+    results = asyncio.run(download_tiles_async(layer_url, tiles, cache_folder, page_size, max_connections, payload,
+                                               backoff))
+    print(f"{len(results)} tiles downloaded in {time.time() - start:.1f} s")
+    return results
+
+
+def report_payload(results, report_path=None):
+    """
+    Prints the bytes and parse time of every tile, and the saving of gzip on
+    the wire and on disk against the JSON the pages hold. Optionally writes the
+    statistics to report_path as JSON, so runs with different payload options
+    can be compared with compare_payload_reports.
+    """
+    print("tile, features, KB received, KB JSON, KB stored, parse ms")
+    for stats in results:
+        print(f"{stats['tile']}, {stats['features']}, {stats['bytes_received'] / 1024:.1f}, "
+              f"{stats['bytes_json'] / 1024:.1f}, {stats['bytes_stored'] / 1024:.1f}, "
+              f"{stats['parse_seconds'] * 1000:.1f}")
+    received = sum(stats["bytes_received"] for stats in results)
+    json_bytes = sum(stats["bytes_json"] for stats in results)
+    stored = sum(stats["bytes_stored"] for stats in results)
+    if received:
+        print(f"JSON / received: {json_bytes / received:.1f}x")
+    if stored:
+        print(f"JSON / stored: {json_bytes / stored:.1f}x")
+    if report_path is not None:
+        with open(report_path, "w") as report_file:
+            json.dump(results, report_file, indent=1)
+
+
+def compare_payload_reports(full_report_path, reduced_report_path):
+    """Prints the per-tile reduction in JSON bytes and parse time between two report_payload files."""
+    with open(full_report_path) as report_file:
+        full = {stats["tile"]: stats for stats in json.load(report_file)}
+    with open(reduced_report_path) as report_file:
+        reduced = {stats["tile"]: stats for stats in json.load(report_file)}
+
+    print("tile, JSON bytes reduction, parse time reduction")
+    for tile in sorted(set(full) & set(reduced)):
+        bytes_ratio = full[tile]["bytes_json"] / max(reduced[tile]["bytes_json"], 1)
+        parse_ratio = full[tile]["parse_seconds"] / max(reduced[tile]["parse_seconds"], 1e-9)
+        print(f"{tile}, {bytes_ratio:.1f}x, {parse_ratio:.1f}x")
+
+
+def tile_pages(tile_folder):
+    """Yields the checkpointed pages of a tile in page order, with quantized geometries decoded."""
+    for page_number in range(read_progress(tile_folder)["pages"]):
+        yield dequantize_page(parse_page(read_checkpoint(page_path(tile_folder, page_number))))
+
+
+def merge_tile_pages(tile_folder, output_json):
+    """
+    Concatenates the pages in a tile's folder (the "folder" of its download
+    statistics) into one Esri JSON feature set, dropping
+    features repeated across pages, ready for arcpy JSONToFeatures.
+    Returns the number of features written.
+    """
+    merged = None
+    seen = set()
+    for page in tile_pages(tile_folder):
+        if merged is None:
+            merged = {key: value for key, value in page.items() if key not in ["features", "exceededTransferLimit"]}
+            merged["features"] = []
+        object_id_field = merged.get("objectIdFieldName", "OBJECTID")
+        for feature in page.get("features", []):
+            object_id = feature.get("attributes", {}).get(object_id_field)
+            if object_id is not None:
+                if object_id in seen:
+                    continue
+                seen.add(object_id)
+            merged["features"].append(feature)
+
+    if merged is None:
+        merged = {"features": []}
+    with open(output_json, "w") as json_file:
+        json.dump(merged, json_file)
+    return len(merged["features"])
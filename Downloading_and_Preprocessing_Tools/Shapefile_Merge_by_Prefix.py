@@ -1,10 +1,13 @@
 import arcpy
 import os
-import time
+import sys
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+# Run tracing lives with the basin characteristic tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from RunTrace import mark, span, start_trace_from_environment
+
+start_trace_from_environment("Shapefile_Merge_by_Prefix")
+mark("Tool starts")
 
 # Check Spatial Analyst extension
 arcpy.CheckOutExtension("Spatial")
@@ -36,12 +39,9 @@ for tile_file in os.listdir(tiles_folder):
         clipped_files = [os.path.join(clipped_folder, f) for f in os.listdir(clipped_folder) if f.endswith('.shp') and f.startswith(tile_name)]
         if clipped_files:
             print('Will merge shapefiles:', clipped_files)
-            arcpy.Merge_management(clipped_files, os.path.join(merged_folder, f"{tile_name}_merged.shp"))
-        print(f"{tile_name}_merged.shp", ' is merged at')
-        current_time = time.strftime("%m-%d %X",time.localtime())
-        print(current_time)
+            with span("merge", "tile", tile=tile_name, inputs=len(clipped_files)):
+                arcpy.Merge_management(clipped_files, os.path.join(merged_folder, f"{tile_name}_merged.shp"))
+        mark(f"{tile_name}_merged.shp is merged")
 
 
-print("Tool done at:")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
\ No newline at end of file
+mark("Tool done")
\ No newline at end of file
@@ -1,6 +1,10 @@
 import arcpy
 import os
-import time
+import sys
+
+# Run tracing lives with the basin characteristic tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CreateBasinCharacteristicsTables"))
+from RunTrace import mark, start_trace_from_environment
 
 def merge_shapfiles_by_prefix(before_merge_folder, output_folder):
     shapefile_dict = {}
@@ -31,9 +35,8 @@ def merge_shapfiles_by_prefix(before_merge_folder, output_folder):
     print("Shapefiles merged")
     
 
-print("Tool starts")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+start_trace_from_environment("WetlandMergeAttributes")
+mark("Tool starts")
 
 
 # Check Spatial Analyst extension
@@ -97,6 +100,4 @@ for filename in os.listdir(input_folder):
 
 print("All shapefiles processed.")
 
-print("Tool done at:")
-current_time = time.strftime("%m-%d %X",time.localtime())
-print(current_time)
+mark("Tool done")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The tools are flat script folders rather than packages; put them on the path the way the scripts find each other
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ["CreateBasinCharacteristicsTables", "Downloading_and_Preprocessing_Tools", "Benchmarks"]:
+    sys.path.insert(0, os.path.join(ROOT, folder))
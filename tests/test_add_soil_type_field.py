@@ -0,0 +1,22 @@
+import numpy as np
+
+from AddSoilTypeField import SOIL_TYPE_LENGTH, format_soil_type, soil_types
+from SoilAccumulators import OTHER_SOIL_TYPE, SOIL_TYPE_FIELDS, soil_type_code
+
+
+def test_blank_and_dual_codes_are_mapped():
+    types = soil_types(np.array(["A/D", "", "B", "   ", "C/D", "A/D"]))
+    assert types.tolist() == ["A_D", "OtherSoilTypes", "B", "OtherSoilTypes", "C_D", "A_D"]
+    assert types.dtype == np.dtype(f"<U{SOIL_TYPE_LENGTH}")
+
+
+def test_null_code_is_other():
+    assert format_soil_type(None) == "OtherSoilTypes"
+
+
+def test_soil_types_land_in_the_accumulator_columns():
+    codes = ["A", "B", "C", "D", "A/D", "B/D", "C/D", "", None]
+    fields = [SOIL_TYPE_FIELDS[soil_type_code(format_soil_type(code))] for code in codes]
+    assert fields == ["SoilType_A", "SoilType_B", "SoilType_C", "SoilType_D", "SoilType_A_D", "SoilType_B_D",
+                      "SoilType_C_D", "OtherSoilTypes", "OtherSoilTypes"]
+    assert soil_type_code("OtherSoilTypes") == OTHER_SOIL_TYPE
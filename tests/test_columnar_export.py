@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+from ColumnarExport import (WIDE_TABLE_NAME, export_table, export_tables, read_columnar, rebuild_wide_table,
+                            table_path, wide_columns, write_columnar)
+
+
+def test_parquet_round_trip_keeps_dtypes_gid_order_and_nan(tmp_path):
+    folder = str(tmp_path / "columnar")
+    gids = [30, "10012", 7]
+    columns = {"Forest": np.array([1.5, np.nan, 3.0]), "Count": np.array([1, 2, 3], dtype=np.int32)}
+
+    path = write_columnar(folder, "NLCD", gids, columns)
+    assert path == table_path(folder, "NLCD") and os.listdir(folder) == ["NLCD.parquet"]
+
+    schema = pq.read_schema(path)
+    assert schema.names == ["GID", "Forest", "Count"]
+    assert [str(schema.field(name).type) for name in schema.names] == ["string", "double", "double"]
+
+    read_gids, read_values = read_columnar(path)
+    assert read_gids == ["30", "10012", "7"]
+    np.testing.assert_array_equal(read_values["Forest"], [1.5, np.nan, 3.0])
+    np.testing.assert_array_equal(read_values["Count"], [1.0, 2.0, 3.0])
+
+
+def test_arrow_round_trip(tmp_path):
+    path = write_columnar(str(tmp_path), "PRISM", ["B", "A"], {"Precip": [np.nan, 2.0]}, "arrow")
+    assert path.endswith(".arrow")
+    gids, columns = read_columnar(path)
+    assert gids == ["B", "A"]
+    np.testing.assert_array_equal(columns["Precip"], [np.nan, 2.0])
+
+
+TABLES = {
+    "NLCD": (["A", "B"], {"Forest": [10.0, 20.0], "Area": [1.0, 2.0]}),
+    "Soil": (["C", "B"], {"Area": [3.0, 4.0], "Ksat": [0.5, np.nan]}),
+}
+
+
+def check_wide(gids, columns):
+    assert gids == ["A", "B", "C"]
+    assert list(columns) == ["Forest", "NLCD_Area", "Soil_Area", "Ksat"]
+    np.testing.assert_array_equal(columns["Forest"], [10.0, 20.0, np.nan])
+    np.testing.assert_array_equal(columns["NLCD_Area"], [1.0, 2.0, np.nan])
+    np.testing.assert_array_equal(columns["Soil_Area"], [np.nan, 4.0, 3.0])
+    np.testing.assert_array_equal(columns["Ksat"], [np.nan, np.nan, 0.5])
+
+
+def test_wide_columns_join_different_gid_sets_and_prefix_clashing_names():
+    check_wide(*wide_columns(TABLES))
+
+
+def test_export_tables_writes_each_table_and_the_wide_table(tmp_path):
+    folder = str(tmp_path)
+    paths = export_tables(folder, TABLES)
+    assert [os.path.basename(path) for path in paths] == ["NLCD.parquet", "Soil.parquet", WIDE_TABLE_NAME + ".parquet"]
+    check_wide(*read_columnar(paths[-1]))
+
+
+def test_tables_exported_one_at_a_time_rebuild_the_same_wide_table(tmp_path):
+    folder = str(tmp_path)
+    for table_name, (gids, columns) in TABLES.items():
+        wide_path = export_table(folder, table_name, gids, columns)[-1]
+    check_wide(*read_columnar(wide_path))
+    # The wide table itself is never joined back in
+    check_wide(*read_columnar(rebuild_wide_table(folder)))
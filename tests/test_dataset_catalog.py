@@ -0,0 +1,19 @@
+from DatasetCatalog import refresh_catalog
+
+
+def fake_describe(path):
+    custom = "custom" in path
+    return {"kind": "shapefile", "xmin": 0.0, "ymin": 0.0, "xmax": 1.0, "ymax": 1.0,
+            "wkid": None if custom else 2236, "wkt": 'PROJCS["custom"]' if custom else 'PROJCS["2236"]',
+            "feature_count": 1}
+
+
+def test_wkid_and_wkt_are_stored_in_separate_columns(tmp_path):
+    for name in ["tile_1.shp", "custom_tile.shp"]:
+        (tmp_path / name).write_bytes(b"shp")
+    connection, described = refresh_catalog(str(tmp_path), describe=fake_describe)
+    assert described == 2
+    rows = dict((name, (wkid, wkt)) for name, wkid, wkt in connection.execute("SELECT name, wkid, wkt FROM datasets"))
+    assert rows == {"tile_1": (2236, 'PROJCS["2236"]'), "custom_tile": (None, 'PROJCS["custom"]')}
+    connection.close()
+
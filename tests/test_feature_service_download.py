@@ -0,0 +1,214 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from FeatureServiceDownload import (DownloadError, compare_payload_reports, download_tiles, merge_tile_pages,
+                                    payload_options, read_progress, report_payload, tile_folder_name)
+
+TILES = {"tile_1": ((0, 0, 10, 10), 2236)}
+
+
+class FeatureService(ThreadingHTTPServer):
+    """
+    Stand-in for a feature service layer with n_features features. Query pages
+    are capped at max_record_count; failures maps a resultOffset to the number
+    of 503 responses to send for it before answering. outFields is honoured,
+    and with quantizationParameters the geometries are sent as polygons
+    quantized and delta-encoded the way ArcGIS Server does it.
+    """
+
+    def __init__(self, n_features, max_record_count, send_limit_flag=True, failures=None):
+        super().__init__(("127.0.0.1", 0), ServiceHandler)
+        self.n_features = n_features
+        self.max_record_count = max_record_count
+        self.send_limit_flag = send_limit_flag
+        self.failures = dict(failures or {})
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/FeatureServer/0"
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, document):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.send_json(200, {"name": "SoilMapUnits", "maxRecordCount": self.server.max_record_count})
+
+    def do_POST(self):
+        service = self.server
+        params = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        offset = int(params["resultOffset"][0])
+        service.requests.append((offset, time.monotonic()))
+        if service.failures.get(offset, 0) > 0:
+            service.failures[offset] -= 1
+            self.send_json(503, {})
+            return
+
+        count = min(int(params["resultRecordCount"][0]), service.max_record_count)
+        object_ids = range(offset + 1, min(offset + count, service.n_features) + 1)
+        out_fields = params["outFields"][0]
+        attributes = [{name: value for name, value in feature_attributes(object_id).items()
+                       if out_fields == "*" or name in out_fields.split(",")} for object_id in object_ids]
+        if "quantizationParameters" in params:
+            quantization = json.loads(params["quantizationParameters"][0])
+            tolerance, extent = quantization["tolerance"], quantization["extent"]
+            page = {"objectIdFieldName": "OBJECTID", "geometryType": "esriGeometryPolygon",
+                    "transform": {"originPosition": "upperLeft", "scale": [tolerance, tolerance, 0, 0],
+                                  "translate": [extent["xmin"], extent["ymax"], 0, 0]},
+                    "features": [{"attributes": feature, "geometry": {"rings": [quantize(ring, tolerance, extent)]}}
+                                 for feature, ring in zip(attributes, map(feature_ring, object_ids))]}
+        else:
+            page = {"objectIdFieldName": "OBJECTID", "geometryType": "esriGeometryPoint",
+                    "features": [{"attributes": feature, "geometry": {"x": object_id, "y": 0}}
+                                 for feature, object_id in zip(attributes, object_ids)]}
+        if service.send_limit_flag and offset + count < service.n_features:
+            page["exceededTransferLimit"] = True
+        self.send_json(200, page)
+
+
+def feature_attributes(object_id):
+    return {"OBJECTID": object_id, "ksat": object_id / 10, "muname": f"Map unit {object_id} " + "loam " * 20}
+
+
+def feature_ring(object_id):
+    """A square of side 0.5 in the 0-10 tile, placed by the object id."""
+    x, y = object_id % 10 + 0.5, 9.5 - object_id // 10 % 10 * 0.5
+    return [[x, y], [x + 0.5, y], [x + 0.5, y - 0.5], [x, y - 0.5], [x, y]]
+
+
+def quantize(ring, tolerance, extent):
+    """Integer steps from the upper-left corner of the extent, each point as the delta from the last."""
+    steps = [(round((x - extent["xmin"]) / tolerance), round((extent["ymax"] - y) / tolerance)) for x, y in ring]
+    return [[x - previous_x, y - previous_y] for (x, y), (previous_x, previous_y) in zip(steps, [(0, 0)] + steps)]
+
+
+@pytest.fixture
+def service_factory():
+    services = []
+
+    def start(*args, **kwargs):
+        service = FeatureService(*args, **kwargs)
+        threading.Thread(target=service.serve_forever, daemon=True).start()
+        services.append(service)
+        return service
+
+    yield start
+    for service in services:
+        service.shutdown()
+        service.server_close()
+
+
+def merged_ids(tile_folder, tmp_path):
+    output_json = str(tmp_path / "merged.json")
+    merge_tile_pages(tile_folder, output_json)
+    with open(output_json) as json_file:
+        return [feature["attributes"]["OBJECTID"] for feature in json.load(json_file)["features"]]
+
+
+@pytest.mark.parametrize("send_limit_flag", [True, False])
+def test_pages_advance_by_the_features_returned(service_factory, tmp_path, send_limit_flag):
+    service = service_factory(1234, 300, send_limit_flag)
+    cache_folder = str(tmp_path / "cache")
+    results = download_tiles(service.url, TILES, cache_folder, page_size=2000, max_connections=2)
+
+    assert results[0]["features"] == 1234
+    assert [offset for offset, _ in service.requests] == [0, 300, 600, 900, 1200]
+    assert merged_ids(results[0]["folder"], tmp_path) == list(range(1, 1235))
+
+
+def test_failed_pages_are_retried_with_backoff(service_factory, tmp_path):
+    service = service_factory(500, 200, failures={200: 2})
+    cache_folder = str(tmp_path / "cache")
+    results = download_tiles(service.url, TILES, cache_folder, backoff=0.05)
+
+    times = [moment for offset, moment in service.requests if offset == 200]
+    assert len(times) == 3
+    assert times[1] - times[0] >= 0.05
+    assert times[2] - times[1] >= 0.1
+    assert merged_ids(results[0]["folder"], tmp_path) == list(range(1, 501))
+
+
+def test_interrupted_download_resumes_from_the_checkpoint(service_factory, tmp_path):
+    service = service_factory(1000, 250, failures={500: 5})
+    cache_folder = str(tmp_path / "cache")
+    with pytest.raises(DownloadError):
+        download_tiles(service.url, TILES, cache_folder, backoff=0.01)
+    tile_folder = str(tmp_path / "cache" / tile_folder_name(service.url, "tile_1", *TILES["tile_1"]))
+    progress = read_progress(tile_folder)
+    assert (progress["pages"], progress["offset"], progress["done"]) == (2, 500, False)
+
+    service.requests.clear()
+    results = download_tiles(service.url, TILES, cache_folder, backoff=0.01)
+    # The full last page is not trusted to be the last, so one empty page follows
+    assert [offset for offset, _ in service.requests] == [500, 750, 1000]
+    assert results[0]["features"] == 1000
+    assert results[0]["folder"] == tile_folder
+    assert merged_ids(tile_folder, tmp_path) == list(range(1, 1001))
+
+
+def test_pages_of_other_query_parameters_are_kept_apart(service_factory, tmp_path):
+    service = service_factory(100, 1000)
+    cache_folder = str(tmp_path / "cache")
+    full = download_tiles(service.url, TILES, cache_folder)
+    reduced = download_tiles(service.url, TILES, cache_folder,
+                             payload=payload_options(out_fields=["ksat"], max_allowable_offset=1, geometry_precision=1))
+    assert full[0]["folder"] != reduced[0]["folder"]
+    # The second payload was fetched, not resumed from the first one's pages
+    assert reduced[0]["bytes_received"] > 0
+    assert tile_folder_name(service.url, "tile_1", *TILES["tile_1"]) == \
+        tile_folder_name(service.url + "/", "tile_1", *TILES["tile_1"])
+
+
+def test_quantized_pages_are_decoded_to_map_coordinates(service_factory, tmp_path):
+    service = service_factory(30, 1000)
+    results = download_tiles(service.url, TILES, str(tmp_path / "cache"),
+                             payload=payload_options(quantization_tolerance=0.25))
+
+    output_json = str(tmp_path / "merged.json")
+    assert merge_tile_pages(results[0]["folder"], output_json) == 30
+    with open(output_json) as json_file:
+        merged = json.load(json_file)
+    assert "transform" not in merged
+    for feature in merged["features"]:
+        assert feature["geometry"]["rings"] == [feature_ring(feature["attributes"]["OBJECTID"])]
+
+
+def test_payload_report_shows_the_saving_of_a_field_whitelist(service_factory, tmp_path, capsys):
+    service = service_factory(400, 1000)
+    tiles = {"tile_1": ((0, 0, 10, 10), 2236), "tile_2": ((10, 0, 20, 10), 2236)}
+    full = download_tiles(service.url, tiles, str(tmp_path / "cache"))
+    reduced = download_tiles(service.url, tiles, str(tmp_path / "cache"), payload=payload_options(out_fields=["ksat"]))
+    full_report, reduced_report = str(tmp_path / "full.json"), str(tmp_path / "reduced.json")
+    report_payload(full, full_report)
+    report_payload(reduced, reduced_report)
+
+    with open(reduced_report) as report_file:
+        assert [stats["tile"] for stats in json.load(report_file)] == ["tile_1", "tile_2"]
+    for full_stats, reduced_stats in zip(full, reduced):
+        assert reduced_stats["features"] == full_stats["features"] == 400
+        assert reduced_stats["bytes_json"] < full_stats["bytes_json"] / 2
+
+    capsys.readouterr()
+    compare_payload_reports(full_report, reduced_report)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "tile, JSON bytes reduction, parse time reduction"
+    assert [line.split(", ")[0] for line in lines[1:]] == ["tile_1", "tile_2"]
+    for line in lines[1:]:
+        bytes_ratio = float(line.split(", ")[1].rstrip("x"))
+        assert bytes_ratio == pytest.approx(full[0]["bytes_json"] / reduced[0]["bytes_json"], abs=0.05)
+        assert bytes_ratio > 2
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from IncrementalCache import hash_basin_rows, incremental_columns, sql_values
+from ResultsStore import read_characteristics, upsert_columns
+from ZoneLabels import evict_zone_labels, zone_cache_paths
+
+
+def test_text_values_with_quotes_are_escaped():
+    gids = ["01", "O'Brien Creek", "it''s"]
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE basins (GID TEXT)")
+    connection.executemany("INSERT INTO basins VALUES (?)", [(gid,) for gid in gids + ["other"]])
+    selected = connection.execute(f"SELECT GID FROM basins WHERE GID IN ({sql_values(gids, True)})").fetchall()
+    assert sorted(gid for (gid,) in selected) == sorted(gids)
+
+
+def test_numeric_values_are_not_quoted():
+    assert sql_values([1, 20, 300], False) == "1,20,300"
+
+
+def test_removed_basins_are_deleted_from_the_results_store(tmp_path):
+    store_path = str(tmp_path / "store.sqlite")
+    cache_folder = str(tmp_path / "cache")
+
+    def compute(basins):
+        return ["A", "B", "C"], {"Forest": np.array([1.0, 2.0, 3.0])}
+
+    hashes = {"A": "a", "B": "b", "C": "c"}
+    gids, columns = incremental_columns("NLCD", "basins.shp", [], compute, cache_folder, hashes=hashes,
+                                        results_store=store_path, table_name="NLCD")
+    upsert_columns(store_path, "NLCD", gids, columns)
+
+    del hashes["C"]
+    gids, columns = incremental_columns("NLCD", "basins.shp", [], compute, cache_folder, hashes=hashes,
+                                        results_store=store_path, table_name="NLCD")
+    assert gids == ["A", "B"]
+    assert read_characteristics(store_path)[0] == ["A", "B"]
+
+
+def test_attribute_fields_change_the_basin_hash():
+    rows = [(2, "A", b"ring-2", 4.0), (1, "A", b"ring-1", 4.0), (3, "B", b"ring-3", 9.5)]
+    geometry_only = hash_basin_rows([row[:3] for row in rows])
+    with_area = hash_basin_rows(rows)
+
+    assert geometry_only.keys() == with_area.keys() == {"A", "B"}
+    assert geometry_only != with_area
+    # Polygons are taken in OID order, whatever order the cursor returns them in
+    assert hash_basin_rows(reversed(rows)) == with_area
+    changed = hash_basin_rows([(2, "A", b"ring-2", 4.0), (1, "A", b"ring-1", 4.0), (3, "B", b"ring-3", 9.6)])
+    assert changed["A"] == with_area["A"] and changed["B"] != with_area["B"]
+
+
+def test_each_zone_cache_slot_keeps_only_the_latest_basins(tmp_path):
+    cache_folder = str(tmp_path / "zone_cache")
+    os.makedirs(cache_folder)
+    grid = {"xmin": 0.0, "ymin": 0.0, "xmax": 10.0, "ymax": 10.0, "cell_width": 1.0, "cell_height": 1.0,
+            "rows": 10, "cols": 10, "spatial_reference": "synthetic"}
+    subset = tmp_path / "Wetland_basins.shp"
+    other = tmp_path / "basins.shp"
+    other.write_bytes(b"all basins")
+    other_paths = zone_cache_paths(cache_folder, str(other), "GID", grid)
+
+    written = []
+    for content in [b"first subset", b"second subset"]:
+        subset.write_bytes(content)
+        paths = zone_cache_paths(cache_folder, str(subset), "GID", grid)
+        for path in paths + other_paths:
+            open(path, "w").close()
+        evict_zone_labels(paths[0])
+        written.append(paths)
+
+    assert written[0] != written[1]
+    assert sorted(os.listdir(cache_folder)) == sorted(os.path.basename(path) for path in written[1] + other_paths)
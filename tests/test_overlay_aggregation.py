@@ -0,0 +1,24 @@
+import numpy as np
+
+from OverlayAggregation import group_fragment_areas, mismatched_totals
+
+
+def test_fragment_areas_are_summed_per_gid_and_class():
+    gids, classes, areas = group_fragment_areas(["B", "A", "B", "A", "B"],
+                                                ["Wetland", "LakePond", "Wetland", "Wetland", "LakePond"],
+                                                [1.0, 2.0, 0.5, 4.0, 3.0])
+    assert list(zip(gids, classes)) == [("A", "LakePond"), ("A", "Wetland"), ("B", "LakePond"), ("B", "Wetland")]
+    np.testing.assert_allclose(areas, [2.0, 4.0, 3.0, 1.5])
+
+
+def test_overlay_totals_within_tolerance_match():
+    expected = {"A": {"wetland": 1.0, "lakepond": 0.25}, "B": {"wetland": 0.0, "lakepond": 0.0}}
+    actual = {"A": {"wetland": 1.0005, "lakepond": 0.25}}
+    assert mismatched_totals(actual, expected, tolerance=0.001) == []
+
+
+def test_overlay_totals_outside_tolerance_are_reported():
+    expected = {"A": {"wetland": 1.0, "lakepond": 0.25}, "B": {"wetland": 2.0, "lakepond": 0.0}}
+    actual = {"A": {"wetland": 1.01, "lakepond": 0.25}, "B": {"lakepond": 0.1}}
+    assert mismatched_totals(actual, expected, tolerance=0.001) == [
+        ("A", "wetland", 1.01, 1.0), ("B", "lakepond", 0.1, 0.0), ("B", "wetland", 0.0, 2.0)]
@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+from Pipeline import load_config
+
+
+def write_config(tmp_path, **values):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(dict({"basins": "basins.shp", "output_folder": str(tmp_path)}, **values)))
+    return str(config_path)
+
+
+@pytest.mark.parametrize("workers", [0, -1, 1.5, "2"])
+def test_workers_below_one_are_rejected(tmp_path, workers):
+    with pytest.raises(ValueError, match="workers"):
+        load_config(write_config(tmp_path, workers=workers))
+
+
+def test_workers_override_is_checked_too(tmp_path):
+    assert load_config(write_config(tmp_path), {"workers": 3})["workers"] == 3
+    with pytest.raises(ValueError, match="workers"):
+        load_config(write_config(tmp_path), {"workers": 0})
@@ -0,0 +1,43 @@
+import numpy as np
+
+from PointSampling import sample_points
+
+# A 10 x 10 grid of unit cells from (0, 0) to (10, 10); cell (row, col) holds row * 10 + col
+GRID = {"xmin": 0.0, "ymin": 0.0, "xmax": 10.0, "ymax": 10.0, "cell_width": 1.0, "cell_height": 1.0,
+        "rows": 10, "cols": 10, "block_rows": 4, "block_cols": 4, "nodata": -9999}
+VALUES = (np.arange(10)[:, np.newaxis] * 10 + np.arange(10)).astype(np.float64)
+
+
+def read_window(row0, col0, nrows, ncols):
+    return VALUES[row0:row0 + nrows, col0:col0 + ncols]
+
+
+def test_nearest_reads_the_cell_under_the_point():
+    samples = sample_points(read_window, GRID, [0.5, 9.5, 4.2], [9.5, 0.5, 4.9])
+    np.testing.assert_array_equal(samples, [0, 99, 54])
+
+
+def test_window_average_skips_cells_off_the_grid():
+    # At the corner only the 2 x 2 cells on the grid are averaged
+    samples = sample_points(read_window, GRID, [0.5], [9.5], window=1)
+    np.testing.assert_allclose(samples, [(0 + 1 + 10 + 11) / 4])
+
+
+def test_points_off_the_grid_are_nan_even_when_taps_reach_the_grid():
+    xs, ys = [-1.0, 5.5, 10.4], [5.0, -0.3, 5.5]
+    for method, window in [("nearest", 0), ("nearest", 1), ("nearest", 2), ("bilinear", 0)]:
+        samples = sample_points(read_window, GRID, xs, ys, method, window)
+        assert np.isnan(samples).all(), (method, window, samples)
+
+
+def test_bilinear_between_cell_centres():
+    samples = sample_points(read_window, GRID, [1.0, 2.5], [9.0, 7.5], method="bilinear")
+    np.testing.assert_allclose(samples, [(0 + 1 + 10 + 11) / 4, 22])
+
+
+def test_nodata_taps_are_left_out():
+    values = VALUES.copy()
+    values[5, 5] = GRID["nodata"]
+    samples = sample_points(lambda r, c, nr, nc: values[r:r + nr, c:c + nc], GRID, [5.5, 5.5], [4.5, 4.5 + 1],
+                            window=0)
+    assert np.isnan(samples[0]) and samples[1] == 45
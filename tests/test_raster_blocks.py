@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from RasterBlocks import block_windows, peak_rss_mb, subgrid
+
+TOOLS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CreateBasinCharacteristicsTables")
+
+# Streams an 8192 x 8192 synthetic NLCD raster (64 MB of values, 256 MB of zone labels if held whole)
+# through the tool's histogram loop in a fresh process, so the peak RSS belongs to this run only
+STREAM_SCRIPT = """
+import sys
+import numpy as np
+from NLCDHistogram import stream_histogram
+from RasterBlocks import peak_rss_mb
+
+rows = cols = 8192
+max_memory_mb = int(sys.argv[1])
+grid = {"rows": rows, "cols": cols, "block_rows": 256, "block_cols": 256, "nodata": 0}
+classes = np.array([11, 21, 41, 0], dtype=np.uint8)[np.arange(cols) % 4]
+labels = (np.arange(cols) % 3).astype(np.int32)
+
+def read_window(row0, col0, nrows, ncols):
+    block = np.empty((nrows, ncols), dtype=np.uint8)
+    block[:] = classes[col0:col0 + ncols]
+    return block
+
+def zone_window(row0, col0, nrows, ncols):
+    block = np.empty((1, nrows, ncols), dtype=np.int32)
+    block[:] = labels[col0:col0 + ncols]
+    return block
+
+before = peak_rss_mb()
+counts = stream_histogram(read_window, zone_window, 1, grid, 2, max_memory_mb)
+print(peak_rss_mb() - before)
+np.save(sys.argv[2], counts)
+"""
+
+
+def test_windows_cover_the_grid_once():
+    grid = {"rows": 1000, "cols": 700, "block_rows": 128, "block_cols": 128}
+    covered = np.zeros((1000, 700), dtype=np.int64)
+    for row0, col0, nrows, ncols in block_windows(grid, max_memory_mb=1, bytes_per_cell=8):
+        assert nrows * ncols * 8 <= 1024 * 1024 or (nrows, ncols) == (128, 128)
+        covered[row0:row0 + nrows, col0:col0 + ncols] += 1
+    assert (covered == 1).all()
+
+
+def test_subgrid_of_whole_blocks_trims_back_to_the_extent():
+    grid = {"xmin": 0, "ymin": 0, "xmax": 1000, "ymax": 1000, "cell_width": 1, "cell_height": 1,
+            "rows": 1000, "cols": 1000, "block_rows": 128, "block_cols": 128}
+    extent = (300.5, 200.2, 410.7, 500.9)
+    blocks = subgrid(grid, *extent)
+    cells = subgrid(blocks, *extent, whole_blocks=False)
+
+    assert (blocks["row_offset"], blocks["col_offset"]) == (384, 256)
+    assert (cells["row_offset"], cells["col_offset"], cells["rows"], cells["cols"]) == (499, 300, 301, 111)
+    assert (cells["xmin"], cells["ymin"], cells["xmax"], cells["ymax"]) == (300, 200, 411, 501)
+    assert cells == subgrid(grid, *extent, whole_blocks=False)
+
+
+@pytest.mark.skipif(peak_rss_mb() is None, reason="peak RSS is not available on this platform")
+def test_streamed_histogram_stays_under_memory_ceiling(tmp_path):
+    max_memory_mb = 16
+    counts_path = str(tmp_path / "counts.npy")
+    environment = dict(os.environ, PYTHONPATH=TOOLS)
+    result = subprocess.run([sys.executable, "-c", STREAM_SCRIPT, str(max_memory_mb), counts_path],
+                            env=environment, capture_output=True, text=True, check=True)
+    growth_mb = float(result.stdout.strip())
+    counts = np.load(counts_path)
+
+    assert growth_mb <= max_memory_mb
+
+    # Every row repeats the same column pattern: column c holds class [11, 21, 41, NoData][c % 4] in zone c % 3
+    columns = np.arange(8192)
+    expected = np.zeros((2, 256), dtype=np.int64)
+    for zone in (1, 2):
+        for class_value in (11, 21, 41):
+            position = [11, 21, 41].index(class_value)
+            expected[zone - 1, class_value] = 8192 * np.count_nonzero((columns % 3 == zone) & (columns % 4 == position))
+    np.testing.assert_array_equal(counts, expected)
+    assert counts.sum() == 8192 * np.count_nonzero((columns % 3 > 0) & (columns % 4 < 3))
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+from RasterBlocks import grid_rows, subgrid
+from RasterCache import cache_paths, cached_raster, read_cached_window
+
+
+def synthetic_grid(rows, cols, block_size=4):
+    return {"xmin": 0.0, "ymin": 0.0, "xmax": float(cols), "ymax": float(rows), "cell_width": 1.0,
+            "cell_height": 1.0, "rows": rows, "cols": cols, "nodata": -9999.0, "block_rows": block_size,
+            "block_cols": block_size, "spatial_reference": "synthetic"}
+
+
+class SyntheticRaster:
+    """A .npy file standing in for a raster: describe and reader as cached_raster expects, counting the reads."""
+
+    def __init__(self, path, values):
+        self.path = str(path)
+        self.reads = 0
+        self.write(values)
+
+    def write(self, values):
+        np.save(self.path, values)
+
+    def describe(self, raster_path):
+        values = np.load(raster_path)
+        return synthetic_grid(*values.shape)
+
+    def reader(self, raster_path, grid, row0, col0, nrows, ncols):
+        self.reads += 1
+        return np.load(raster_path)[row0:row0 + nrows, col0:col0 + ncols]
+
+
+def load(raster, cache_folder):
+    return cached_raster(raster.path, str(cache_folder), 1, raster.describe, raster.reader)
+
+
+def test_cached_windows_match_the_raster_reads(tmp_path):
+    values = np.random.default_rng(0).random((37, 29)).astype(np.float32)
+    raster = SyntheticRaster(tmp_path / "ppt.npy", values)
+    grid, array = load(raster, tmp_path / "cache")
+
+    assert array.dtype == np.float32
+    band = grid_rows(grid, 8, 12)
+    window = subgrid(grid, 3.5, 10.0, 20.0, 30.5, whole_blocks=False)
+    for view_grid in [grid, band, window]:
+        for row0, col0, nrows, ncols in [(0, 0, None, None), (2, 3, 5, 7)]:
+            nrows = view_grid["rows"] - row0 if nrows is None else nrows
+            ncols = view_grid["cols"] - col0 if ncols is None else ncols
+            expected = raster.reader(raster.path, grid, view_grid.get("row_offset", 0) + row0,
+                                     view_grid.get("col_offset", 0) + col0, nrows, ncols)
+            np.testing.assert_array_equal(read_cached_window(array, grid, view_grid, row0, col0, nrows, ncols),
+                                          expected)
+
+
+def test_cached_windows_are_views_of_the_mapped_file(tmp_path):
+    raster = SyntheticRaster(tmp_path / "ppt.npy", np.arange(64, dtype=np.float64).reshape(8, 8))
+    grid, array = load(raster, tmp_path / "cache")
+    window = read_cached_window(array, grid, grid, 2, 3, 4, 4)
+    assert isinstance(array, np.memmap)
+    assert not window.flags.owndata
+    assert np.shares_memory(window, array)
+
+
+def test_size_or_mtime_change_rebuilds_the_entry(tmp_path):
+    raster = SyntheticRaster(tmp_path / "ppt.npy", np.zeros((8, 8)))
+    load(raster, tmp_path / "cache")
+    reads = raster.reads
+    load(raster, tmp_path / "cache")
+    assert raster.reads == reads
+
+    raster.write(np.ones((8, 12)))
+    grid, array = load(raster, tmp_path / "cache")
+    assert raster.reads > reads
+    assert array.shape == (8, 12) and array.sum() == 96
+
+    reads = raster.reads
+    raster.write(np.full((8, 12), 2.0))
+    mtime = os.path.getmtime(raster.path) + 10
+    os.utime(raster.path, (mtime, mtime))
+    grid, array = load(raster, tmp_path / "cache")
+    assert raster.reads > reads
+    assert array.sum() == 192
+
+
+def test_partial_file_of_an_interrupted_conversion_is_not_used(tmp_path):
+    raster = SyntheticRaster(tmp_path / "ppt.npy", np.arange(20, dtype=np.float64).reshape(4, 5))
+    cache_folder = tmp_path / "cache"
+    os.makedirs(cache_folder)
+    array_path, header_path = cache_paths(raster.path, str(cache_folder))
+    np.save(array_path + ".partial.npy", np.full((4, 5), -1.0))
+
+    grid, array = load(raster, cache_folder)
+    np.testing.assert_array_equal(array, np.arange(20).reshape(4, 5))
+    assert not os.path.exists(array_path + ".partial.npy")
+
+
+def test_raster_with_no_cells_is_cached_empty(tmp_path):
+    raster = SyntheticRaster(tmp_path / "empty.npy", np.zeros((0, 5), dtype=np.float32))
+    grid, array = load(raster, tmp_path / "cache")
+    assert array.shape == (0, 5)
+    assert raster.reads == 0
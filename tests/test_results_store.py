@@ -0,0 +1,42 @@
+import sqlite3
+
+import numpy as np
+
+from ResultsStore import VIEW_NAME, delete_gids, read_characteristics, upsert_columns
+
+
+def query_plan(store_path):
+    connection = sqlite3.connect(store_path)
+    try:
+        return " | ".join(row[-1] for row in connection.execute(f'EXPLAIN QUERY PLAN SELECT * FROM "{VIEW_NAME}"'))
+    finally:
+        connection.close()
+
+
+def test_view_joins_every_table_to_the_gid_table(tmp_path):
+    store_path = str(tmp_path / "store.sqlite")
+    upsert_columns(store_path, "NLCD", ["A", "B"], {"Forest": [10.0, 20.0]})
+    upsert_columns(store_path, "PRISM", ["B", "C"], {"Precip": [1.0, np.nan]})
+
+    gids, columns = read_characteristics(store_path)
+    assert gids == ["A", "B", "C"]
+    np.testing.assert_allclose(columns["Forest"], [10.0, 20.0, np.nan])
+    np.testing.assert_allclose(columns["Precip"], [np.nan, 1.0, np.nan])
+
+    plan = query_plan(store_path)
+    assert "SCAN g" in plan
+    assert "UNION" not in plan and "TEMP B-TREE" not in plan
+
+
+def test_deleted_gids_leave_the_store(tmp_path):
+    store_path = str(tmp_path / "store.sqlite")
+    upsert_columns(store_path, "NLCD", ["A", "B", "C"], {"Forest": [1.0, 2.0, 3.0]})
+    upsert_columns(store_path, "PRISM", ["A", "B"], {"Precip": [1.0, 2.0]})
+
+    # B is still in PRISM, so only C leaves the store
+    assert delete_gids(store_path, ["B", "C"], ["NLCD", "Missing"]) == 1
+    assert read_characteristics(store_path)[0] == ["A", "B"]
+    assert read_characteristics(store_path, "NLCD")[0] == ["A"]
+    assert delete_gids(store_path, ["B"]) == 1
+    assert read_characteristics(store_path)[0] == ["A"]
+
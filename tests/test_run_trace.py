@@ -0,0 +1,110 @@
+import json
+import os
+
+import pytest
+
+import RunTrace
+from RunTrace import (chrome_events, count, mark, merge_traces, read_jsonl, slowest_spans, span, start_trace,
+                      start_trace_from_environment, stop_trace, tracing)
+
+
+@pytest.fixture(autouse=True)
+def no_trace_left_running():
+    yield
+    stop_trace()
+
+
+def traced_run(prefix):
+    start_trace(prefix, sample_memory=False)
+    with span("overlay", "stage"):
+        for gid in ["A", "B"]:
+            with span("basin", "basin", gid=gid):
+                with span("intersect", rows=3):
+                    count("features_read", 3)
+        mark("overlay done")
+    return stop_trace()
+
+
+def test_spans_nest_stage_basin_operation(tmp_path):
+    jsonl_path, _ = traced_run(str(tmp_path / "run"))
+    spans = [event for event in read_jsonl(jsonl_path) if event["type"] == "span"]
+
+    # Spans are recorded as they close, innermost first
+    assert [(event["name"], event["cat"], event["depth"]) for event in spans] == [
+        ("intersect", "operation", 2), ("basin", "basin", 1), ("intersect", "operation", 2), ("basin", "basin", 1),
+        ("overlay", "stage", 0)]
+    stage = spans[-1]
+    for event in spans[:-1]:
+        assert stage["ts"] <= event["ts"] and event["ts"] + event["dur"] <= stage["ts"] + stage["dur"]
+    assert [event["args"] for event in spans if event["cat"] == "basin"] == [{"gid": "A"}, {"gid": "B"}]
+    assert sorted(event["args"]["gid"] for event in slowest_spans(spans)) == ["A", "B"]
+
+
+def test_counters_accumulate_and_marks_are_recorded(tmp_path):
+    jsonl_path, _ = traced_run(str(tmp_path / "run"))
+    events = read_jsonl(jsonl_path)
+
+    assert [event["value"] for event in events if event["type"] == "counter"] == [3, 6]
+    assert [event["name"] for event in events if event["type"] == "mark"] == ["overlay done"]
+    # Every line of the JSONL file is one event
+    with open(jsonl_path) as jsonl_file:
+        assert len(jsonl_file.read().splitlines()) == len(events) == 5 + 2 + 1
+
+
+def test_failed_span_records_the_error(tmp_path):
+    start_trace(str(tmp_path / "run"), sample_memory=False)
+    with pytest.raises(KeyError):
+        with span("lookup"):
+            raise KeyError("GID")
+    jsonl_path, _ = stop_trace()
+    assert read_jsonl(jsonl_path)[0]["args"] == {"error": "KeyError"}
+
+
+def test_chrome_events_map_each_event_type():
+    events = [{"type": "span", "name": "basin", "cat": "basin", "ts": 10.0, "dur": 5.0, "depth": 0, "pid": 1,
+               "tid": 2, "args": {"gid": "A"}},
+              {"type": "counter", "name": "features_read", "ts": 12.0, "value": 4, "pid": 1, "tid": 2},
+              {"type": "mark", "name": "done", "ts": 15.0, "pid": 1, "tid": 2}]
+
+    assert chrome_events(events) == [
+        {"name": "basin", "cat": "basin", "ph": "X", "ts": 10.0, "dur": 5.0, "pid": 1, "tid": 2, "args": {"gid": "A"}},
+        {"name": "features_read", "ph": "C", "ts": 12.0, "pid": 1, "tid": 2, "args": {"features_read": 4}},
+        {"name": "done", "ph": "i", "s": "p", "ts": 15.0, "pid": 1, "tid": 2}]
+
+
+def test_merged_trace_keeps_every_process(tmp_path):
+    first, _ = traced_run(str(tmp_path / "first"))
+    second, _ = traced_run(str(tmp_path / "second"))
+    for path, pid in [(first, 101), (second, 102)]:
+        events = [dict(event, pid=pid) for event in read_jsonl(path)]
+        with open(path, "w") as jsonl_file:
+            jsonl_file.writelines(json.dumps(event) + "\n" for event in events)
+
+    chrome_path = merge_traces([first, second], str(tmp_path / "merged"))
+    with open(chrome_path) as trace_file:
+        trace = json.load(trace_file)
+    assert trace["displayTimeUnit"] == "ms"
+    assert len(trace["traceEvents"]) == 16
+    assert sorted(set(event["pid"] for event in trace["traceEvents"])) == [101, 102]
+    assert len(read_jsonl(str(tmp_path / "merged.jsonl"))) == 16
+
+
+def test_disabled_tracing_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.delenv(RunTrace.TRACE_ENVIRONMENT_VARIABLE, raising=False)
+    assert not start_trace_from_environment("PRISM")
+    assert not tracing()
+    assert isinstance(span("overlay", "stage"), RunTrace._NullSpan)
+    with span("overlay", "stage"):
+        count("features_read", 3)
+    assert stop_trace() is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_environment_variable_starts_a_trace(tmp_path, monkeypatch):
+    monkeypatch.setenv(RunTrace.TRACE_ENVIRONMENT_VARIABLE, str(tmp_path / "traces"))
+    assert start_trace_from_environment("PRISM")
+    with span("overlay", "stage"):
+        pass
+    jsonl_path, chrome_path = stop_trace()
+    assert os.path.dirname(jsonl_path) == str(tmp_path / "traces")
+    assert os.path.basename(jsonl_path).startswith("PRISM_") and os.path.exists(chrome_path)
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from SoilAccumulators import (SOIL_TYPE_FIELDS, accumulate_soil_chunk, merge_accumulators, remove_stale_partials,
+                              soil_accumulators, soil_results, soil_type_code, tile_partial_path)
+
+NAN = float("nan")
+
+
+def test_missing_ksat_is_left_out_of_the_weighted_mean():
+    accumulators = soil_accumulators(3)
+    # Basin 0: 2 sq units at ksat 10 and 2 with no ksat; basin 1: no ksat at all; basin 2: no soil
+    accumulate_soil_chunk(accumulators, [0, 0, 1, -1], [soil_type_code("A"), soil_type_code("B"),
+                                                        soil_type_code("C"), 0], [10.0, NAN, NAN, 5.0],
+                          [2.0, 2.0, 1.0, 9.0])
+    gids, columns = soil_results(["g0", "g1", "g2"], accumulators)
+
+    assert gids == ["g0", "g1"]
+    np.testing.assert_allclose(columns["ksat_weighted"][0], 10.0)
+    assert np.isnan(columns["ksat_weighted"][1])
+    np.testing.assert_allclose(columns["SoilType_A"], [50, 0])
+    np.testing.assert_allclose(columns["SoilType_B"], [50, 0])
+    np.testing.assert_allclose(columns["SoilType_C"], [0, 100])
+
+
+def test_chunked_and_merged_sums_match_one_pass():
+    rng = np.random.default_rng(1)
+    gid_codes = rng.integers(0, 5, 500)
+    type_codes = rng.integers(0, len(SOIL_TYPE_FIELDS), 500)
+    ksat = np.where(rng.random(500) < 0.2, np.nan, rng.random(500) * 20)
+    areas = rng.random(500)
+
+    whole = accumulate_soil_chunk(soil_accumulators(5), gid_codes, type_codes, ksat, areas)
+    parts = [accumulate_soil_chunk(soil_accumulators(5), gid_codes[start:start + 100], type_codes[start:start + 100],
+                                   ksat[start:start + 100], areas[start:start + 100]) for start in range(0, 500, 100)]
+    merged = soil_accumulators(5)
+    for part in parts:
+        merge_accumulators(merged, part)
+
+    for key in whole:
+        np.testing.assert_allclose(merged[key], whole[key])
+    known = ~np.isnan(ksat)
+    expected = [np.average(ksat[known & (gid_codes == gid)], weights=areas[known & (gid_codes == gid)])
+                for gid in range(5)]
+    np.testing.assert_allclose(soil_results(list(range(5)), merged)[1]["ksat_weighted"], expected)
+
+
+def test_tile_partials_are_keyed_on_the_inputs_and_gid_list(tmp_path):
+    soil, basins, tile = (tmp_path / name for name in ["soil.shp", "basins.shp", "tile_1.shp"])
+    for path in [soil, basins, tile]:
+        path.write_bytes(b"shp")
+    partial_folder = tmp_path / "tiles"
+    partial_folder.mkdir()
+
+    path = tile_partial_path(str(partial_folder), str(tile), str(soil), str(basins), ["A", "B"])
+    assert os.path.basename(path).startswith("tile_1_")
+    assert path == tile_partial_path(str(partial_folder), str(tile), str(soil), str(basins), ["A", "B"])
+    assert path != tile_partial_path(str(partial_folder), str(tile), str(soil), str(basins), ["A", "C"])
+
+    open(path, "wb").close()
+    basins.write_bytes(b"edited basins")
+    new_path = tile_partial_path(str(partial_folder), str(tile), str(soil), str(basins), ["A", "B"])
+    assert new_path != path
+
+    assert remove_stale_partials(str(partial_folder), [new_path]) == 1
+    assert os.listdir(partial_folder) == []
@@ -0,0 +1,46 @@
+import sqlite3
+
+import numpy as np
+
+from SpatialIndex import brute_force_pairs, build_str_tree, oid_ranges, query_pairs, selection_clause
+
+
+def selected(clause, invert, all_oids):
+    """OIDs a layer of all_oids would select with the clause, evaluated by SQLite."""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE layer (OBJECTID INTEGER)")
+    connection.executemany("INSERT INTO layer VALUES (?)", [(int(oid),) for oid in all_oids])
+    where = f"NOT ({clause})" if invert else clause
+    return sorted(row[0] for row in connection.execute(f"SELECT OBJECTID FROM layer WHERE {where}"))
+
+
+def test_oid_ranges_group_consecutive_oids():
+    starts, ends = oid_ranges([7, 3, 4, 5, 10, 11, 4])
+    assert list(starts) == [3, 7, 10]
+    assert list(ends) == [5, 7, 11]
+
+
+def test_single_selection_matches_exactly_the_oids():
+    rng = np.random.default_rng(1)
+    all_oids = np.arange(1, 5001)
+    for oids in [all_oids[100:4000], rng.choice(all_oids, 300, replace=False), all_oids[:0],
+                 np.setdiff1d(all_oids, rng.choice(all_oids, 20, replace=False))]:
+        clause, invert = selection_clause("OBJECTID", oids, all_oids)
+        assert selected(clause, invert, all_oids) == sorted(int(oid) for oid in oids)
+
+
+def test_selection_inverts_when_the_left_out_features_are_fewer():
+    all_oids = np.arange(1, 1001)
+    clause, invert = selection_clause("OBJECTID", np.setdiff1d(all_oids, [10, 500, 900]), all_oids)
+    assert invert
+    assert clause == "OBJECTID IN (10,500,900)"
+
+
+def test_str_tree_finds_the_same_pairs_as_brute_force():
+    rng = np.random.default_rng(2)
+    corners = rng.random((3000, 2)) * 1000
+    features = np.column_stack([corners, corners + rng.random((3000, 2)) * 20])
+    corners = rng.random((200, 2)) * 1000
+    basins = np.column_stack([corners, corners + rng.random((200, 2)) * 100])
+    pairs = query_pairs(build_str_tree(features), basins)
+    assert set(zip(*pairs)) == set(zip(*brute_force_pairs(basins, features)))
@@ -0,0 +1,126 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from RasterCache import cached_raster
+from StackedZonal import (parallel_stacked_zonal_sums, raster_field_names, stacked_zonal_means, stacked_zonal_sums,
+                          worker_pool, zonal_units)
+
+NODATA = -9999.0
+ROWS, COLS = 40, 36
+# Basins as (row0, row1, col0, col1) cell ranges and their zone layer: 2 lies inside 1, 3 inside 2
+BASINS = [(0, 30, 0, 36, 0), (5, 25, 4, 30, 1), (10, 15, 10, 20, 2), (30, 40, 0, 36, 0), (32, 38, 2, 8, 1)]
+
+
+def synthetic_grid():
+    return {"xmin": 0.0, "ymin": 0.0, "xmax": float(COLS), "ymax": float(ROWS), "cell_width": 1.0,
+            "cell_height": 1.0, "rows": ROWS, "cols": COLS, "nodata": NODATA, "block_rows": 8, "block_cols": 8,
+            "spatial_reference": "synthetic"}
+
+
+def synthetic_stack(folder, cache_folder, n_rasters=3):
+    """.npy rasters with scattered NoData, converted into the raster cache so no arcpy read is needed."""
+    rng = np.random.default_rng(5)
+    rasters = []
+    for index in range(n_rasters):
+        values = rng.random((ROWS, COLS)) * 100
+        values[rng.random((ROWS, COLS)) < 0.1] = NODATA
+        path = os.path.join(folder, f"raster_{index}.npy")
+        np.save(path, values)
+        cached_raster(path, cache_folder, describe=lambda raster_path: synthetic_grid(),
+                      reader=lambda raster_path, grid, row0, col0, nrows, ncols:
+                      np.load(raster_path)[row0:row0 + nrows, col0:col0 + ncols])
+        rasters.append(path)
+    return rasters
+
+
+def synthetic_zones(path):
+    zones = np.lib.format.open_memmap(path, mode="w+", dtype=np.int32, shape=(3, ROWS, COLS))
+    for label, (row0, row1, col0, col1, layer) in enumerate(BASINS, start=1):
+        zones[layer, row0:row1, col0:col1] = label
+    zones.flush()
+    return np.load(path, mmap_mode="r")
+
+
+def brute_force_means(raster):
+    values = np.load(raster)
+    means = []
+    for row0, row1, col0, col1, layer in BASINS:
+        cells = values[row0:row1, col0:col1]
+        means.append(cells[cells != NODATA].mean())
+    return np.array(means)
+
+
+def test_unique_short_names_are_kept():
+    assert raster_field_names(["/prism/tmean_30yr.tif", "/prism/ppt_30yr.tif"]) == ["tmean_30", "ppt_30yr"]
+
+
+def test_colliding_short_names_use_the_whole_file_name():
+    rasters = ["/prism/PRISM_ppt_30yr_normal.tif", "/prism/PRISM_ppt-max.tif", "/prism/tmean.tif"]
+    assert raster_field_names(rasters) == ["PRISM_ppt_30yr_normal", "PRISM_ppt_max", "tmean"]
+
+
+def test_same_file_name_twice_raises():
+    with pytest.raises(ValueError):
+        raster_field_names(["/a/PRISM_ppt.tif", "/b/PRISM_ppt.tif"])
+
+
+def test_atlas14_names_sharing_a_10_character_prefix_keep_their_whole_names():
+    renames = {"Atlas14_10": "PrecFr10yr", "Atlas14_2y": "PrecFr2yr"}
+    rasters = ["/atlas14/Atlas14_100yr.tif", "/atlas14/Atlas14_10yr.tif", "/atlas14/Atlas14_2yr.tif"]
+    assert raster_field_names(rasters, 10, renames) == ["Atlas14_100yr", "Atlas14_10yr", "PrecFr2yr"]
+    assert raster_field_names(rasters[1:], 10, renames) == ["PrecFr10yr", "PrecFr2yr"]
+
+
+def test_renamed_field_clashing_with_another_raster_raises():
+    with pytest.raises(ValueError, match="PrecFr2yr"):
+        raster_field_names(["/atlas14/Atlas14_2yr.tif", "/atlas14/PrecFr2yr.tif"], 10, {"Atlas14_2y": "PrecFr2yr"})
+
+
+def test_worker_pool_removes_its_scratch_folders(tmp_path):
+    scratch_root = str(tmp_path / "scratch")
+    with worker_pool(2, scratch_root) as executor:
+        worker_scratch = executor.submit(tempfile.gettempdir).result()
+        assert os.path.dirname(os.path.dirname(worker_scratch)) == scratch_root
+        assert os.path.isdir(worker_scratch)
+    assert os.listdir(scratch_root) == []
+
+
+def test_stacked_means_match_brute_force_over_nested_zones(tmp_path):
+    cache_folder = str(tmp_path / "cache")
+    rasters = synthetic_stack(str(tmp_path), cache_folder)
+    zones = synthetic_zones(str(tmp_path / "zones.npy"))
+
+    # A 0.01 MB ceiling streams the grid in many windows of whole blocks
+    sums, counts = stacked_zonal_sums(rasters, [NODATA] * len(rasters), zones, synthetic_grid(), len(BASINS), 0.01,
+                                      cache_folder)
+    for index, raster in enumerate(rasters):
+        np.testing.assert_allclose(sums[index] / counts[index], brute_force_means(raster))
+
+    columns = stacked_zonal_means(rasters, zones, synthetic_grid(), len(BASINS), raster_cache_folder=cache_folder)
+    assert list(columns) == ["raster_0", "raster_1", "raster_2"]
+    for raster, name in zip(rasters, columns):
+        np.testing.assert_allclose(columns[name], brute_force_means(raster))
+
+
+def test_empty_raster_list_gives_no_columns():
+    assert zonal_units(0, synthetic_grid(), 2) == []
+    assert stacked_zonal_means([], np.zeros((1, ROWS, COLS), dtype=np.int32), synthetic_grid(), 3, workers=2) == {}
+
+
+def test_pooled_sums_equal_the_serial_pass(tmp_path):
+    cache_folder = str(tmp_path / "cache")
+    rasters = synthetic_stack(str(tmp_path), cache_folder, n_rasters=5)
+    zones = synthetic_zones(str(tmp_path / "zones.npy"))
+    nodata_values = [NODATA] * len(rasters)
+
+    serial_sums, serial_counts = stacked_zonal_sums(rasters, nodata_values, zones, synthetic_grid(), len(BASINS),
+                                                    0.01, cache_folder)
+    # Two workers get four units: raster groups times row bands, merged back in unit order
+    assert len(zonal_units(len(rasters), synthetic_grid(), 2)) == 4
+    sums, counts = parallel_stacked_zonal_sums(rasters, nodata_values, zones.filename, synthetic_grid(), len(BASINS),
+                                               2, str(tmp_path / "scratch"), 0.02, cache_folder)
+    np.testing.assert_array_equal(counts, serial_counts)
+    np.testing.assert_allclose(sums, serial_sums, rtol=1e-12)
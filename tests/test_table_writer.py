@@ -0,0 +1,38 @@
+import numpy as np
+
+from TableWriter import align_columns, columns_to_records, summarize_columns
+
+
+def test_records_hold_the_gid_as_text_and_every_column_as_float64():
+    records = columns_to_records([7, "10012", 3], {"PRISM_01": [1, 2, 3], "PRISM_02": np.array([0.5, np.nan, 2.5], dtype=np.float32)})
+
+    assert records.dtype.names == ("GID", "PRISM_01", "PRISM_02")
+    assert records.dtype["GID"] == np.dtype("<U5")
+    assert records.dtype["PRISM_01"] == np.float64 and records.dtype["PRISM_02"] == np.float64
+    assert records["GID"].tolist() == ["7", "10012", "3"]
+    np.testing.assert_array_equal(records["PRISM_02"], [0.5, np.nan, 2.5])
+
+
+def test_records_of_no_basins_are_empty():
+    records = columns_to_records([], {"MEAN": []})
+    assert len(records) == 0
+    assert records.dtype["GID"] == np.dtype("<U1")
+
+
+def test_columns_are_aligned_on_the_union_of_gids_with_nan_for_missing():
+    gids, columns = align_columns({"A": ["3", "1"], "B": ["2", "3"], "C": []},
+                                  {"A": [30.0, 10.0], "B": [20.0, 31.0], "C": []})
+
+    assert gids == ["1", "2", "3"]
+    np.testing.assert_array_equal(columns["A"], [10.0, np.nan, 30.0])
+    np.testing.assert_array_equal(columns["B"], [np.nan, 20.0, 31.0])
+    assert np.isnan(columns["C"]).all()
+
+
+def test_summary_counts_missing_values(capsys):
+    summarize_columns("PRISM", ["1", "2"], {"A": np.array([1.0, np.nan]), "B": np.array([np.nan, np.nan])})
+
+    output = capsys.readouterr().out
+    assert output.splitlines()[0] == "PRISM: 2 basins x 2 columns"
+    assert "B: all missing" in output
+    assert "A: min 1" in output
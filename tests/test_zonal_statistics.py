@@ -0,0 +1,60 @@
+import numpy as np
+
+from ZonalStatistics import nlcd_category_percentages, zonal_class_histogram
+
+NODATA = 255
+
+
+def overlapping_zones():
+    """Two stacked layers: basin 1 covers the top half, basin 2 the left half, basin 3 nothing."""
+    layers = np.zeros((2, 4, 4), dtype=np.int32)
+    layers[0, :2, :] = 1
+    layers[1, :, :2] = 2
+    return layers
+
+
+def test_histogram_counts_overlapping_zones_and_skips_nodata():
+    values = np.array([[11, 11, 41, 41],
+                       [21, NODATA, 41, 82],
+                       [11, 21, 82, 82],
+                       [NODATA, 95, 82, 82]], dtype=np.uint8)
+    counts = zonal_class_histogram(values, overlapping_zones(), 3, nodata=NODATA)
+
+    assert counts.shape == (3, 256)
+    # Basin 1: top two rows less one NoData cell
+    assert counts[0].sum() == 7
+    assert counts[0, 11] == 2 and counts[0, 41] == 3 and counts[0, 21] == 1 and counts[0, 82] == 1
+    # Basin 2: left two columns less the two NoData cells, sharing the top-left cells with basin 1
+    assert counts[1].sum() == 6
+    assert counts[1, 11] == 3 and counts[1, 21] == 2 and counts[1, 95] == 1
+    assert counts[1, NODATA] == 0
+    # Basin 3 has no pixels
+    assert counts[2].sum() == 0
+
+
+def test_histogram_accumulates_block_by_block():
+    rng = np.random.default_rng(0)
+    values = rng.choice([11, 21, 41, 82, 95, NODATA], size=(6, 8)).astype(np.uint8)
+    zones = rng.integers(0, 4, size=(6, 8))
+
+    whole = zonal_class_histogram(values, zones, 3, nodata=NODATA)
+    blocks = None
+    for row0 in range(0, 6, 2):
+        blocks = zonal_class_histogram(values[row0:row0 + 2], zones[row0:row0 + 2], 3, nodata=NODATA, counts=blocks)
+    np.testing.assert_array_equal(blocks, whole)
+
+
+def test_category_percentages():
+    values = np.array([[11, 11, 41, 41],
+                       [21, NODATA, 41, 82],
+                       [11, 21, 82, 82],
+                       [NODATA, 95, 82, 82]], dtype=np.uint8)
+    columns = nlcd_category_percentages(zonal_class_histogram(values, overlapping_zones(), 3, nodata=NODATA))
+
+    np.testing.assert_allclose(columns["Water"], [200 / 7, 50, 0])
+    np.testing.assert_allclose(columns["Forest"], [300 / 7, 0, 0])
+    np.testing.assert_allclose(columns["Developed"], [100 / 7, 100 / 3, 0])
+    np.testing.assert_allclose(columns["Wetlands"], [0, 100 / 6, 0])
+    # Each basin with pixels adds up to 100 %, the empty basin is all zeros
+    total = sum(columns.values())
+    np.testing.assert_allclose(total, [100, 100, 0])